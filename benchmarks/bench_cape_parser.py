@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+
+"""
+Benchmark of the number-stream half of :func:`triton_scraper.cape.parse_detailed_tree`:
+the cursor-based parser versus the list-based one it replaced, which converted every number up front
+and then consumed the list from the front (``pop(0)``/``del l[:n]``), making each page quadratic in its number of fields.
+
+Both parsers walk the numbers of the captured CAPE page in :file:`benchmarks/fixtures/cape_detail.html`
+(optionally repeated, to simulate bigger pages), and must agree on the results.
+Results are written as JSON, like those of :file:`bench_parsers.py`.
+
+Usage: ``python bench_cape_parser.py [-n ITERATIONS] [-r REPEATS] [-o OUTPUT.json]``
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+import sys
+import json
+import platform
+from optparse import OptionParser
+from timeit import default_timer
+
+from bench_parsers import load_fixture, run_benchmark, _parse_cape_page, _cape_page_rows
+from triton_scraper import cape
+
+FIXTURE = 'cape_detail.html'
+DEFAULT_ITERATIONS = 2000
+DEFAULT_REPEATS = 1
+
+### The list-based parser, as it was before the cursor
+def _slice_off(l, n):
+    if n == 1:
+        return l.pop(0)
+    sliced = l[:n]
+    del l[:n]
+    return sliced
+
+def _legacy_counts(l, num_fields):
+    counts = _slice_off(l, num_fields)
+    if _slice_off(l, 1):
+        _slice_off(l, num_fields)
+    return counts
+
+def _legacy_agree_disagree_row(l):
+    responses = _slice_off(l, cape.NUM_AGREEMENT_LEVELS)
+    if _slice_off(l, 1):
+        _slice_off(l, 2)
+        _slice_off(l, cape.NUM_AGREEMENT_LEVELS-1)
+    return responses
+
+def _legacy_skip_instructor_questions(l):
+    for i in range(cape.NUM_INSTRUCTOR_QUESTIONS):
+        full = isinstance(l[cape.INDEX_OF_FIRST_PERCENTAGE_IN_FULL_INSTRUCTOR_QUESTION], cape.Decimal)
+        _slice_off(l, cape.NUM_FIELDS_PER_FULL_INSTRUCTOR_QUESTION if full else cape.NUM_FIELDS_PER_BLANK_INSTRUCTOR_QUESTION)
+
+def _legacy_study_hours(l):
+    hours = _slice_off(l, cape.NUM_STUDY_HOURS_INTERVALS)
+    if _slice_off(l, 1):
+        _slice_off(l, 1)
+        _slice_off(l, cape.NUM_STUDY_HOURS_INTERVALS)
+    return hours
+
+def _legacy_recommendations(l):
+    rec_level = _slice_off(l, 2)
+    _slice_off(l, 1)
+    _slice_off(l, 2)
+    return rec_level
+
+def _legacy_page(l, num_agreement_qs, taught_by_team):
+    results = [
+        _legacy_counts(l, cape.NUM_CLASS_LEVELS),
+        _legacy_counts(l, cape.NUM_REASONS_FOR_TAKING),
+        _legacy_counts(l, cape.NUM_POSSIBLE_GRADES),
+    ]
+    results.extend(_legacy_agree_disagree_row(l) for i in range(num_agreement_qs))
+    _legacy_skip_instructor_questions(l)
+    results.append(_legacy_study_hours(l))
+    results.append(_legacy_counts(l, cape.NUM_ATTENDANCE_TYPES))
+    results.append(_legacy_recommendations(l))
+    if not taught_by_team:
+        results.append(_legacy_recommendations(l))
+    return results
+
+def legacy_parse(strings, num_agreement_qs, taught_by_team, repeats):
+    l = [cape.string2num(s) for s in strings]
+    return [_legacy_page(l, num_agreement_qs, taught_by_team) for i in xrange(repeats)]
+
+### The cursor-based parser
+def _cursor_page(nums, num_agreement_qs, taught_by_team):
+    results = [
+        list(cape.parse_class_levels(nums)),
+        list(cape.parse_reasons_for_taking(nums)),
+        list(cape.parse_expected_grades(nums)),
+    ]
+    results.extend(list(cape.parse_agree_disagree_row(nums)) for i in range(num_agreement_qs))
+    cape.skip_instructor_questions(nums)
+    results.append(list(cape.parse_study_hours(nums)))
+    results.append(list(cape.parse_attendance(nums)))
+    results.append(list(cape.parse_recommendations(nums)))
+    if not taught_by_team:
+        results.append(list(cape.parse_recommendations(nums)))
+    return results
+
+def cursor_parse(strings, num_agreement_qs, taught_by_team, repeats):
+    nums = cape._NumberCursor(strings)
+    return [_cursor_page(nums, num_agreement_qs, taught_by_team) for i in xrange(repeats)]
+
+### Harness
+def _page_numbers(tree):
+    """The nonblank number strings on a CAPE page, and the shape of its agree/disagree section."""
+    strings = [s for s in (u.strip() for u in cape.numbers(tree)) if s]
+    taught_by_team = bool(cape.team_taught(tree))
+    num_agreement_qs = 6 if taught_by_team else cape.NUM_AGREEMENT_QUESTIONS
+    return strings, num_agreement_qs, taught_by_team
+
+def _time(parse, args, iterations):
+    start = default_timer()
+    for i in xrange(iterations):
+        parse(*args)
+    return default_timer() - start
+
+def run_all(iterations, repeats):
+    strings, num_agreement_qs, taught_by_team = _page_numbers(load_fixture(FIXTURE))
+    args = (strings * repeats, num_agreement_qs, taught_by_team, repeats)
+    if legacy_parse(*args) != cursor_parse(*args):
+        raise AssertionError, "The cursor-based and list-based CAPE parsers disagree about %s" % FIXTURE
+    numbers_per_run = len(strings) * repeats
+    results = {}
+    for name, parse in (("list", legacy_parse), ("cursor", cursor_parse)):
+        elapsed = _time(parse, args, iterations)
+        results[name] = {
+            'runs': iterations,
+            'numbers': numbers_per_run * iterations,
+            'seconds': elapsed,
+            'numbers_per_sec': numbers_per_run * iterations / elapsed,
+        }
+    results['speedup'] = results['list']['seconds'] / results['cursor']['seconds']
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'fixture': FIXTURE,
+        'repeats': repeats,
+        'numbers_per_page': len(strings),
+        'number_parsers': results,
+        'parse_detailed_tree': run_benchmark(_parse_cape_page, FIXTURE, _cape_page_rows, max(1, iterations // 10)),
+    }
+
+def main():
+    parser = OptionParser(usage="%prog [-n ITERATIONS] [-r REPEATS] [-o OUTPUT.json]")
+    parser.add_option("-n", "--iterations", type="int", default=DEFAULT_ITERATIONS, help="number of times to parse the numbers [default: %default]")
+    parser.add_option("-r", "--repeats", type="int", default=DEFAULT_REPEATS, help="number of copies of the page's numbers to parse per run [default: %default]")
+    parser.add_option("-o", "--output", default=None, help="file to write JSON results to [default: stdout]")
+    options, _args = parser.parse_args()
+    results = run_all(options.iterations, options.repeats)
+    if options.output is None:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Measures how many bytes the object model takes per :class:`triton_scraper.datatypes.CourseInstance` for a full term.
+
+A term's worth of course instances is built by parsing the captured TritonLink results page repeatedly;
+the size of everything reachable from them is then totalled with :func:`sys.getsizeof`, counting shared objects once.
+Results are written as JSON, like those of :file:`bench_parsers.py`.
+
+Usage: ``python bench_memory.py [-c COURSES] [-o OUTPUT.json]``
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+import sys
+import json
+import platform
+from optparse import OptionParser
+from types import ModuleType, FunctionType
+
+from bench_parsers import load_fixture, _parse_results_page
+
+#: Roughly the number of course instances offered during a regular quarter
+DEFAULT_COURSES = 4000
+_CONTAINERS = (list, tuple, set, frozenset)
+_SKIPPED = (type, ModuleType, FunctionType)
+
+def _slot_names(klass):
+    for base in klass.__mro__:
+        slots = base.__dict__.get('__slots__', ())
+        if isinstance(slots, basestring):
+            slots = (slots,)
+        for name in slots:
+            if name.startswith('__') and not name.endswith('__'): # private name mangling
+                name = "_%s%s" % (base.__name__.lstrip('_'), name)
+            yield name
+
+def _referents(obj):
+    if isinstance(obj, dict):
+        for pair in obj.iteritems():
+            for item in pair:
+                yield item
+    elif isinstance(obj, _CONTAINERS):
+        for item in obj:
+            yield item
+    else:
+        instance_dict = getattr(obj, '__dict__', None)
+        if instance_dict is not None:
+            yield instance_dict
+        for name in _slot_names(type(obj)):
+            try:
+                yield getattr(obj, name)
+            except AttributeError: # unset slot
+                pass
+
+def deep_sizeof(roots):
+    """Total size in bytes of *roots* and everything reachable from them, with each object counted once."""
+    seen = set()
+    total = 0
+    stack = list(roots)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _SKIPPED):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        stack.extend(_referents(obj))
+    return total
+
+def full_term(num_courses):
+    """Parses the captured results page enough times to get *num_courses* course instances."""
+    courses = []
+    while len(courses) < num_courses:
+        page_courses, _next_url = _parse_results_page(load_fixture('tritonlink_results.html'))
+        courses.extend(page_courses)
+    return courses[:num_courses]
+
+def measure(num_courses):
+    courses = full_term(num_courses)
+    meetings = sum(len(meeting_list) for course in courses for meeting_list in course._code2meeting_list.values())
+    total_bytes = deep_sizeof(courses)
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'courses': len(courses),
+        'meetings': meetings,
+        'total_bytes': total_bytes,
+        'bytes_per_course': total_bytes / float(len(courses)),
+    }
+
+def main():
+    parser = OptionParser(usage="%prog [-c COURSES] [-o OUTPUT.json]")
+    parser.add_option("-c", "--courses", type="int", default=DEFAULT_COURSES, help="number of course instances in the simulated term [default: %default]")
+    parser.add_option("-o", "--output", default=None, help="file to write JSON results to [default: stdout]")
+    options, _args = parser.parse_args()
+    results = measure(options.courses)
+    if options.output is None:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Micro-benchmarks for TritonScraper's HTML parsers, run over the captured pages in :file:`benchmarks/fixtures/`.
+
+Each benchmark reports pages/sec, rows/sec, and the number of objects left allocated by a single parse.
+Results are written as JSON so that runs from different versions can be compared.
+
+Usage: ``python bench_parsers.py [-n ITERATIONS] [-o OUTPUT.json]``
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+import sys
+import gc
+import json
+import platform
+from os.path import dirname, abspath, join as pathjoin
+from optparse import OptionParser
+from timeit import default_timer
+
+BENCHMARKS_DIR = dirname(abspath(__file__))
+sys.path.insert(0, pathjoin(dirname(BENCHMARKS_DIR), 'src'))
+
+from triton_scraper.fetchparse import _parse_html
+from triton_scraper.course_results_parsing import course_instances_from, rows_in_table, courses_like_tables
+from triton_scraper import cape, bookstore, locations, restriction_codes
+
+#: Directory holding the captured HTML pages
+FIXTURES_DIR = pathjoin(BENCHMARKS_DIR, 'fixtures')
+DEFAULT_ITERATIONS = 200
+
+def load_fixture(filename):
+    """Parses the captured page *filename* the same way :func:`triton_scraper.fetchparse.make_tree4url` would."""
+    with open(pathjoin(FIXTURES_DIR, filename), 'rb') as f:
+        return _parse_html(f, hack_around_broken_html=True)
+
+def seed_reference_tables():
+    """Loads the building and restriction code tables from their captured pages, so that parsing schedule pages
+    never fetches them from the web (which would make the benchmarks depend on the network, and skew their first timings)."""
+    locations._BUILDINGS.load_from(load_fixture('bldg_codes.html'))
+    restriction_codes._CODE2DESCRIPTION.load_from(load_fixture('rstr_codes.html'))
+seed_reference_tables()
+
+def _count_allocations(parse, tree):
+    """Number of garbage-collected objects still alive after one call to *parse*.
+    (Python 2 has no :mod:`tracemalloc`, so this is our allocation proxy.)"""
+    gc.collect()
+    gc.disable()
+    try:
+        before = len(gc.get_objects())
+        result = parse(tree)
+        after = len(gc.get_objects())
+    finally:
+        gc.enable()
+    del result
+    return after - before
+
+def run_benchmark(parse, fixture, count_rows, iterations):
+    """Times *parse* over *iterations* fresh copies of the element tree of *fixture*.
+    Tree construction is excluded from the timing since some parsers mutate the tree.
+
+    :returns: benchmark statistics
+    :rtype: dict
+    """
+    rows_per_page = count_rows(load_fixture(fixture))
+    elapsed = 0.0
+    for i in xrange(iterations):
+        tree = load_fixture(fixture)
+        start = default_timer()
+        parse(tree)
+        elapsed += default_timer() - start
+    return {
+        'fixture': fixture,
+        'pages': iterations,
+        'rows': rows_per_page * iterations,
+        'seconds': elapsed,
+        'pages_per_sec': iterations / elapsed,
+        'rows_per_sec': rows_per_page * iterations / elapsed,
+        'allocated_objects': _count_allocations(parse, load_fixture(fixture)),
+    }
+
+### Benchmarked parsers
+class _Discard(object):
+    def write(self, _string):
+        pass
+
+def _parse_results_page(tree):
+    # course_instances_from() prints progress to stdout; keep it from skewing the timings
+    stdout = sys.stdout
+    sys.stdout = _Discard()
+    try:
+        return course_instances_from(tree, "CSE")
+    finally:
+        sys.stdout = stdout
+
+def _results_page_rows(tree):
+    return len(rows_in_table(courses_like_tables(tree)[0]))
+
+def _parse_cape_page(tree):
+    return cape.parse_detailed_tree(tree, pathjoin(FIXTURES_DIR, 'cape_detail.html'))
+
+def _cape_page_rows(tree):
+    return len(cape.numbers(tree))
+
+BOOKSTORE_CELLS_PER_BOOK = 6
+def _booklist_rows(tree):
+    return len(bookstore.book_cells(tree)) // BOOKSTORE_CELLS_PER_BOOK
+
+def _building_rows(tree):
+    return len(locations.buildings_from(tree))
+
+def _restriction_rows(tree):
+    return len(restriction_codes.code2description_from(tree))
+
+#: (benchmark name, parser, fixture filename, row counter)
+BENCHMARKS = [
+    ("course_instances_from", _parse_results_page, 'tritonlink_results.html', _results_page_rows),
+    ("cape.parse_detailed_page", _parse_cape_page, 'cape_detail.html', _cape_page_rows),
+    ("bookstore.booklist_from", bookstore.booklist_from, 'booklist.html', _booklist_rows),
+    ("locations.buildings_from", locations.buildings_from, 'bldg_codes.html', _building_rows),
+    ("restriction_codes.code2description_from", restriction_codes.code2description_from, 'rstr_codes.html', _restriction_rows),
+]
+
+def run_all(iterations):
+    results = {}
+    for name, parse, fixture, count_rows in BENCHMARKS:
+        results[name] = run_benchmark(parse, fixture, count_rows, iterations)
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'iterations': iterations,
+        'benchmarks': results,
+    }
+
+def main():
+    parser = OptionParser(usage="%prog [-n ITERATIONS] [-o OUTPUT.json]")
+    parser.add_option("-n", "--iterations", type="int", default=DEFAULT_ITERATIONS, help="number of pages to parse per benchmark [default: %default]")
+    parser.add_option("-o", "--output", default=None, help="file to write JSON results to [default: stdout]")
+    options, _args = parser.parse_args()
+    results = run_all(options.iterations)
+    if options.output is None:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
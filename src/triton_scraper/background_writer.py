@@ -0,0 +1,231 @@
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module writes scraped records into an `SQLite <http://www.sqlite.org/>`_ database from a dedicated thread,
+so that a crawl's fetching and parsing don't wait on disk I/O and commits.
+
+Records are handed over through a bounded queue; when the writer falls behind, producers block until there's room.
+:class:`CourseInstance`-s go into the tables of :mod:`schedule_sql` and :class:`CourseAndProfessorEvaluation`-s into those of :mod:`sql`,
+in batches of :const:`config.SQLITE_BATCH_SIZE` records per transaction.
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+from sqlite3 import connect as _sqlite_connect
+from threading import Thread as _Thread, Event as _Event
+from time import time as _time
+from Queue import Queue as _Queue, Empty as _Empty
+
+from triton_scraper import config as _config
+from triton_scraper.util import LOGGER as _LOGGER
+from triton_scraper.datatypes import CourseInstance as _CourseInstance
+from triton_scraper.cape import CourseAndProfessorEvaluation as _CourseAndProfessorEvaluation
+from triton_scraper.sql import CapeWriter as _CapeWriter, create_cape_tables as _create_cape_tables, configure as _configure, CAPE_TABLE_NAME as _CAPE_TABLE_NAME, has_table as _has_table, stored_section_ids as _stored_section_ids
+from triton_scraper.schedule_sql import ScheduleWriter as _ScheduleWriter, create_schedule_tables as _create_schedule_tables, COURSE_TABLE_NAME as _COURSE_TABLE_NAME
+
+class _Flush(object):
+    """Queue marker asking the writer thread to commit everything it has buffered."""
+    __slots__ = ('done',)
+    def __init__(self):
+        self.done = _Event()
+
+_STOP = object() # Queue marker telling the writer thread to flush and exit
+
+class BackgroundWriter(object):
+    """Writes :class:`CourseInstance`-s and :class:`CourseAndProfessorEvaluation`-s into an SQLite database file from its own thread.
+    Missing tables are created; rows already in the database are kept.
+    CAPEs whose Section ID is already stored are skipped. Course instances are always added, so writing a term that's already stored
+    duplicates it; use :func:`schedule_sql.load_term_into_db` to replace a term instead.
+
+    Use as a context manager, or call :meth:`close` when done, so that the last partial batch gets committed.
+    If writing fails, the error is re-raised by the next :meth:`put`, :meth:`flush`, or :meth:`close`, and later records are discarded."""
+    def __init__(self, filepath, term_code=None, batch_size=_config.SQLITE_BATCH_SIZE, queue_size=_config.SQLITE_QUEUE_SIZE, flush_interval=_config.SQLITE_FLUSH_INTERVAL, journal_mode=None, synchronous=None):
+        """
+        :param filepath: path to the SQLite database file, which is created if it doesn't exist
+        :type filepath: string
+        :param term_code: term of the course instances to be written (e.g. "FA10"); only needed if any will be.
+            They're added to whatever is already stored for the term.
+        :type term_code: string or None
+        :param batch_size: number of records of each kind per transaction
+        :type batch_size: int
+        :param queue_size: maximum number of records waiting to be written before :meth:`put` blocks
+        :type queue_size: int
+        :param flush_interval: how old (in seconds) the oldest record of a partial batch may get before the batch is committed anyway
+        :type flush_interval: float
+        :param journal_mode: see :func:`sql.configure`
+        :type journal_mode: string or None
+        :param synchronous: see :func:`sql.configure`
+        :type synchronous: string or None
+        """
+        self.filepath = filepath
+        self.term_code = term_code
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._pragmas = (journal_mode, synchronous)
+        self._queue = _Queue(maxsize=queue_size)
+        self._error = None
+        self._closed = False
+        #: Number of records written and committed so far
+        #:
+        #: :type: int
+        self.written = 0
+        self._thread = _Thread(target=self._run, name="SQLite writer for %s" % filepath)
+        self._thread.daemon = True
+        self._thread.start()
+
+    ### Producer side
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def put(self, record):
+        """Queues *record* for writing, blocking while the queue is full.
+
+        :type record: :class:`CourseInstance` or :class:`CourseAndProfessorEvaluation`
+        :raises: :exc:`ValueError` if the writer is closed, or for a course instance when no term code was given; whatever error writing ran into
+        """
+        if self._closed:
+            raise ValueError, "Can't write to a closed BackgroundWriter"
+        if isinstance(record, _CourseInstance):
+            if self.term_code is None:
+                raise ValueError, "BackgroundWriter needs a term code to write course instances"
+        elif not isinstance(record, _CourseAndProfessorEvaluation):
+            raise TypeError, "Can't write %s to a database" % repr(record)
+        self._check()
+        self._queue.put(record)
+
+    def put_all(self, records):
+        """Queues each of *records* for writing as it's produced.
+
+        :type records: iterable
+        :returns: number of records queued
+        :rtype: int
+        """
+        count = 0
+        for record in records:
+            self.put(record)
+            count += 1
+        return count
+
+    def flush(self):
+        """Blocks until every record queued so far has been written and committed."""
+        self._check()
+        if not self._closed:
+            marker = _Flush()
+            self._queue.put(marker)
+            while not marker.done.is_set() and self._thread.is_alive(): # the thread stops without answering if writing fails meanwhile
+                marker.done.wait(self._flush_interval)
+        self._check()
+
+    def close(self):
+        """Writes and commits every queued record, then stops the writer thread. Safe to call more than once."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    ### Writer thread
+    def _open(self):
+        conn = _sqlite_connect(self.filepath) # connections can't be shared between threads, so the writer thread opens its own
+        _configure(conn, *self._pragmas)
+        with conn:
+            if not _has_table(conn, _CAPE_TABLE_NAME):
+                _create_cape_tables(conn)
+            if self.term_code is not None and not _has_table(conn, _COURSE_TABLE_NAME):
+                _create_schedule_tables(conn)
+        writers = [_CapeWriter(conn, self._batch_size)]
+        if self.term_code is not None:
+            writers.append(_ScheduleWriter(conn, self.term_code, self._batch_size))
+        return conn, writers
+
+    def _flush_writers(self, writers):
+        for writer in writers:
+            writer.flush()
+        self.written = sum(writer.written for writer in writers)
+
+    def _run(self):
+        conn = None
+        writers = []
+        stopping = False
+        try:
+            conn, writers = self._open()
+            cape_writer = writers[0]
+            schedule_writer = writers[-1]
+            known_section_ids = _stored_section_ids(conn)
+            deadline = None # when the oldest buffered record has to be committed by
+            while True:
+                try:
+                    item = self._queue.get() if deadline is None else self._queue.get(timeout=max(deadline - _time(), 0))
+                except _Empty:
+                    item = None
+                if item is _STOP:
+                    stopping = True
+                    self._flush_writers(writers)
+                    return
+                if isinstance(item, _Flush):
+                    try:
+                        self._flush_writers(writers)
+                    except Exception as exc:
+                        self._error = exc # before waking the flusher, so that it sees the error
+                        item.done.set()
+                        raise
+                    item.done.set()
+                    deadline = None
+                    continue
+                if isinstance(item, _CourseInstance):
+                    schedule_writer.write(item)
+                elif item is not None and item.section_id not in known_section_ids:
+                    cape_writer.write(item)
+                    known_section_ids.add(item.section_id)
+                self.written = sum(writer.written for writer in writers)
+                if not any(writer.pending for writer in writers): # a full batch was just committed
+                    deadline = None
+                elif deadline is None:
+                    deadline = _time() + self._flush_interval
+                elif _time() >= deadline: # even if records keep coming, don't sit on a partial batch
+                    self._flush_writers(writers)
+                    deadline = None
+        except Exception as exc:
+            _LOGGER.error("Writing to %s failed: %s", self.filepath, exc)
+            self._error = exc
+            if not stopping:
+                self._drain()
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _drain(self):
+        """Discards queued records after a failure, and wakes any waiting flushers. Producers will see the error instead of queueing more."""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except _Empty:
+                return
+            if isinstance(item, _Flush):
+                item.done.set()
@@ -26,8 +26,12 @@ This module parses course textbook information from the `UCSD Bookstore's websit
 """
 
 from decimal import Decimal
+from threading import Lock as _Lock
+from time import time as _time
+from urllib import urlencode as _urlencode
+from urlparse import urlsplit as _urlsplit, urlunsplit as _urlunsplit, parse_qsl as _parse_qsl
 
-from triton_scraper.fetchparse import make_tree4url
+from triton_scraper.fetchparse import make_tree4url, fetch_trees as _fetch_trees
 from triton_scraper.util import *
 from triton_scraper import config
 
@@ -116,15 +120,187 @@ def _skipping_availability_side_headers(cells):
     for cell in cells:
         if cell.text:
             yield cell
-def books_on(bookstore_url_from_tritonlink):
+def normalize_bookstore_url(url):
+    """Canonical form of a UCSD Bookstore URL, so that URLs for the same page compare equal.
+    Uses plain HTTP (the Bookstore's HTTPS pages aren't needed), lowercases the scheme and host, sorts the query parameters, and drops any fragment.
+    
+    :type url: string
+    :rtype: string
+    """
+    scheme, netloc, path, query, _fragment = _urlsplit(url)
+    scheme = scheme.lower()
+    if scheme == "https":
+        scheme = "http"
+    query = _urlencode(sorted(_parse_qsl(query, keep_blank_values=True)))
+    return _urlunsplit((scheme, netloc.lower(), path, query, ''))
+
+class _Link(object):
+    """Entry in a :class:`BooklistCache`'s recency list."""
+    __slots__ = ('prev', 'next', 'key', 'booklist', 'expires')
+
+class BooklistCache(object):
+    """Thread-safe cache of :class:`BookList`-s keyed by normalized Bookstore URL (see :func:`normalize_bookstore_url`).
+    Entries expire after a time-to-live, and the least recently used entry is evicted when the cache is full."""
+    def __init__(self, max_entries=config.BOOKLIST_CACHE_SIZE, ttl=config.BOOKLIST_CACHE_TTL):
+        """
+        :param max_entries: maximum number of booklists to hold
+        :type max_entries: int
+        :param ttl: how long (in seconds) a cached booklist remains valid
+        :type ttl: float
+        """
+        if max_entries < 1:
+            raise ValueError, "Cache must be able to hold at least 1 entry"
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = _Lock()
+        self._key2link = {}
+        self._root = _Link() # sentinel of circular doubly-linked list; most recently used first
+        self._root.prev = self._root.next = self._root
+    
+    def _unlink(self, link):
+        link.prev.next = link.next
+        link.next.prev = link.prev
+    
+    def _push_front(self, link):
+        root = self._root
+        link.prev = root
+        link.next = root.next
+        root.next.prev = link
+        root.next = link
+    
+    def get(self, url):
+        """The cached booklist for the Bookstore page at *url*, or None if there isn't a valid one.
+        
+        :type url: string
+        :rtype: :class:`BookList` or None
+        """
+        key = normalize_bookstore_url(url)
+        with self._lock:
+            link = self._key2link.get(key)
+            if link is None:
+                return None
+            self._unlink(link)
+            if link.expires <= _time():
+                del self._key2link[key]
+                return None
+            self._push_front(link)
+            return link.booklist
+    
+    def put(self, url, booklist):
+        """Caches *booklist* as the booklist on the Bookstore page at *url*.
+        
+        :type url: string
+        :type booklist: :class:`BookList`
+        """
+        key = normalize_bookstore_url(url)
+        with self._lock:
+            link = self._key2link.get(key)
+            if link is None:
+                link = self._key2link[key] = _Link()
+                link.key = key
+            else:
+                self._unlink(link)
+            link.booklist = booklist
+            link.expires = _time() + self.ttl
+            self._push_front(link)
+            if len(self._key2link) > self.max_entries:
+                oldest = self._root.prev
+                self._unlink(oldest)
+                del self._key2link[oldest.key]
+    
+    def discard(self, url):
+        """Removes any cached booklist for the Bookstore page at *url*.
+        
+        :type url: string
+        """
+        with self._lock:
+            link = self._key2link.pop(normalize_bookstore_url(url), None)
+            if link is not None:
+                self._unlink(link)
+    
+    def clear(self):
+        """Empties the cache."""
+        with self._lock:
+            self._key2link.clear()
+            self._root.prev = self._root.next = self._root
+    
+    def __len__(self):
+        return len(self._key2link)
+
+#: Booklist cache shared by :func:`books_on` and therefore by every :attr:`SeatedMeeting.booklist`
+BOOKLIST_CACHE = BooklistCache()
+_tree4url = make_tree4url()
+
+def books_on(bookstore_url_from_tritonlink, use_cache=True):
     """Returns book list based on the given course page at the UCSD Bookstore's website.
+    Booklists are cached in :data:`BOOKLIST_CACHE`, so sections sharing a Bookstore page only cause one request for it.
     
     :param bookstore_url_from_tritonlink: UCSD Bookstore website URL for a course section
     :type bookstore_url_from_tritonlink: string
+    :param use_cache: use and update :data:`BOOKLIST_CACHE`?
+    :type use_cache: bool
+    :rtype: :class:`BookList`
+    """
+    if use_cache:
+        booklist = BOOKLIST_CACHE.get(bookstore_url_from_tritonlink)
+        if booklist is not None:
+            return booklist
+    tree, _url = _tree4url(normalize_bookstore_url(bookstore_url_from_tritonlink))
+    booklist = booklist_from(tree)
+    if use_cache:
+        BOOKLIST_CACHE.put(bookstore_url_from_tritonlink, booklist)
+    return booklist
+
+def prefetch_booklists(meetings, num_workers=config.FETCH_WORKERS, max_requests_per_second=config.MAX_REQUESTS_PER_SECOND, refresh=False):
+    """Fetches the booklists of many seated meetings concurrently and attaches them to the meetings.
+    Each distinct Bookstore page is only fetched once, no matter how many meetings share it.
+    Afterwards, each meeting's :attr:`SeatedMeeting.booklist` is the attached booklist, so it never needs
+    another request regardless of what :data:`BOOKLIST_CACHE` has since evicted.
+    Fetched booklists are also put into :data:`BOOKLIST_CACHE` for the benefit of other meetings sharing their pages.
+    
+    :param meetings: meetings whose booklists to fetch; e.g. every seated meeting in a term
+    :type meetings: iterable of :class:`SeatedMeeting`-s
+    :param num_workers: number of concurrent fetches
+    :type num_workers: int
+    :param max_requests_per_second: overall request rate limit; None or 0 for no limit
+    :type max_requests_per_second: float or None
+    :param refresh: refetch booklists which are already cached or attached?
+    :type refresh: bool
+    :returns: booklist for each normalized Bookstore URL (see :func:`normalize_bookstore_url`)
+    :rtype: dict of strings to :class:`BookList`-s
+    """
+    url2booklist = {}
+    url2meetings = {}
+    to_fetch = []
+    for meeting in meetings:
+        url = meeting._bookstore_url
+        if url is None:
+            continue
+        url = normalize_bookstore_url(url)
+        if url in url2meetings:
+            url2meetings[url].append(meeting)
+            continue
+        url2meetings[url] = [meeting]
+        booklist = None if refresh else (getattr(meeting, '_booklist', None) or BOOKLIST_CACHE.get(url))
+        url2booklist[url] = booklist
+        if booklist is None:
+            to_fetch.append(url)
+    LOGGER.info("Prefetching %d booklists (%d already cached)", len(to_fetch), len(url2booklist) - len(to_fetch))
+    for url, tree in _fetch_trees(to_fetch, num_workers, max_requests_per_second):
+        booklist = url2booklist[url] = booklist_from(tree)
+        BOOKLIST_CACHE.put(url, booklist)
+    for url, booklist in url2booklist.iteritems():
+        for meeting in url2meetings[url]:
+            meeting._booklist = booklist
+    return url2booklist
+
+def booklist_from(tree):
+    """Parses a course page from the UCSD Bookstore's website into a book list.
+    
+    :param tree: HTML element tree of a UCSD Bookstore course page
+    :type tree: :class:`lxml.etree.ElementTree`
     :rtype: :class:`BookList`
     """
-    url = bookstore_url_from_tritonlink.replace("https", "http", 1)
-    tree, _url = make_tree4url()(url)
     booklist = BookList()
     for sextuple in grouper(6, _skipping_availability_side_headers(book_cells(tree))):
         if config.LACK_BOOK_LIST in sextuple[0].text:# No book list
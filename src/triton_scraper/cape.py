@@ -29,12 +29,15 @@ from contextlib import closing as _closing
 from time import sleep as _sleep
 from decimal import Decimal
 from collections import namedtuple as _namedtuple#, OrderedDict
-from urlparse import urljoin as _urljoin
+from urlparse import urljoin as _urljoin, urlparse as _urlparse, parse_qsl as _parse_qsl
 from urllib import urlencode as _urlencode
+from threading import Lock as _Lock
+from hashlib import md5 as _md5
+from struct import unpack as _unpack
 
 import triton_scraper.config
-from triton_scraper.util import RELATIVE_PREFIX, XPath
-from triton_scraper.fetchparse import make_tree4url
+from triton_scraper.util import RELATIVE_PREFIX, XPath, LOGGER
+from triton_scraper.fetchparse import make_tree4url, fetch_trees as _fetch_trees, RateLimiter as _RateLimiter
 from lxml import etree
 
 CAPE_SEARCH_URL = "http://www.cape.ucsd.edu/stats.html"
@@ -49,11 +52,17 @@ def url2tree(url):
 
 search_forms = XPath(RELATIVE_PREFIX+"/form[@name='searchQuery']")
 select_elements = XPath(RELATIVE_PREFIX+"/select")
+_search_form_cache = []
+_search_form_lock = _Lock()
 def _search_form_and_select_tag():
-    tree = url2tree(CAPE_SEARCH_URL)
-    form = search_forms(tree)[0]
-    select = select_elements(form)[0]
-    return form, select
+    """The CAPE search form and its department <select>. Only fetched the first time it's needed."""
+    with _search_form_lock:
+        if not _search_form_cache:
+            tree = url2tree(CAPE_SEARCH_URL)
+            form = search_forms(tree)[0]
+            select = select_elements(form)[0]
+            _search_form_cache.append((form, select))
+        return _search_form_cache[0]
 
 VALUE = 'value'
 option_elements = XPath(RELATIVE_PREFIX+"/option")
@@ -71,7 +80,13 @@ def list_departments():
 NAME = 'name'
 ACTION = 'action'
 section_links = XPath(RELATIVE_PREFIX+"/a[@target='_new']/@href")
-def capes_for(department_form_val):
+def department_url(department_form_val):
+    """URL of the listing of a department's CAPEs.
+    
+    :param department_form_val: :attr:`Department.form_value` of the department
+    :type department_form_val: string
+    :rtype: string
+    """
     form, select = _search_form_and_select_tag()
     field_name = select.get(NAME)
     # method = form.get(HTTP_METHOD)
@@ -79,13 +94,109 @@ def capes_for(department_form_val):
         # raise ValueError("Expected GET form submission method; Got "+repr(method))
     action = form.get(ACTION)
     dest_url = _urljoin(CAPE_SEARCH_URL, action)
-    dept_url = "%s?%s" % (dest_url, _urlencode({field_name:department_form_val}))
-    tree = url2tree(dept_url)
-    for link in section_links(tree):
+    return "%s?%s" % (dest_url, _urlencode({field_name:department_form_val}))
+
+_SECTION_ID_PARAM = 'sectionid'
+def section_id_of(link):
+    """Section ID of the course instance a CAPE detail page link is for, taken from the link's ``sectionid`` query parameter.
+    
+    :param link: URL of a CAPE detail page, as listed on a department's CAPE listing
+    :type link: string
+    :returns: the Section ID, or None if the link doesn't include one (see :func:`url_section_id` for a stand-in)
+    :rtype: int or None
+    """
+    for name, value in _parse_qsl(_urlparse(link).query):
+        if name.lower() == _SECTION_ID_PARAM and value.isdigit():
+            return int(value)
+    return None
+
+def url_section_id(link):
+    """Stand-in Section ID for a CAPE detail page link which doesn't include a real one, derived from a hash of the link.
+    Stand-ins are negative, so they never collide with real Section IDs, and the same link always gets the same one,
+    so its CAPE can be recognized as already scraped.
+    
+    :param link: URL of a CAPE detail page
+    :type link: string
+    :rtype: int
+    """
+    high_bits, = _unpack('>Q', _md5(link.strip()).digest()[:8])
+    return -(high_bits >> 1) - 1
+
+def cape_key(link):
+    """Value of :attr:`CourseAndProfessorEvaluation.section_id` for the CAPE at a detail page link:
+    the link's Section ID (see :func:`section_id_of`) if it has one, otherwise its :func:`url_section_id`.
+    
+    :param link: URL of a CAPE detail page
+    :type link: string
+    :rtype: int
+    """
+    section_id = section_id_of(link)
+    return section_id if section_id is not None else url_section_id(link)
+
+def _new_links(links, known_section_ids):
+    if not known_section_ids:
+        return list(links)
+    return [link for link in links if cape_key(link) not in known_section_ids]
+
+def capes_for(department_form_val, known_section_ids=None):
+    """Fetches and parses the CAPEs of a department, one at a time.
+    
+    :param department_form_val: :attr:`Department.form_value` of the department
+    :type department_form_val: string
+    :param known_section_ids: :func:`cape_key`-s of the CAPEs which shouldn't be fetched (e.g. because they've already been scraped)
+    :type known_section_ids: set of ints
+    :rtype: generator of :class:`CourseAndProfessorEvaluation`-s
+    """
+    tree = url2tree(department_url(department_form_val))
+    for link in _new_links(section_links(tree), known_section_ids):
         cape = parse_detailed_page(link)
         if cape is not None:
             yield cape
 
+def crawl_capes(department_form_vals=None, num_workers=triton_scraper.config.FETCH_WORKERS, max_requests_per_second=triton_scraper.config.MAX_REQUESTS_PER_SECOND, known_section_ids=None):
+    """Concurrently fetches and parses the CAPEs of many departments.
+    All department listings are fetched first, and then every department's detail pages are fetched by one pool of worker threads,
+    so the pool stays busy across department boundaries; all requests share one rate limit.
+    CAPEs are produced as their pages finish downloading, so their order is arbitrary.
+    Each CAPE is only fetched and produced once, even if several departments list it.
+    Pages which fail to parse are logged and skipped.
+    
+    :param department_form_vals: :attr:`Department.form_value`-s of the departments to crawl; defaults to all of :func:`list_departments`
+    :type department_form_vals: iterable of strings
+    :param num_workers: number of concurrent fetches
+    :type num_workers: int
+    :param max_requests_per_second: overall request rate limit; None or 0 for no limit
+    :type max_requests_per_second: float or None
+    :param known_section_ids: :func:`cape_key`-s of the detail pages which shouldn't be fetched (e.g. because they've already been scraped)
+    :type known_section_ids: set of ints
+    :rtype: generator of :class:`CourseAndProfessorEvaluation`-s
+    """
+    if department_form_vals is None:
+        department_form_vals = [department.form_value for department in list_departments()]
+    limiter = _RateLimiter(max_requests_per_second)
+    department_urls = [department_url(form_val) for form_val in department_form_vals]
+    links = []
+    seen_keys = set() # CAPEs are often listed by more than one department
+    for url, department_tree in _fetch_trees(department_urls, num_workers, rate_limiter=limiter):
+        try:
+            department_links = _new_links(section_links(department_tree), known_section_ids)
+        except Exception as err:
+            LOGGER.error("Skipping CAPE department page %s which couldn't be parsed: %s", url, err)
+            continue
+        for link in department_links:
+            key = cape_key(link)
+            if key not in seen_keys:
+                seen_keys.add(key)
+                links.append(link)
+    for link, tree in _fetch_trees(links, num_workers, rate_limiter=limiter):
+        try:
+            cape = parse_detailed_tree(tree, link)
+        except Exception as err:
+            LOGGER.error("Skipping CAPE page %s which couldn't be parsed: %s", link, err)
+            continue
+        if cape is not None:
+            yield cape
+
 page_is_dud = XPath("/html/body[contains(text(), 'No statistics found')]")
 departments = XPath(RELATIVE_PREFIX+"/td[@width='110']/text()")
 enrollments = XPath(RELATIVE_PREFIX+"/td[@width='155']/text()")
@@ -95,7 +206,9 @@ course_codes = XPath(RELATIVE_PREFIX+"/td[@width='56']/text()")
 instructor_names = XPath(RELATIVE_PREFIX+"/td[@colspan='2' and @height='15']/text()")
 team_taught = XPath(RELATIVE_PREFIX+"/td[@colspan='9' and text()='Team Taught']")
 def parse_detailed_page(url):
-    tree = url2tree(url)
+    return parse_detailed_tree(url2tree(url), url)
+
+def parse_detailed_tree(tree, url):
     if page_is_dud(tree):
         return None
     department_code = departments(tree)[0].strip()
@@ -110,7 +223,7 @@ def parse_detailed_page(url):
     else:
         instructor = None # Some courses have no listed instructor
     
-    nums = [string2num(s) for s in (u.strip() for u in numbers(tree)) if s]
+    nums = _NumberCursor([s for s in (u.strip() for u in numbers(tree)) if s])
 
     class_levels = parse_class_levels(nums)
     reasons_for_taking = parse_reasons_for_taking(nums)
@@ -129,24 +242,23 @@ def parse_detailed_page(url):
         recommend_prof = parse_recommendations(nums)
     else:
         recommend_prof = RecommendLevel(0, 0)
-    cape = CourseAndProfessorEvaluation(-1,#FIXME
+    cape = CourseAndProfessorEvaluation(cape_key(url),
         department_code, term_code, subject_code, course_number, instructor, enrollment, respondents, class_levels, reasons_for_taking, expected_grades, hours_studying_per_week, attendance, recommend_course, recommend_prof, question2agreement)
-    if nums:
-        print cape
-        print nums
-        raise ValueError, "Problem when trying to parse %s %s %s (%s)" % (term_code, course_code, instructor, url)
+    if nums.remaining:
+        raise ValueError, "%d unexpected numbers left over when trying to parse %s %s %s %s (%s)" % (nums.remaining, term_code, subject_code, course_number, instructor, url)
     return cape
 
 AgreementLevels = _namedtuple('AgreementLevels', "na strong_disagree disagree neutral agree strong_agree")
 # FIXME: account for #responses != total #students
 #(None,) + range(-2,3)
 NUM_AGREEMENT_LEVELS = len(AgreementLevels._fields)
-def parse_agree_disagree_row(l):
-    responses = slice_off(l, NUM_AGREEMENT_LEVELS)
-    _num_resp = slice_off(l, 1)
+_AGREEMENT = "agreement question"
+def parse_agree_disagree_row(nums):
+    responses = nums.take(NUM_AGREEMENT_LEVELS, _AGREEMENT)
+    _num_resp = nums.take_one(_AGREEMENT)
     if _num_resp:# CAPE pages don't include stats if no non-N/A responses
-        _mean, _std_dev = slice_off(l, 2)
-        _percents = slice_off(l, NUM_AGREEMENT_LEVELS-1) # no percentage for N/A
+        nums.skip(2, _AGREEMENT) # mean, standard deviation
+        nums.skip(NUM_AGREEMENT_LEVELS-1, _AGREEMENT) # percents; no percentage for N/A
     return AgreementLevels(*responses)
 
 StudyHours = _namedtuple('StudyHours', "zero_one two_three four_five six_seven eight_nine ten_eleven twelve_thirteen fourteen_fifteen sixteen_seventeen eighteen_nineteen twenty_plus")
@@ -160,30 +272,33 @@ StudyHours = _namedtuple('StudyHours', "zero_one two_three four_five six_seven e
 # StudyHours.VALUES = tuple(_values)
 # del _values, _n, _i
 NUM_STUDY_HOURS_INTERVALS = 11
-def parse_study_hours(l):
-    hours = StudyHours(*slice_off(l, NUM_STUDY_HOURS_INTERVALS))
-    _num_resp = slice_off(l, 1)
+_STUDY_HOURS = "study hours"
+def parse_study_hours(nums):
+    hours = StudyHours(*nums.take(NUM_STUDY_HOURS_INTERVALS, _STUDY_HOURS))
+    _num_resp = nums.take_one(_STUDY_HOURS)
     if _num_resp:# CAPE pages don't include stats if no responses given
-        _avg_hours = slice_off(l, 1)
-        _percents = slice_off(l, NUM_STUDY_HOURS_INTERVALS)
+        nums.skip(1, _STUDY_HOURS) # average hours
+        nums.skip(NUM_STUDY_HOURS_INTERVALS, _STUDY_HOURS) # percents
     return hours
 
 Attendance = _namedtuple('Attendance', "rarely some most")
 # 0, 0.5, 1
 NUM_ATTENDANCE_TYPES = len(Attendance._fields)
-def parse_attendance(l):
-    attendance = Attendance(*slice_off(l, NUM_ATTENDANCE_TYPES))
-    _num_resp = slice_off(l, 1)
+_ATTENDANCE = "attendance"
+def parse_attendance(nums):
+    attendance = Attendance(*nums.take(NUM_ATTENDANCE_TYPES, _ATTENDANCE))
+    _num_resp = nums.take_one(_ATTENDANCE)
     if _num_resp:
-        _percents = slice_off(l, NUM_ATTENDANCE_TYPES)
+        nums.skip(NUM_ATTENDANCE_TYPES, _ATTENDANCE) # percents
     return attendance
 
 RecommendLevel = _namedtuple('RecommendLevel', "no yes")
 #False, True
-def parse_recommendations(l):
-    rec_level = RecommendLevel(*slice_off(l, 2))
-    _num_resp = slice_off(l, 1)
-    _percents = slice_off(l, 2)
+_RECOMMENDATION = "recommendation"
+def parse_recommendations(nums):
+    rec_level = RecommendLevel(*nums.take(2, _RECOMMENDATION))
+    nums.skip(1, _RECOMMENDATION) # number of responses
+    nums.skip(2, _RECOMMENDATION) # percents
     return rec_level
 
 
@@ -195,12 +310,48 @@ def string2num(string):
         return Decimal(string)
     else:
         return int(string)
-def slice_off(l, n):
-    if n == 1:
-        return l.pop(0)
-    sliced = l[:n]
-    del l[:n]
-    return sliced
+def _is_fractional(string):
+    """Would :func:`string2num` give a Decimal for *string*?"""
+    return string.endswith('%') or '.' in string
+
+class _NumberCursor(object):
+    """Walks through the numbers on a CAPE detail page in order, without copying or consuming the list of them.
+    Numbers are only converted (see :func:`string2num`) when they're actually used; skipped statistics are never converted.
+    Running out of numbers partway through a section raises :exc:`ValueError`."""
+    __slots__ = ('_strings', '_position')
+    def __init__(self, strings):
+        self._strings = strings
+        self._position = 0
+    
+    @property
+    def remaining(self):
+        """Number of numbers not yet read."""
+        return len(self._strings) - self._position
+    
+    def _advance(self, n, section):
+        start = self._position
+        if start + n > len(self._strings):
+            raise ValueError, "CAPE page ended partway through its %s section (wanted %d more numbers, only %d left)" % (section, n, self.remaining)
+        self._position = start + n
+        return start
+    
+    def take(self, n, section):
+        """The next *n* numbers of the given section."""
+        start = self._advance(n, section)
+        return [string2num(string) for string in self._strings[start:start+n]]
+    
+    def take_one(self, section):
+        """The next number of the given section."""
+        return string2num(self._strings[self._advance(1, section)])
+    
+    def skip(self, n, section):
+        """Skips the next *n* numbers of the given section."""
+        self._advance(n, section)
+    
+    def is_fractional_at(self, offset):
+        """Is the number *offset* numbers ahead a percentage or a decimal (as opposed to an integer count)? False if there's no such number."""
+        index = self._position + offset
+        return index < len(self._strings) and _is_fractional(self._strings[index])
 NUM_AGREEMENT_QUESTIONS = 16
 NUM_INSTRUCTOR_QUESTIONS = 5
 NUM_PRE_AGREEMENT_QUESTIONS = 4
@@ -210,43 +361,45 @@ NUM_INSTRUCTOR_QUESTIONS = 5
 NUM_FIELDS_PER_FULL_INSTRUCTOR_QUESTION = 15
 NUM_FIELDS_PER_BLANK_INSTRUCTOR_QUESTION = 7
 INDEX_OF_FIRST_PERCENTAGE_IN_FULL_INSTRUCTOR_QUESTION = 9
-def has_full_instructor_questions(l):
-    return isinstance(l[INDEX_OF_FIRST_PERCENTAGE_IN_FULL_INSTRUCTOR_QUESTION], Decimal)
-def skip_instructor_questions(l):
+def has_full_instructor_questions(nums):
+    return nums.is_fractional_at(INDEX_OF_FIRST_PERCENTAGE_IN_FULL_INSTRUCTOR_QUESTION)
+def skip_instructor_questions(nums):
     for i in range(NUM_INSTRUCTOR_QUESTIONS):
-        fields_per_question = NUM_FIELDS_PER_FULL_INSTRUCTOR_QUESTION if has_full_instructor_questions(l) else NUM_FIELDS_PER_BLANK_INSTRUCTOR_QUESTION
-        slice_off(l, fields_per_question)
+        fields_per_question = NUM_FIELDS_PER_FULL_INSTRUCTOR_QUESTION if has_full_instructor_questions(nums) else NUM_FIELDS_PER_BLANK_INSTRUCTOR_QUESTION
+        nums.skip(fields_per_question, "instructor question")
 
 ClassLevels = _namedtuple('ClassLevels', "freshman sophomore junior senior graduate extension")
 #range(1,6) + (None,)
 NUM_CLASS_LEVELS = len(ClassLevels._fields)
-def parse_class_levels(l):
-    class_levels = ClassLevels(*slice_off(l, NUM_CLASS_LEVELS))
-    _num_class_level_resps = slice_off(l, 1)
+_CLASS_LEVEL = "class level"
+def parse_class_levels(nums):
+    class_levels = ClassLevels(*nums.take(NUM_CLASS_LEVELS, _CLASS_LEVEL))
+    _num_class_level_resps = nums.take_one(_CLASS_LEVEL)
     if _num_class_level_resps:
-        _class_level_percents = slice_off(l, NUM_CLASS_LEVELS)
+        nums.skip(NUM_CLASS_LEVELS, _CLASS_LEVEL) # percents
     return class_levels
 
 ReasonsForTaking = _namedtuple('ReasonsForTaking', "major minor ge elective interest")
 NUM_REASONS_FOR_TAKING = len(ReasonsForTaking._fields)
-def parse_reasons_for_taking(l):
-    reasons = ReasonsForTaking(*slice_off(l, NUM_REASONS_FOR_TAKING))
-    _reason_resps = slice_off(l, 1)
+_REASON = "reason for taking"
+def parse_reasons_for_taking(nums):
+    reasons = ReasonsForTaking(*nums.take(NUM_REASONS_FOR_TAKING, _REASON))
+    _reason_resps = nums.take_one(_REASON)
     if _reason_resps:
-        _reason_percents = slice_off(l, NUM_REASONS_FOR_TAKING)
+        nums.skip(NUM_REASONS_FOR_TAKING, _REASON) # percents
     return reasons
 
 ExpectedGrades = _namedtuple('ExpectedGrades', "A B C D F P NP")
 #range(4,-1,-1) + (True, False)
 NUM_POSSIBLE_GRADES = len(ExpectedGrades._fields)
-def parse_expected_grades(l):
-    expected_grades = ExpectedGrades(*slice_off(l, NUM_POSSIBLE_GRADES))
-    _num_grade_resps = slice_off(l, 1)
+_EXPECTED_GRADE = "expected grade"
+def parse_expected_grades(nums):
+    expected_grades = ExpectedGrades(*nums.take(NUM_POSSIBLE_GRADES, _EXPECTED_GRADE))
+    _num_grade_resps = nums.take_one(_EXPECTED_GRADE)
     if _num_grade_resps:
-        _expects_grade_percents = slice_off(l, NUM_POSSIBLE_GRADES)
+        nums.skip(NUM_POSSIBLE_GRADES, _EXPECTED_GRADE) # percents
     return expected_grades
 
-#FIXME: remember section ID#
 _CourseAndProfessorEvaluation = _namedtuple('_CourseAndProfessorEvaluation', "section_id department_code term_code subject_code course_number instructor enrollment respondents class_levels reasons_for_taking expected_grades hours_studying_per_week attendance recommend_course recommend_instructor agreement_questions")
 class CourseAndProfessorEvaluation(_CourseAndProfessorEvaluation):    
     FORMAT = "{0.term_code}: {0.course_code} with {0.instructor}; ({0.respondents} responses/{0.enrollment} enrolled)"
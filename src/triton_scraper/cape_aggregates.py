@@ -0,0 +1,270 @@
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module loads :class:`CourseAndProfessorEvaluation`-s into `NumPy <http://numpy.scipy.org/>`_ arrays
+and rolls them up by instructor, course, department, or term with vectorized operations.
+
+Group-wide means are weighted by the number of responses, i.e. they're computed from the summed response counts of the group's CAPEs,
+so a 300-student lecture counts for more than a 10-student seminar. Percentiles are of the per-CAPE statistics (see :meth:`CapeTable.statistic`).
+
+Requires :mod:`numpy`, which the rest of TritonScraper does not.
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+from __future__ import division
+
+import numpy as _np
+
+from triton_scraper import cape as _cape
+
+#: Grade points of the letter grades of :class:`ExpectedGrades`, in field order; P and NP don't count towards the GPA
+GRADE_POINTS = _np.array([4, 3, 2, 1, 0, _np.nan, _np.nan])
+#: Hours per week at the middle of each :class:`StudyHours` interval, in field order
+STUDY_HOURS_MIDPOINTS = _np.arange(len(_cape.StudyHours._fields)) * 2 + 0.5
+#: Score of each :class:`AgreementLevels` level, in field order, from -2 (strongly disagree) to 2 (strongly agree); N/A doesn't count
+AGREEMENT_SCORES = _np.array([_np.nan, -2, -1, 0, 1, 2])
+
+#: What CAPEs can be grouped by, and the :class:`CourseAndProfessorEvaluation` attribute each groups on
+GROUPINGS = {
+    'instructor': 'instructor',
+    'course': 'course_code',
+    'department': 'department_code',
+    'term': 'term_code',
+}
+
+#: Response count fields of :class:`CourseAndProfessorEvaluation` which :meth:`CapeTable.distribution` can sum
+COUNT_FIELDS = ('class_levels', 'reasons_for_taking', 'expected_grades', 'hours_studying_per_week', 'attendance', 'recommend_course', 'recommend_instructor')
+_NUM_LEVELS = dict(zip(COUNT_FIELDS, (_cape.NUM_CLASS_LEVELS, _cape.NUM_REASONS_FOR_TAKING, _cape.NUM_POSSIBLE_GRADES, _cape.NUM_STUDY_HOURS_INTERVALS, _cape.NUM_ATTENDANCE_TYPES, 2, 2)))
+
+def _weighted_means(counts, values):
+    """Mean of *values* weighted by each row of *counts*; levels whose value is NaN are left out. NaN for rows without counted responses."""
+    counted = ~_np.isnan(values)
+    counts = counts[..., counted]
+    values = values[counted]
+    with _np.errstate(divide='ignore', invalid='ignore'):
+        return (counts * values).sum(axis=-1) / counts.sum(axis=-1)
+
+def _yes_rates(counts):
+    with _np.errstate(divide='ignore', invalid='ignore'):
+        return counts[..., 1] / counts.sum(axis=-1)
+
+class CapeTable(object):
+    """Columnar view of many CAPEs (e.g. from :func:`cape.crawl_capes`).
+
+    Row *i* of every array describes ``capes[i]``."""
+    def __init__(self, capes):
+        """
+        :type capes: iterable of :class:`CourseAndProfessorEvaluation`-s
+        """
+        #: The CAPEs, in table order
+        #:
+        #: :type: list of :class:`CourseAndProfessorEvaluation`-s
+        self.capes = list(capes)
+        #: Level-of-agreement questions, in order of first appearance; the columns of :attr:`agreement`
+        #:
+        #: :type: list of strings
+        self.questions = []
+        question2index = {}
+        agreement_rows = []
+        for cape in self.capes:
+            row = {}
+            for question, levels in cape.agreement_questions:
+                try:
+                    index = question2index[question]
+                except KeyError:
+                    index = question2index[question] = len(self.questions)
+                    self.questions.append(question)
+                row[index] = levels
+            agreement_rows.append(row)
+        self._group_codes = {}
+        self._group_labels = {}
+        self._counts = {}
+        for field in COUNT_FIELDS:
+            self._counts[field] = _np.array([tuple(getattr(cape, field)) for cape in self.capes], dtype=_np.int64).reshape(len(self.capes), _NUM_LEVELS[field])
+        #: Number of students enrolled in each CAPE's course instance
+        #:
+        #: :type: :class:`numpy.ndarray` of ints
+        self.enrollment = _np.array([cape.enrollment for cape in self.capes], dtype=_np.int64)
+        #: Number of questionnaires returned for each CAPE
+        #:
+        #: :type: :class:`numpy.ndarray` of ints
+        self.respondents = _np.array([cape.respondents for cape in self.capes], dtype=_np.int64)
+        #: Response counts of each CAPE to each question of :attr:`questions`; shape is (CAPEs, questions, :class:`AgreementLevels` levels).
+        #: Questions a CAPE didn't ask (e.g. instructor questions of team-taught courses) have all-zero counts.
+        #:
+        #: :type: :class:`numpy.ndarray` of ints
+        self.agreement = _np.zeros((len(self.capes), len(self.questions), len(_cape.AgreementLevels._fields)), dtype=_np.int64)
+        for cape_index, row in enumerate(agreement_rows):
+            for question_index, levels in row.iteritems():
+                self.agreement[cape_index, question_index] = levels
+
+    def __len__(self):
+        return len(self.capes)
+
+    def counts(self, field):
+        """Response counts of every CAPE for one of the :const:`COUNT_FIELDS`; one row per CAPE, one column per level (in the field's namedtuple's order).
+
+        :type field: string
+        :rtype: :class:`numpy.ndarray` of ints
+        """
+        return self._counts[field]
+
+    ### Grouping
+    def groups(self, by):
+        """Distinct values of a grouping, and which of them each CAPE belongs to.
+
+        :param by: one of the keys of :const:`GROUPINGS`
+        :type by: string
+        :returns: group labels (e.g. instructor names; None for CAPEs without a listed instructor), and the index into them of each CAPE's group
+        :rtype: tuple of a list and a :class:`numpy.ndarray` of ints
+        """
+        if by not in self._group_codes:
+            attribute = GROUPINGS[by]
+            labels = []
+            label2code = {}
+            codes = _np.empty(len(self.capes), dtype=_np.int32)
+            for index, cape in enumerate(self.capes):
+                label = getattr(cape, attribute)
+                try:
+                    codes[index] = label2code[label]
+                except KeyError:
+                    codes[index] = label2code[label] = len(labels)
+                    labels.append(label)
+            self._group_labels[by] = labels
+            self._group_codes[by] = codes
+        return self._group_labels[by], self._group_codes[by]
+
+    def _group_sums(self, by, counts):
+        """Sums *counts* (whose first axis is parallel to :attr:`capes`) within each group."""
+        labels, codes = self.groups(by)
+        flat = counts.reshape(len(self.capes), int(_np.prod(counts.shape[1:])))
+        sums = _np.zeros((len(labels), flat.shape[1]), dtype=_np.int64)
+        for column in xrange(flat.shape[1]):
+            sums[:, column] = _np.bincount(codes, weights=flat[:, column], minlength=len(labels))
+        return labels, sums.reshape((len(labels),) + counts.shape[1:])
+
+    def distribution(self, field, by):
+        """Summed response counts of each group for one of the :const:`COUNT_FIELDS`.
+
+        :type field: string
+        :param by: one of the keys of :const:`GROUPINGS`
+        :type by: string
+        :returns: group labels, and one row of summed counts per group
+        :rtype: tuple of a list and a :class:`numpy.ndarray` of ints
+        """
+        return self._group_sums(by, self._counts[field])
+
+    ### Response-weighted means
+    def expected_gpa(self, by):
+        """Mean expected letter grade of each group on a 4-point scale (see :const:`GRADE_POINTS`); NaN for groups where nobody expected a letter grade.
+
+        :param by: one of the keys of :const:`GROUPINGS`
+        :type by: string
+        :rtype: tuple of a list of group labels and a :class:`numpy.ndarray` of floats
+        """
+        labels, sums = self.distribution('expected_grades', by)
+        return labels, _weighted_means(sums, GRADE_POINTS)
+
+    def study_hours(self, by):
+        """Mean hours of study per week of each group (see :const:`STUDY_HOURS_MIDPOINTS`).
+
+        :param by: one of the keys of :const:`GROUPINGS`
+        :type by: string
+        :rtype: tuple of a list of group labels and a :class:`numpy.ndarray` of floats
+        """
+        labels, sums = self.distribution('hours_studying_per_week', by)
+        return labels, _weighted_means(sums, STUDY_HOURS_MIDPOINTS)
+
+    def recommendation_rate(self, by, of='recommend_instructor'):
+        """Fraction of respondents in each group who recommend the course or instructor.
+
+        :param by: one of the keys of :const:`GROUPINGS`
+        :type by: string
+        :param of: 'recommend_course' or 'recommend_instructor'
+        :type of: string
+        :rtype: tuple of a list of group labels and a :class:`numpy.ndarray` of floats
+        """
+        labels, sums = self.distribution(of, by)
+        return labels, _yes_rates(sums)
+
+    def agreement_means(self, by):
+        """Mean level of agreement of each group with each question of :attr:`questions` (see :const:`AGREEMENT_SCORES`).
+
+        :param by: one of the keys of :const:`GROUPINGS`
+        :type by: string
+        :returns: group labels, and a (groups, questions) array of mean scores; NaN where a group has no non-N/A responses to a question
+        :rtype: tuple of a list and a :class:`numpy.ndarray` of floats
+        """
+        labels, sums = self._group_sums(by, self.agreement)
+        return labels, _weighted_means(sums, AGREEMENT_SCORES)
+
+    ### Per-CAPE statistics and their percentiles
+    def statistic(self, name):
+        """A statistic of every CAPE; NaN for CAPEs without the responses it needs.
+
+        :param name: 'expected_gpa', 'study_hours', 'recommend_course', 'recommend_instructor', or 'response_rate' (fraction of enrolled students who responded)
+        :type name: string
+        :rtype: :class:`numpy.ndarray` of floats
+        """
+        if name == 'expected_gpa':
+            return _weighted_means(self._counts['expected_grades'], GRADE_POINTS)
+        if name == 'study_hours':
+            return _weighted_means(self._counts['hours_studying_per_week'], STUDY_HOURS_MIDPOINTS)
+        if name in ('recommend_course', 'recommend_instructor'):
+            return _yes_rates(self._counts[name])
+        if name == 'response_rate':
+            with _np.errstate(divide='ignore', invalid='ignore'):
+                return self.respondents / self.enrollment.astype(_np.float64)
+        raise ValueError, "Unknown CAPE statistic %s" % repr(name)
+
+    def percentiles(self, name, by, percents=(25, 50, 75)):
+        """Percentiles of a per-CAPE :meth:`statistic` within each group, interpolating linearly like :func:`numpy.percentile`. CAPEs where the statistic is NaN are left out.
+
+        :param name: name of the statistic; see :meth:`statistic`
+        :type name: string
+        :param by: one of the keys of :const:`GROUPINGS`
+        :type by: string
+        :param percents: which percentiles to compute, between 0 and 100
+        :type percents: sequence of numbers
+        :returns: group labels, and a (groups, percents) array; NaN for groups without any CAPEs having the statistic
+        :rtype: tuple of a list and a :class:`numpy.ndarray` of floats
+        """
+        labels, codes = self.groups(by)
+        values = self.statistic(name)
+        present = ~_np.isnan(values)
+        values, codes = values[present], codes[present]
+        order = _np.lexsort((values, codes)) # by group, then by value
+        values = values[order]
+        sizes = _np.bincount(codes, minlength=len(labels))
+        starts = _np.concatenate(([0], _np.cumsum(sizes)[:-1]))
+        result = _np.empty((len(labels), len(percents)))
+        result.fill(_np.nan)
+        nonempty = sizes > 0
+        starts, sizes = starts[nonempty], sizes[nonempty]
+        for column, percent in enumerate(percents):
+            position = (sizes - 1) * (percent / 100)
+            below = _np.floor(position).astype(_np.int64)
+            above = _np.minimum(below + 1, sizes - 1)
+            fraction = position - below
+            result[nonempty, column] = values[starts + below] * (1 - fraction) + values[starts + above] * fraction
+        return labels, result
@@ -0,0 +1,268 @@
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module matches course instances and their sections to the CAPEs of past offerings of the same course by the same instructor,
+so that ratings can be shown next to sections.
+
+Matching is by course code and instructor name. Names are normalized into keys (see :func:`instructor_key`),
+since CAPE lists instructors as raw "Last, First" strings (with team-taught courses' instructors separated by semicolons)
+whereas TritonLink gives :class:`Instructor` objects.
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+import re as _re
+from unicodedata import normalize as _normalize
+
+from triton_scraper.datatypes import Instructor as _Instructor
+from triton_scraper.meetings import SeatedMeeting as _SeatedMeeting
+
+_NON_NAME_CHARS = _re.compile(r"[^a-z\s-]+")
+_WHITESPACE = _re.compile(r"[\s-]+")
+_CAPE_INSTRUCTOR_SEPARATOR = ";"
+
+def _normalized_name(name):
+    if isinstance(name, unicode):
+        name = _normalize('NFKD', name).encode('ascii', 'ignore') # drops accents
+    name = _NON_NAME_CHARS.sub("", name.lower())
+    return _WHITESPACE.sub(" ", name).strip()
+
+def instructor_key(last, first):
+    """Normalized key for an instructor's name, under which differently written versions of it match.
+    Case, accents, punctuation, and hyphens are ignored, and only the first word of the given name is kept
+    (so "John A." matches "John").
+
+    :param last: the instructor's surname
+    :type last: string
+    :param first: the instructor's given name
+    :type first: string
+    :rtype: tuple of strings
+    """
+    first_words = _normalized_name(first).split(" ")
+    return (_normalized_name(last), first_words[0])
+
+def cape_instructor_keys(raw_instructor):
+    """Keys (see :func:`instructor_key`) of the instructors named in a CAPE's :attr:`CourseAndProfessorEvaluation.instructor`.
+
+    :param raw_instructor: e.g. "Doe, John" or "Doe, John; Roe, Jane"; None if no instructor was listed
+    :type raw_instructor: string or None
+    :rtype: list of tuples
+    """
+    if not raw_instructor:
+        return []
+    keys = []
+    for name in raw_instructor.split(_CAPE_INSTRUCTOR_SEPARATOR):
+        last, _comma, first = name.partition(",")
+        if last.strip():
+            keys.append(instructor_key(last, first))
+    return keys
+
+def course_key(subject_code, course_number):
+    """Normalized key for a course code.
+
+    :rtype: tuple of strings
+    """
+    return (subject_code.strip().upper(), course_number.strip().upper())
+
+def _seated_meetings_of(course_inst):
+    for meeting_list in course_inst._code2meeting_list.itervalues():
+        for meeting in meeting_list:
+            if isinstance(meeting, _SeatedMeeting):
+                yield meeting
+
+def _instructors_of(course_inst):
+    instructors = set()
+    if isinstance(course_inst.instructor, _Instructor):
+        instructors.add(course_inst.instructor)
+    for meeting in _seated_meetings_of(course_inst):
+        if isinstance(meeting.instructor, _Instructor):
+            instructors.add(meeting.instructor)
+    return instructors
+
+def _add_to(mapping, key, value):
+    try:
+        mapping[key].add(value)
+    except KeyError:
+        mapping[key] = set([value])
+
+def _remove_from(mapping, key, value):
+    values = mapping.get(key)
+    if values is not None:
+        values.discard(value)
+        if not values:
+            del mapping[key]
+
+class CapeJoinIndex(object):
+    """Join between course instances (and their sections) and CAPEs, on (course code, instructor key) pairs.
+    Both sides can be added to, refreshed, and removed from independently; lookups are dictionary lookups.
+
+    CAPEs are tracked by :attr:`CourseAndProfessorEvaluation.section_id`, so adding a CAPE with the Section ID of one already indexed replaces it.
+    Course instances are tracked by course code and the Section IDs of their sections (which are unique within a term), so adding a
+    rescraped version of an indexed course instance (the same course, sharing a section with it) replaces the old version,
+    including sections the rescrape no longer has. Course instances without sections are only tracked as objects."""
+    def __init__(self, capes=(), course_instances=()):
+        """
+        :type capes: iterable of :class:`CourseAndProfessorEvaluation`-s
+        :type course_instances: iterable of :class:`CourseInstance`-s
+        """
+        self._section_id2cape = {}
+        self._join_key2cape_ids = {} # (course key, instructor key) -> Section IDs of CAPEs
+        self._course_key2cape_ids = {}
+        self._course2join_keys = {} # course instance -> its join keys
+        self._course2section_ids = {} # course instance -> Section IDs of its sections when it was indexed
+        self._section_id2join_keys = {} # Section ID of a current section -> its join keys
+        self._section_id2course = {}
+        self._join_key2courses = {}
+        for cape in capes:
+            self.add_cape(cape)
+        for course_inst in course_instances:
+            self.add_course_instance(course_inst)
+
+    @staticmethod
+    def _cape_join_keys(cape):
+        course = course_key(cape.subject_code, cape.course_number)
+        return course, [(course, key) for key in cape_instructor_keys(cape.instructor)]
+
+    ### CAPE side
+    def add_cape(self, cape):
+        """Indexes *cape*, replacing any CAPE indexed with the same Section ID.
+
+        :type cape: :class:`CourseAndProfessorEvaluation`
+        """
+        self.remove_cape(cape.section_id)
+        self._section_id2cape[cape.section_id] = cape
+        course, join_keys = self._cape_join_keys(cape)
+        _add_to(self._course_key2cape_ids, course, cape.section_id)
+        for join_key in join_keys:
+            _add_to(self._join_key2cape_ids, join_key, cape.section_id)
+
+    def remove_cape(self, section_id):
+        """Removes the CAPE with the given Section ID from the index, if it's indexed.
+
+        :type section_id: int
+        """
+        cape = self._section_id2cape.pop(section_id, None)
+        if cape is None:
+            return
+        course, join_keys = self._cape_join_keys(cape)
+        _remove_from(self._course_key2cape_ids, course, section_id)
+        for join_key in join_keys:
+            _remove_from(self._join_key2cape_ids, join_key, section_id)
+
+    ### Schedule side
+    def _indexed_versions_of(self, course_inst):
+        """Indexed course instances which *course_inst* is a version of: itself, and those of the same course sharing a section with it."""
+        versions = set()
+        if course_inst in self._course2join_keys:
+            versions.add(course_inst)
+        course = course_key(course_inst.subject_code, course_inst.course_number)
+        for meeting in _seated_meetings_of(course_inst):
+            indexed = self._section_id2course.get(meeting.section_id)
+            if indexed is not None and course_key(indexed.subject_code, indexed.course_number) == course:
+                versions.add(indexed)
+        return versions
+
+    def add_course_instance(self, course_inst):
+        """Indexes *course_inst* and its seated meetings (sections), replacing any indexed version of it (e.g. from before a rescrape).
+        Each section is keyed by its own instructor, falling back to the course instance's.
+
+        :type course_inst: :class:`CourseInstance`
+        """
+        self.remove_course_instance(course_inst)
+        course = course_key(course_inst.subject_code, course_inst.course_number)
+        join_keys = set((course, instructor_key(instructor.last_name, instructor.first_name)) for instructor in _instructors_of(course_inst))
+        self._course2join_keys[course_inst] = join_keys
+        for join_key in join_keys:
+            _add_to(self._join_key2courses, join_key, course_inst)
+        section_ids = self._course2section_ids[course_inst] = []
+        for meeting in _seated_meetings_of(course_inst):
+            instructor = meeting.instructor if isinstance(meeting.instructor, _Instructor) else course_inst.instructor
+            if isinstance(instructor, _Instructor):
+                section_keys = [(course, instructor_key(instructor.last_name, instructor.first_name))]
+            else:
+                section_keys = [] # TBA, so no instructor-specific CAPEs apply
+            self._section_id2join_keys[meeting.section_id] = section_keys
+            self._section_id2course[meeting.section_id] = course_inst
+            section_ids.append(meeting.section_id)
+
+    def remove_course_instance(self, course_inst):
+        """Removes every indexed version of *course_inst* (see :meth:`add_course_instance`) and their sections from the index.
+
+        :type course_inst: :class:`CourseInstance`
+        """
+        for indexed in self._indexed_versions_of(course_inst):
+            for join_key in self._course2join_keys.pop(indexed):
+                _remove_from(self._join_key2courses, join_key, indexed)
+            for section_id in self._course2section_ids.pop(indexed):
+                if self._section_id2course.get(section_id) is indexed:
+                    del self._section_id2course[section_id]
+                    del self._section_id2join_keys[section_id]
+
+    ### Queries
+    def _capes_with_ids(self, section_ids):
+        return [self._section_id2cape[section_id] for section_id in sorted(section_ids)]
+
+    def _capes_under(self, join_keys):
+        cape_ids = set()
+        for join_key in join_keys:
+            cape_ids.update(self._join_key2cape_ids.get(join_key, ()))
+        return self._capes_with_ids(cape_ids)
+
+    def capes_for_section(self, section_id):
+        """CAPEs of past offerings of a current section's course taught by the section's instructor.
+
+        :param section_id: Section ID of a seated meeting of an indexed course instance
+        :type section_id: int
+        :rtype: list of :class:`CourseAndProfessorEvaluation`-s
+        :raises: :exc:`KeyError` if no indexed course instance has a section with that ID
+        """
+        return self._capes_under(self._section_id2join_keys[section_id])
+
+    def capes_for_course_instance(self, course_inst):
+        """CAPEs of past offerings of *course_inst*'s course taught by any of its instructors.
+
+        :type course_inst: :class:`CourseInstance`
+        :rtype: list of :class:`CourseAndProfessorEvaluation`-s
+        """
+        join_keys = self._course2join_keys.get(course_inst)
+        if join_keys is None:
+            course = course_key(course_inst.subject_code, course_inst.course_number)
+            join_keys = [(course, instructor_key(instructor.last_name, instructor.first_name)) for instructor in _instructors_of(course_inst)]
+        return self._capes_under(join_keys)
+
+    def capes_for_course(self, subject_code, course_number):
+        """CAPEs of every past offering of a course, by any instructor.
+
+        :rtype: list of :class:`CourseAndProfessorEvaluation`-s
+        """
+        return self._capes_with_ids(self._course_key2cape_ids.get(course_key(subject_code, course_number), ()))
+
+    def course_instances_for(self, cape):
+        """Indexed course instances of the same course as *cape* taught by one of its instructors.
+
+        :type cape: :class:`CourseAndProfessorEvaluation`
+        :rtype: list of :class:`CourseInstance`-s
+        """
+        course_insts = set()
+        for join_key in self._cape_join_keys(cape)[1]:
+            course_insts.update(self._join_key2courses.get(join_key, ()))
+        return list(course_insts)
@@ -0,0 +1,286 @@
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module provides an in-memory catalog of course instances with secondary indexes,
+so that lookups after a crawl don't have to scan every :class:`CourseInstance`.
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+from bisect import bisect_left as _bisect_left
+from collections import namedtuple as _namedtuple
+from itertools import chain as _chain
+
+from triton_scraper.util import minutes_since_midnight as _minutes_since_midnight
+from triton_scraper.meetings import SeatedMeeting as _SeatedMeeting
+from triton_scraper.locations import Location as _Location, Building as _Building
+from triton_scraper.datatypes import Instructor as _Instructor
+from triton_scraper.conflicts import time_span as _time_span
+
+#: A meeting in a :class:`Catalog`, together with the course instance it belongs to
+CatalogEntry = _namedtuple('CatalogEntry', "meeting course_instance")
+
+# A way of narrowing down a query: how many entries it could match at most, a function giving the indices of those entries,
+# and a predicate telling whether an entry index satisfies it
+_Filter = _namedtuple('_Filter', "size candidates predicate")
+
+def _meetings_of(course_inst):
+    for meeting_list in course_inst._code2meeting_list.itervalues():
+        for meeting in meeting_list:
+            yield meeting
+    if course_inst.final is not None:
+        yield course_inst.final
+
+def _append_to(mapping, key, value):
+    try:
+        mapping[key].append(value)
+    except KeyError:
+        mapping[key] = [value]
+
+class Catalog(object):
+    """Course instances and their meetings, indexed for fast lookup.
+
+    Course-level indexes map subjects, course codes, instructors, and restrictions to course instances;
+    meeting-level indexes map section IDs, buildings, and rooms to meetings, and keep meetings sorted by start time and by open seats.
+    :meth:`query` combines several filters, using whichever index narrows things down the most."""
+    def __init__(self, course_instances=()):
+        """
+        :param course_instances: course instances to catalog; e.g. from :meth:`TritonBrowser.all_classes_during`
+        :type course_instances: iterable of :class:`CourseInstance`-s
+        """
+        #: The cataloged course instances, in the order they were added
+        #:
+        #: :type: list of :class:`CourseInstance`-s
+        self.courses = []
+        self._entries = []
+        self._course2indices = {}
+        # Course-level indexes
+        self._subject2courses = {}
+        self._course_code2courses = {}
+        self._instructor2courses = {}
+        self._restriction2courses = {}
+        # Meeting-level indexes
+        self._section_id2index = {}
+        self._building2indices = {}
+        self._room2indices = {}
+        self._by_start = [] # (start, entry index) pairs
+        self._by_open_seats = [] # (available seats, entry index) pairs
+        self._sorted = True # Are the above two sorted?
+        for course_inst in course_instances:
+            self.add(course_inst)
+
+    def add(self, course_inst):
+        """Adds *course_inst* and all its meetings, including its final, to the catalog.
+
+        :type course_inst: :class:`CourseInstance`
+        """
+        if course_inst in self._course2indices:
+            return
+        self.courses.append(course_inst)
+        indices = self._course2indices[course_inst] = []
+        _append_to(self._subject2courses, course_inst.subject_code, course_inst)
+        _append_to(self._course_code2courses, (course_inst.subject_code, course_inst.course_number), course_inst)
+        for restriction in course_inst.restrictions:
+            _append_to(self._restriction2courses, restriction, course_inst)
+        instructors = set()
+        if isinstance(course_inst.instructor, _Instructor):
+            instructors.add(course_inst.instructor)
+        for meeting in _meetings_of(course_inst):
+            index = len(self._entries)
+            self._entries.append(CatalogEntry(meeting, course_inst))
+            indices.append(index)
+            instructor = getattr(meeting, 'instructor', None)
+            if isinstance(instructor, _Instructor):
+                instructors.add(instructor)
+            if isinstance(meeting, _SeatedMeeting):
+                self._section_id2index[meeting.section_id] = index
+                self._by_open_seats.append((meeting.available_seats, index))
+            location = getattr(meeting, 'location', None)
+            if isinstance(location, _Location):
+                _append_to(self._building2indices, location.building, index)
+                _append_to(self._room2indices, (location.building, location.room_number), index)
+            span = _time_span(meeting)
+            if span is not None:
+                self._by_start.append((span[0], index))
+        self._sorted = False
+        for instructor in instructors:
+            _append_to(self._instructor2courses, instructor, course_inst)
+
+    def __len__(self):
+        """Number of cataloged meetings."""
+        return len(self._entries)
+
+    ### Single-index lookups
+    def section(self, section_id):
+        """The seated meeting with the given section ID, and its course instance.
+
+        :type section_id: int
+        :rtype: :class:`CatalogEntry`
+        :raises: :exc:`KeyError` if there's no such section
+        """
+        return self._entries[self._section_id2index[section_id]]
+
+    def instances_of(self, subject_code, course_number=None):
+        """Course instances of the given course, or of all courses in the given subject if *course_number* is None.
+
+        :rtype: list of :class:`CourseInstance`-s
+        """
+        if course_number is None:
+            return list(self._subject2courses.get(subject_code, ()))
+        return list(self._course_code2courses.get((subject_code, course_number), ()))
+
+    def courses_taught_by(self, instructor):
+        """Course instances in which *instructor* teaches any meeting.
+
+        :type instructor: :class:`Instructor`
+        :rtype: list of :class:`CourseInstance`-s
+        """
+        return list(self._instructor2courses.get(instructor, ()))
+
+    def courses_with_restriction(self, restriction):
+        """Course instances having the given registration restriction.
+
+        :param restriction: human-readable restriction description, as in :attr:`CourseInstance.restrictions`
+        :type restriction: string
+        :rtype: list of :class:`CourseInstance`-s
+        """
+        return list(self._restriction2courses.get(restriction, ()))
+
+    def meetings_in(self, building, room_number=None):
+        """Meetings held in the given building, or in the given room of it.
+
+        :param building: the building, or its UCSD building code
+        :type building: :class:`Building` or string
+        :type room_number: string or None
+        :rtype: list of :class:`CatalogEntry`-s
+        """
+        return self._entries_at(self._location_indices(building, room_number))
+
+    ### Combined queries
+    def query(self, subject_code=None, course_number=None, instructor=None, restriction=None, building=None, room_number=None, starts_at_or_after=None, starts_before=None, min_available_seats=None):
+        """Meetings satisfying all of the given criteria; criteria left as None aren't applied.
+        Candidates are drawn from the index of the most selective criterion and then checked against the rest.
+
+        :param subject_code: e.g. "CSE"
+        :type subject_code: string
+        :param course_number: e.g. "15L"; requires *subject_code*
+        :type course_number: string
+        :type instructor: :class:`Instructor`
+        :param restriction: as in :attr:`CourseInstance.restrictions`
+        :type restriction: string
+        :param building: the building, or its UCSD building code
+        :type building: :class:`Building` or string
+        :param room_number: requires *building*
+        :type room_number: string
+        :param starts_at_or_after: earliest start time
+        :type starts_at_or_after: :class:`datetime.time`
+        :param starts_before: start time upper bound (exclusive)
+        :type starts_before: :class:`datetime.time`
+        :param min_available_seats: only seated meetings with at least this many open seats
+        :type min_available_seats: int
+        :returns: matching meetings, in catalog order
+        :rtype: list of :class:`CatalogEntry`-s
+        """
+        if course_number is not None and subject_code is None:
+            raise ValueError, "course_number given without subject_code"
+        if room_number is not None and building is None:
+            raise ValueError, "room_number given without building"
+        filters = []
+        if subject_code is not None:
+            if course_number is None:
+                courses = self._subject2courses.get(subject_code, ())
+            else:
+                courses = self._course_code2courses.get((subject_code, course_number), ())
+            filters.append(self._course_filter(courses))
+        if instructor is not None:
+            filters.append(self._course_filter(self._instructor2courses.get(instructor, ())))
+        if restriction is not None:
+            filters.append(self._course_filter(self._restriction2courses.get(restriction, ())))
+        if building is not None:
+            filters.append(self._location_filter(building, room_number))
+        if starts_at_or_after is not None or starts_before is not None:
+            filters.append(self._start_filter(starts_at_or_after, starts_before))
+        if min_available_seats is not None:
+            filters.append(self._open_seats_filter(min_available_seats))
+        if not filters:
+            return list(self._entries)
+        filters.sort(key=lambda a_filter: a_filter.size)
+        most_selective = filters[0]
+        predicates = [a_filter.predicate for a_filter in filters[1:]]
+        matches = [index for index in most_selective.candidates() if all(predicate(index) for predicate in predicates)]
+        matches.sort()
+        return self._entries_at(matches)
+
+    def _entries_at(self, indices):
+        entries = self._entries
+        return [entries[index] for index in indices]
+
+    def _course_filter(self, courses):
+        courses = set(courses)
+        course2indices = self._course2indices
+        entries = self._entries
+        size = sum(len(course2indices[course]) for course in courses)
+        candidates = lambda: _chain.from_iterable(course2indices[course] for course in courses)
+        predicate = lambda index: entries[index].course_instance in courses
+        return _Filter(size, candidates, predicate)
+
+    def _location_indices(self, building, room_number):
+        if isinstance(building, basestring):
+            building = _Building.for_code(building, self._building2indices)
+        if room_number is None:
+            return self._building2indices.get(building, ())
+        return self._room2indices.get((building, room_number), ())
+
+    def _location_filter(self, building, room_number):
+        indices = self._location_indices(building, room_number)
+        index_set = set(indices)
+        return _Filter(len(indices), lambda: indices, index_set.__contains__)
+
+    def _ensure_sorted(self):
+        # Sorting is put off until a query needs it, so that adding many course instances doesn't re-sort every time
+        if not self._sorted:
+            self._by_start.sort()
+            self._by_open_seats.sort()
+            self._sorted = True
+
+    def _start_filter(self, earliest, before):
+        self._ensure_sorted()
+        by_start = self._by_start
+        earliest = None if earliest is None else _minutes_since_midnight(earliest)
+        before = None if before is None else _minutes_since_midnight(before)
+        low = 0 if earliest is None else _bisect_left(by_start, (earliest, -1))
+        high = len(by_start) if before is None else _bisect_left(by_start, (before, -1))
+        entries = self._entries
+        def predicate(index):
+            span = _time_span(entries[index].meeting)
+            return span is not None and (earliest is None or span[0] >= earliest) and (before is None or span[0] < before)
+        return _Filter(max(high - low, 0), lambda: (index for _start, index in by_start[low:high]), predicate)
+
+    def _open_seats_filter(self, min_available_seats):
+        self._ensure_sorted()
+        by_open_seats = self._by_open_seats
+        low = _bisect_left(by_open_seats, (min_available_seats, -1))
+        entries = self._entries
+        def predicate(index):
+            meeting = entries[index].meeting
+            return isinstance(meeting, _SeatedMeeting) and meeting.available_seats >= min_available_seats
+        return _Filter(len(by_open_seats) - low, lambda: (index for _seats, index in by_open_seats[low:]), predicate)
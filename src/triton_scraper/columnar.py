@@ -0,0 +1,246 @@
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module holds a term's worth of course meetings in columnar `NumPy <http://numpy.scipy.org/>`_ arrays,
+so that term-wide questions can be answered with vectorized operations instead of by walking the object graph.
+
+Requires :mod:`numpy`, which the rest of TritonScraper does not.
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+from __future__ import division
+
+import numpy as _np
+
+from triton_scraper import config as _config
+from triton_scraper.util import minutes_since_midnight as _minutes_since_midnight, MINUTES_PER_DAY as _MINUTES_PER_DAY
+from triton_scraper.meetings import SeatedMeeting as _SeatedMeeting, OneShotMeeting as _OneShotMeeting
+from triton_scraper.locations import Location as _Location
+
+#: Value of the integer columns of :const:`MEETING_DTYPE` which are not applicable to or unknown for a meeting
+NOT_APPLICABLE = -1
+
+#: NumPy structured array datatype of :attr:`TermCatalog.meetings`. Fields:
+#:
+#: section_id
+#:     Section ID of seated meetings; :const:`NOT_APPLICABLE` otherwise
+#: course
+#:     Index of the meeting's course instance in :attr:`TermCatalog.courses`
+#: meeting_type
+#:     TritonLink meeting type code; e.g. "LE"
+#: start, end
+#:     Minutes since midnight; :const:`NOT_APPLICABLE` if the time is TBA
+#: days
+#:     Days of the week as a :attr:`DaysOfWeekSet.mask`; 0 for one-shot meetings and meetings with TBA times
+#: date
+#:     Proleptic Gregorian ordinal (see :meth:`datetime.date.toordinal`) of one-shot meetings; :const:`NOT_APPLICABLE` otherwise
+#: available_seats, total_seats
+#:     As in :class:`SeatedMeeting` (waitlists are negative; unlimited seating is infinite); NaN for unseated meetings
+#: building
+#:     Index of the meeting's building code in :attr:`TermCatalog.building_codes`; :const:`NOT_APPLICABLE` if the location is unknown or TBA
+MEETING_DTYPE = _np.dtype([
+    ('section_id', _np.int64),
+    ('course', _np.int32),
+    ('meeting_type', 'S2'),
+    ('start', _np.int16),
+    ('end', _np.int16),
+    ('days', _np.uint8),
+    ('date', _np.int32),
+    ('available_seats', _np.float64),
+    ('total_seats', _np.float64),
+    ('building', _np.int32),
+])
+
+_NaN = float('NaN')
+
+def _meetings_of(course):
+    for type_code, meeting_list in course._code2meeting_list.iteritems():
+        for meeting in meeting_list:
+            yield type_code, meeting
+    if course.final is not None:
+        yield _config.FINAL_CODE, course.final
+
+class TermCatalog(object):
+    """Columnar view of the meetings of a collection of course instances (typically an entire term).
+
+    The object model is kept alongside the arrays; row *i* of :attr:`meetings` describes :meth:`meeting_at` (*i*)."""
+    def __init__(self, course_instances):
+        """
+        :param course_instances: course instances to include; e.g. from :meth:`TritonBrowser.all_classes_during`
+        :type course_instances: iterable of :class:`CourseInstance`-s
+        """
+        #: The course instances, in catalog order
+        #:
+        #: :type: list of :class:`CourseInstance`-s
+        self.courses = []
+        #: Building codes referenced by the ``building`` column of :attr:`meetings`
+        #:
+        #: :type: list of strings
+        self.building_codes = []
+        #: Subject codes referenced by :attr:`course_subjects`
+        #:
+        #: :type: list of strings
+        self.subject_codes = []
+        self._meeting_objs = []
+        code2building_index = {}
+        subject2index = {}
+        course_subjects = []
+        rows = []
+        for course_index, course in enumerate(course_instances):
+            self.courses.append(course)
+            try:
+                subject_index = subject2index[course.subject_code]
+            except KeyError:
+                subject_index = subject2index[course.subject_code] = len(self.subject_codes)
+                self.subject_codes.append(course.subject_code)
+            course_subjects.append(subject_index)
+            for type_code, meeting in _meetings_of(course):
+                self._meeting_objs.append(meeting)
+                rows.append(self._row_for(course_index, type_code, meeting, code2building_index))
+        #: One row per meeting; see :const:`MEETING_DTYPE`
+        #:
+        #: :type: :class:`numpy.ndarray`
+        self.meetings = _np.array(rows, dtype=MEETING_DTYPE)
+        #: Index into :attr:`subject_codes` of each course instance's subject, parallel to :attr:`courses`
+        #:
+        #: :type: :class:`numpy.ndarray`
+        self.course_subjects = _np.array(course_subjects, dtype=_np.int32)
+
+    def _row_for(self, course_index, type_code, meeting, code2building_index):
+        start_time = getattr(meeting, 'start_time', None)
+        if start_time is None:
+            start = end = NOT_APPLICABLE
+        else:
+            start = _minutes_since_midnight(start_time)
+            end = _minutes_since_midnight(meeting.end_time)
+        days = getattr(meeting, 'days', None)
+        days = days.mask if days is not None else 0
+        date = meeting.date.toordinal() if isinstance(meeting, _OneShotMeeting) else NOT_APPLICABLE
+        if isinstance(meeting, _SeatedMeeting):
+            section_id = meeting.section_id
+            available, total = meeting.available_seats, meeting.total_seats
+        else:
+            section_id = NOT_APPLICABLE
+            available = total = _NaN
+        location = getattr(meeting, 'location', None)
+        if isinstance(location, _Location):
+            code = location.building.code
+            try:
+                building = code2building_index[code]
+            except KeyError:
+                building = code2building_index[code] = len(self.building_codes)
+                self.building_codes.append(code)
+        else:
+            building = NOT_APPLICABLE
+        return (section_id, course_index, type_code, start, end, days, date, available, total, building)
+
+    def __len__(self):
+        return len(self._meeting_objs)
+
+    ### Back to the object model
+    def meeting_at(self, index):
+        """The meeting object described by row *index* of :attr:`meetings`."""
+        return self._meeting_objs[index]
+
+    def course_at(self, index):
+        """The course instance that the meeting in row *index* of :attr:`meetings` belongs to."""
+        return self.courses[self.meetings['course'][index]]
+
+    def meetings_where(self, selector):
+        """The meeting objects selected by *selector*.
+
+        :param selector: boolean mask over, or integer indices into, :attr:`meetings`
+        :type selector: :class:`numpy.ndarray`
+        :rtype: list of meetings
+        """
+        indices = _np.flatnonzero(selector) if selector.dtype == _np.bool_ else selector
+        return [self._meeting_objs[index] for index in indices]
+
+    ### Vectorized queries
+    @property
+    def seated(self):
+        """Boolean mask of the rows of :attr:`meetings` for seated meetings.
+
+        :type: :class:`numpy.ndarray`
+        """
+        return self.meetings['section_id'] != NOT_APPLICABLE
+
+    def how_full(self):
+        """:attr:`SeatedMeeting.how_full` of every row of :attr:`meetings`; NaN for unseated meetings.
+
+        :rtype: :class:`numpy.ndarray` of floats
+        """
+        available = self.meetings['available_seats']
+        total = self.meetings['total_seats']
+        with _np.errstate(divide='ignore', invalid='ignore'):
+            fullness = (total - available) / total
+        fullness[_np.isinf(available)] = 0 # unlimited seating
+        return fullness
+
+    def fullest_sections(self, count=10):
+        """The *count* fullest seated meetings, fullest first.
+
+        :rtype: list of (meeting, :class:`CourseInstance`, fullness) tuples
+        """
+        fullness = self.how_full()
+        candidates = _np.flatnonzero(self.seated & ~_np.isnan(fullness))
+        fullest = candidates[_np.argsort(-fullness[candidates], kind='mergesort')[:count]]
+        return [(self._meeting_objs[index], self.course_at(index), float(fullness[index])) for index in fullest]
+
+    def _sum_by_subject(self, values):
+        subjects = self.course_subjects[self.meetings['course']]
+        sums = _np.bincount(subjects, weights=values, minlength=len(self.subject_codes))
+        return dict(zip(self.subject_codes, sums.tolist()))
+
+    def waitlist_by_subject(self):
+        """Total number of waitlisted students in each subject.
+
+        :rtype: dict of subject codes to ints
+        """
+        available = self.meetings['available_seats']
+        waitlisted = -_np.fmin(available, 0) # fmin() treats the NaNs of unseated meetings as missing
+        return dict((subject, int(total)) for subject, total in self._sum_by_subject(waitlisted).iteritems())
+
+    def seats_by_time_of_day(self, bin_minutes=60):
+        """Total number of (limited) seats in seated meetings, by the time of day the meeting starts.
+
+        :param bin_minutes: width of each time of day bin, in minutes
+        :type bin_minutes: int
+        :returns: start of each bin in minutes since midnight, and the number of seats in meetings starting during that bin
+        :rtype: tuple of two :class:`numpy.ndarray`-s
+        """
+        start = self.meetings['start']
+        total = self.meetings['total_seats']
+        counted = (start != NOT_APPLICABLE) & _np.isfinite(total)
+        num_bins = -(-_MINUTES_PER_DAY // bin_minutes)
+        seats = _np.bincount(start[counted] // bin_minutes, weights=total[counted], minlength=num_bins)
+        return _np.arange(num_bins) * bin_minutes, seats
+
+    def meetings_on(self, days):
+        """Boolean mask of the rows of :attr:`meetings` for recurring meetings held on any of the given days.
+
+        :param days: days of the week
+        :type days: :class:`DaysOfWeekSet`
+        :rtype: :class:`numpy.ndarray`
+        """
+        return (self.meetings['days'] & days.mask) != 0
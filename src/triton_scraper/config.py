@@ -26,7 +26,7 @@ This module holds configuration settings parsed from TritonScraper's configurati
 """
 
 from ConfigParser import RawConfigParser as _RawConfigParser
-from os.path import dirname as _dirname, join as _pathjoin
+from os.path import dirname as _dirname, join as _pathjoin, expanduser as _expanduser
 
 ### Fetch configuration settings
 CONFIG_FILENAME = 'config.cfg'
@@ -47,6 +47,16 @@ LOGGER_NAME = cfg.get(_MAIN_SECT, 'loggername')
 RETRY_DELAY = float(cfg.get(_MAIN_SECT, 'waitbeforeretry'))
 #: Socket timeout (in seconds) to set
 SOCKET_TIMEOUT = float(cfg.get(_MAIN_SECT, 'socktimeout'))
+#: Number of threads to use when fetching many pages concurrently
+FETCH_WORKERS = int(cfg.get(_MAIN_SECT, 'fetchworkers'))
+#: Maximum number of page requests per second when fetching many pages concurrently
+MAX_REQUESTS_PER_SECOND = float(cfg.get(_MAIN_SECT, 'maxrequestspersecond'))
+#: Directory to cache reference tables (building codes, restriction codes) in
+CACHE_DIR = _expanduser(cfg.get(_MAIN_SECT, 'cachedir'))
+#: How old (in seconds) a cached reference table can get before it's refreshed in the background
+REFERENCE_TABLE_MAX_AGE = float(cfg.get(_MAIN_SECT, 'refmaxage'))
+#: How many times to try fetching a reference table that isn't cached yet before giving up
+REFERENCE_TABLE_FETCH_TRIES = int(cfg.get(_MAIN_SECT, 'reftries'))
 
 _TRITON_SECT = 'tritonlink'
 SCHEDULE_OF_CLASSES_LINK_TEXT = cfg.get(_TRITON_SECT, 'soclinktext')
@@ -71,6 +81,18 @@ REQUIRED_BOOK_CODE = cfg.get(_BOOKSTORE_SECT, 'requiredcode')
 AS_SOFT_RESERVES = cfg.get(_BOOKSTORE_SECT, 'softreservestext')
 NO_TEXTBOOK_REQUIRED = cfg.get(_BOOKSTORE_SECT, 'nonerequiredtext')
 IN_STOCK = cfg.get(_BOOKSTORE_SECT, 'instocktext')
+#: Maximum number of booklists to keep cached
+BOOKLIST_CACHE_SIZE = int(cfg.get(_BOOKSTORE_SECT, 'cachesize'))
+#: How long (in seconds) a cached booklist remains valid
+BOOKLIST_CACHE_TTL = float(cfg.get(_BOOKSTORE_SECT, 'cachettl'))
+
+_SQLITE_SECT = 'sqlite'
+#: Number of records to insert per transaction when writing into SQLite databases in bulk
+SQLITE_BATCH_SIZE = int(cfg.get(_SQLITE_SECT, 'batchsize'))
+#: Maximum number of records waiting for the background database writer before producers have to wait
+SQLITE_QUEUE_SIZE = int(cfg.get(_SQLITE_SECT, 'queuesize'))
+#: How old (in seconds) the oldest record of a partial batch held by the background database writer may get before the batch is committed
+SQLITE_FLUSH_INTERVAL = float(cfg.get(_SQLITE_SECT, 'flushinterval'))
 
 #Meeting type codes
 _MTG_TYPE_CODES = "meetingtypecodes"
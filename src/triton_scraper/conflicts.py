@@ -0,0 +1,228 @@
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module detects scheduling conflicts between course meetings.
+
+Meeting times are handled as half-open intervals of minutes since midnight, so a meeting ending at 10:50 doesn't conflict with one starting at 10:50.
+A dated one-shot meeting (e.g. a final) only conflicts with other dated meetings on the same date. It isn't compared with recurring meetings,
+since those only happen between the start and end dates of their term, which the data model doesn't know (and finals are held after classes end).
+Meetings whose time is TBA never conflict with anything.
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+from bisect import bisect_left as _bisect_left, bisect_right as _bisect_right
+from collections import namedtuple as _namedtuple
+
+from triton_scraper.util import minutes_since_midnight as _minutes_since_midnight
+from triton_scraper.datatypes import DaysOfWeekSet as _DaysOfWeekSet
+
+#: A block of time during which someone is busy, for use with :meth:`ConflictIndex.all_clear`.
+#: Has the same attributes as a :class:`RecurringMeeting`, so meetings can be used as busy blocks too.
+BusyBlock = _namedtuple('BusyBlock', "days start_time end_time")
+
+_NUM_DAYS = len(_DaysOfWeekSet.DAYS_IN_ORDER)
+
+def day_index_of(a_date):
+    """Index into :attr:`DaysOfWeekSet.DAYS_IN_ORDER` of the day of the week of *a_date*."""
+    return (a_date.weekday() + 1) % _NUM_DAYS # date.weekday() starts on Monday; we start on Sunday
+
+def _day_indices(days):
+    mask = days.mask
+    return [index for index in xrange(_NUM_DAYS) if mask & (1 << index)]
+
+def time_span(meeting):
+    """The time of day of *meeting*, in minutes since midnight.
+
+    :returns: start and end times, or None if the meeting's time is TBA
+    :rtype: tuple of two ints or None
+    """
+    start_time = getattr(meeting, 'start_time', None)
+    if start_time is None:
+        return None
+    return _minutes_since_midnight(start_time), _minutes_since_midnight(meeting.end_time)
+
+def _spans_overlap(span, other_span):
+    return span[0] < other_span[1] and other_span[0] < span[1]
+
+def meetings_overlap(meeting, other):
+    """Do the two meetings take place at the same time?
+    Compares a pair of meetings directly; use a :class:`ConflictIndex` to check against many meetings at once.
+
+    :type meeting: :class:`RecurringMeeting`, :class:`OneShotMeeting`, :class:`SeatedMeeting`, or :class:`BusyBlock`
+    :type other: :class:`RecurringMeeting`, :class:`OneShotMeeting`, :class:`SeatedMeeting`, or :class:`BusyBlock`
+    :rtype: bool
+    """
+    span = time_span(meeting)
+    other_span = time_span(other)
+    if span is None or other_span is None or not _spans_overlap(span, other_span):
+        return False
+    date = getattr(meeting, 'date', None)
+    other_date = getattr(other, 'date', None)
+    if date is not None or other_date is not None:
+        return date == other_date # recurring meetings can't be placed on a date
+    return meeting.days.overlaps(other.days)
+
+
+class _IntervalList(object):
+    """Intervals for a single day, sorted by start time, which can be searched for those overlapping a given interval.
+    Only intervals starting within the longest interval's duration before the query can overlap it,
+    so a search costs a binary search plus the number of candidates in that window."""
+    __slots__ = ('_starts', '_entries', '_max_duration', '_dirty')
+    def __init__(self):
+        self._starts = []
+        self._entries = [] # (start, end, key) triples
+        self._max_duration = 0
+        self._dirty = False
+
+    def add(self, start, end, key):
+        self._entries.append((start, end, key))
+        self._max_duration = max(self._max_duration, end - start)
+        self._dirty = True
+
+    def _sort(self):
+        self._entries.sort(key=lambda entry: entry[0])
+        self._starts = [entry[0] for entry in self._entries]
+        self._dirty = False
+
+    def overlapping(self, start, end):
+        """Yields the keys of the intervals overlapping [*start*, *end*)."""
+        if self._dirty:
+            self._sort()
+        low = _bisect_right(self._starts, start - self._max_duration)
+        high = _bisect_left(self._starts, end)
+        entries = self._entries
+        for index in xrange(low, high):
+            _start, other_end, key = entries[index]
+            if other_end > start:
+                yield key
+
+
+class ConflictIndex(object):
+    """Index of the times of many meetings, for quickly finding scheduling conflicts.
+
+    Every indexed meeting has a *key* identifying the section it belongs to; queries return keys.
+    Several meetings may share a key (e.g. all the meetings of a :class:`CourseInstance`),
+    in which case the key conflicts with a meeting if any of those meetings do."""
+    def __init__(self, meetings=()):
+        """
+        :param meetings: meetings to index, each under itself as its key
+        :type meetings: iterable of meetings
+        """
+        self._keys = set()
+        self._recurring_by_day = [_IntervalList() for i in xrange(_NUM_DAYS)]
+        self._one_shots_by_date = {}
+        for meeting in meetings:
+            self.add(meeting)
+
+    def add(self, meeting, key=None):
+        """Adds *meeting* to the index.
+
+        :param meeting: the meeting to index
+        :type meeting: :class:`RecurringMeeting`, :class:`OneShotMeeting`, or :class:`SeatedMeeting`
+        :param key: what to identify the meeting by in query results; defaults to the meeting itself
+        :type key: hashable
+        """
+        if key is None:
+            key = meeting
+        self._keys.add(key)
+        span = time_span(meeting)
+        if span is None: # TBA
+            return
+        start, end = span
+        date = getattr(meeting, 'date', None)
+        if date is not None:
+            try:
+                by_date = self._one_shots_by_date[date]
+            except KeyError:
+                by_date = self._one_shots_by_date[date] = _IntervalList()
+            by_date.add(start, end, key)
+        else:
+            for day_index in _day_indices(meeting.days):
+                self._recurring_by_day[day_index].add(start, end, key)
+
+    def add_course_instance(self, course_inst, key=None):
+        """Adds all the meetings of *course_inst*, including its final, to the index under a single key.
+
+        :type course_inst: :class:`CourseInstance`
+        :param key: what to identify the course instance by in query results; defaults to the course instance itself
+        :type key: hashable
+        """
+        if key is None:
+            key = course_inst
+        self._keys.add(key)
+        for meeting_list in course_inst._code2meeting_list.itervalues():
+            for meeting in meeting_list:
+                self.add(meeting, key)
+        if course_inst.final is not None:
+            self.add(course_inst.final, key)
+
+    @property
+    def keys(self):
+        """Keys of all the indexed meetings.
+
+        :type: frozenset
+        """
+        return frozenset(self._keys)
+
+    def _overlapping(self, meeting):
+        span = time_span(meeting)
+        if span is None:
+            return
+        start, end = span
+        date = getattr(meeting, 'date', None)
+        if date is not None:
+            by_date = self._one_shots_by_date.get(date)
+            if by_date is not None:
+                for key in by_date.overlapping(start, end):
+                    yield key
+        else:
+            for day_index in _day_indices(meeting.days):
+                for key in self._recurring_by_day[day_index].overlapping(start, end):
+                    yield key
+
+    def conflicts_with(self, meeting, ignore=None):
+        """Which indexed sections conflict with *meeting*?
+
+        :param meeting: the meeting to check
+        :type meeting: :class:`RecurringMeeting`, :class:`OneShotMeeting`, :class:`SeatedMeeting`, or :class:`BusyBlock`
+        :param ignore: key to leave out of the results, such as the key *meeting* itself was indexed under; defaults to *meeting*
+        :type ignore: hashable
+        :rtype: set of keys
+        """
+        if ignore is None:
+            ignore = meeting
+        conflicting = set(self._overlapping(meeting))
+        conflicting.discard(ignore)
+        return conflicting
+
+    def all_clear(self, busy_blocks):
+        """Which indexed sections don't conflict with any of the given busy times?
+
+        :param busy_blocks: times when one is unavailable
+        :type busy_blocks: iterable of :class:`BusyBlock`-s and/or meetings
+        :rtype: set of keys
+        """
+        conflicting = set()
+        for block in busy_blocks:
+            conflicting.update(self._overlapping(block))
+        return self._keys - conflicting
@@ -27,6 +27,8 @@ from triton_scraper.datatypes import *
 from triton_scraper.meetings import *
 from triton_scraper.locations import Location
 
+new_location = Location.new
+
 HREF = 'href'
 NBSP = u'\xa0'
 ANCHOR = 'a'
@@ -153,7 +155,7 @@ def parse_unseated_meeting(row, course_inst):
     mtg_days_of_wk = mtg_days_of_wk.text
     days = DaysOfWeekSet.from_ucsd_abbrevs(mtg_days_of_wk)
     start, end = parse_start_end_times(start_end_times)
-    location = Location.new(bldg.text.strip(), room.text.strip())
+    location = new_location(bldg.text.strip(), room.text.strip())
     instructor = parse_instructor(instructor) if instructor.text != NBSP else None
     meeting = RecurringMeeting(sect_num, instructor, start, end, days, location)
     course_inst.add_meeting(mtg_type, meeting)
@@ -186,7 +188,7 @@ def parse_seated_meeting(row, course_inst):
     start, end = parse_start_end_times(start_end_times)
     bldg = bldg.text.strip()
     room = room.text.strip()
-    location = Location.new(bldg, room)
+    location = new_location(bldg, room)
     available_seats, total_seats = parse_seating(avail, limit)
     books_link = extract_JavaScript_link(books.find(ANCHOR))
     instructor = parse_instructor(instructor) if instructor.text != NBSP else None
@@ -237,7 +239,7 @@ def parse_one_shot(row, course_inst):
     mtg_type = mtg_type.text
     date = parse_ucsd_date(date.text)
     start, end = parse_start_end_times(start_end_times)
-    location = Location.new(bldg.text.strip(), room.text.strip())
+    location = new_location(bldg.text.strip(), room.text.strip())
     one_shot = OneShotMeeting(date, start, end, location)
     if mtg_type == config.FINAL_CODE:
         if course_inst.final is not None and course_inst.final != one_shot:
@@ -258,6 +260,31 @@ def parse_ucsd_date(ucsd_date):
     return date(struct_time.tm_year, struct_time.tm_mon, struct_time.tm_mday)
 
 was_cancelled = XPath(RELATIVE_PREFIX+"/span[@class='redtxt' and text()='Cancelled']")#FIXME: put in config file
+### Meeting row dispatch
+def parse_meeting_row(row, course_inst):
+    """Parses a table row (sans its leading empty cells) for a meeting of the given course instance and adds the meeting to it"""
+    # print [c.text for c in row]
+    # print etree.tostring(row)
+    if len(row) == 8:
+        mtg_type = row[1].text
+        if mtg_type in (config.INDEPENDENT_STUDY_CODE, config.PRACTICUM_CODE, config.CONFERENCE_CODE, config.CLINICAL_CLERKSHIP_CODE, config.FIELDWORK_CODE):
+            raise ProblematicCourse
+        elif mtg_type in (config.FINAL_CODE, config.MIDTERM_CODE, config.PROBLEM_SESSION_CODE, config.REVIEW_SESSION_CODE, config.MAKE_UP_SESSION_CODE):
+            parse_one_shot(row, course_inst)
+        elif mtg_type in (config.LECTURE_CODE, config.DISCUSSION_CODE, config.LAB_CODE, config.TUTORIAL_CODE, config.FILM_CODE, config.STUDIO_CODE):
+            parse_unseated_meeting(row, course_inst)
+        elif mtg_type == config.SEMINAR_CODE:
+            parse_TBA_seminar_or_sect(row, course_inst)
+        else:
+            raise ValueError, "Unrecognized meeting type: "+repr(mtg_type)
+    elif len(row) == 11:#Discussion/Lab/Tutorial
+        parse_seated_meeting(row, course_inst)
+    else:# Free-form; ignore
+        if row and was_cancelled(row[-1]):
+            LOGGER.info("A meeting of %s was cancelled", repr(course_inst.code))
+        else:
+            LOGGER.info("Free-form row for %s ignored", repr(course_inst.code))
+
 ### The One Externally-relevant Function
 courses_like_tables = XPath(RELATIVE_PREFIX+"/table[@border='0' and @width='100%' and @cellspacing='2' and @cellpadding='3']")
 def course_instances_from(results_page_tree, subject_code):
@@ -274,29 +301,7 @@ def course_instances_from(results_page_tree, subject_code):
         try:
             course_inst = parse_course_header(rows.pop(0), subject_code)
             for row in rows:
-                row = row[3:] # remove empties
-                # print [c.text for c in row]
-                # print etree.tostring(row)
-                if len(row) == 8:
-                    mtg_type = row[1].text
-                    if mtg_type in (config.INDEPENDENT_STUDY_CODE, config.PRACTICUM_CODE, config.CONFERENCE_CODE, config.CLINICAL_CLERKSHIP_CODE, config.FIELDWORK_CODE):
-                        raise ProblematicCourse
-                    elif mtg_type in (config.FINAL_CODE, config.MIDTERM_CODE, config.PROBLEM_SESSION_CODE, config.REVIEW_SESSION_CODE, config.MAKE_UP_SESSION_CODE):
-                        parse_one_shot(row, course_inst)
-                    elif mtg_type in (config.LECTURE_CODE, config.DISCUSSION_CODE, config.LAB_CODE, config.TUTORIAL_CODE, config.FILM_CODE, config.STUDIO_CODE):
-                        parse_unseated_meeting(row, course_inst)
-                    elif mtg_type == config.SEMINAR_CODE:
-                        parse_TBA_seminar_or_sect(row, course_inst)
-                    else:
-                        raise ValueError, "Unrecognized meeting type: "+repr(mtg_type)
-                elif len(row) == 11:#Discussion/Lab/Tutorial
-                    parse_seated_meeting(row, course_inst)
-                else:# Free-form; ignore
-                    if row and was_cancelled(row[-1]):
-                        LOGGER.info("A meeting of %s was cancelled", repr(course_inst.code))
-                    else:
-                        LOGGER.info("Free-form row for %s ignored", repr(course_inst.code))
-                    continue
+                parse_meeting_row(row[3:], course_inst) # remove empties
                 #FIXME: see if should ignore Final-less courses
                 #FIXME: Parse CAPE
                 #FIXME: See if should drop courseinstances w/ only TBA Tutorials
@@ -26,24 +26,38 @@ This module defines datatypes representing TritonLink Schedule of Classes data.
 """
 
 from __future__ import division
-from warnings import simplefilter as _simplefilter, catch_warnings as _catch_warnings
+from collections import Set as _Set
 
 from triton_scraper import config as _config
+from triton_scraper.util import SlotPickling as _SlotPickling
 from triton_scraper.locations import UnknownLocation as _UnknownLocation
 from triton_scraper.restriction_codes import restriction_code2description
 
-class DaysOfWeekSet(frozenset):
-    """A :class:`set` of days of the week.
+class DaysOfWeekSet(_Set):
+    """An immutable :class:`set` of days of the week.
 
     Each individual day is represented using its corresponding entry in :attr:`DAYS_IN_ORDER`.
 
-    Iterating over the set yields the days in their conventional ordering; Sunday is considered the first day of the week."""
+    Iterating over the set yields the days in their conventional ordering; Sunday is considered the first day of the week.
+    
+    Internally, the set is a 7-bit mask (see :attr:`mask`), so operations between two DaysOfWeekSets
+    (intersection, union, difference, containment, overlap) are single bitwise operations.
+    There is only ever one DaysOfWeekSet for a given combination of days, so they're cheap to create and share.
+    
+    DaysOfWeekSets are :class:`collections.Set`-s but not :class:`frozenset`-s. Mixing them with ordinary sets works like it does
+    between frozensets, except that a result holding anything other than day names is a plain :class:`frozenset`."""
+    # No __slots__: Python 2's collections.Set doesn't have any, so instances get a __dict__ regardless.
+    # (There are only ever 128 instances anyway.)
     
     #: Normalized day of the week abbrevations used by :class:`DaysOfWeekSet`, in order, starting with Sunday. A tuple of strings.
     DAYS_IN_ORDER = tuple('Sun Mon Tue Wed Thu Fri Sat'.split())
-    _DAYS_OF_WEEK_SET = set(DAYS_IN_ORDER)
+    _DAY2BIT = dict((day, 1 << index) for index, day in enumerate(DAYS_IN_ORDER))
+    _NUM_MASKS = 1 << len(DAYS_IN_ORDER)
     #: Day of the week abbreviations used by TritonLink, in order, starting with Sunday. A tuple of strings.
     UCSD_DAY_ABBEVIATIONS = tuple('Sun M Tu W Th F S'.split())
+    # Filled in below, once the class exists
+    _MASK2SET = []
+    _UCSD_ABBREVS2MASK = {}
     
     @classmethod
     def from_ucsd_abbrevs(cls, ucsd_abbreviated):
@@ -51,45 +65,170 @@ class DaysOfWeekSet(frozenset):
         
         :param ucsd_abbreviated: string representing a group of days of the week using TritonLink's day of the week abbreviations (see :attr:`UCSD_DAY_ABBEVIATIONS`; e.g. "TuTh")
         """
-        norm_days = set()
-        for index, name in enumerate(cls.UCSD_DAY_ABBEVIATIONS):
-            if ucsd_abbreviated.startswith(name):
-                ucsd_abbreviated = ucsd_abbreviated[len(name):]
-                norm_days.add(cls.DAYS_IN_ORDER[index])
-        if ucsd_abbreviated:
+        try:
+            return cls._MASK2SET[cls._UCSD_ABBREVS2MASK[ucsd_abbreviated]]
+        except KeyError:
             raise ValueError, "Unrecognized day name abbreviations: "+repr(ucsd_abbreviated)
-        return cls(norm_days)
     
-    def __init__(self, iterable):
+    @classmethod
+    def from_mask(cls, mask):
+        """Additional constructor.
+        
+        :param mask: bitmask of days; bit *i* represents the day ``DAYS_IN_ORDER[i]``
+        :type mask: int
+        """
+        if not 0 <= mask < cls._NUM_MASKS:
+            raise ValueError, "Invalid days of the week bitmask: "+repr(mask)
+        return cls._MASK2SET[mask]
+    
+    @classmethod
+    def _from_iterable(cls, iterable):
+        # Results of operations with ordinary sets, which may well contain things other than days
+        items = frozenset(iterable)
+        mask = 0
+        for item in items:
+            bit = cls._DAY2BIT.get(item)
+            if bit is None:
+                return items
+            mask |= bit
+        return cls._MASK2SET[mask]
+    
+    def __new__(cls, iterable=()):
+        if isinstance(iterable, DaysOfWeekSet):
+            return iterable
+        mask = 0
+        for day in iterable:
+            try:
+                mask |= cls._DAY2BIT[day]
+            except KeyError:
+                raise ValueError, "Non-day-names present"
+        return cls._MASK2SET[mask]
+    
+    def __init__(self, iterable=()):
         """Creates a new DaysOfWeekSet from an iterable containing strings from :attr:`DAYS_IN_ORDER`.
         The ordering of the strings doesn't matter."""
-        with _catch_warnings(): # Suppress irrelevant DeprecationWarning
-            _simplefilter("ignore")
-            frozenset.__init__(self, iterable)
-        if self - self._DAYS_OF_WEEK_SET:
-            raise ValueError, "Non-day-names present"
+    
+    @property
+    def mask(self):
+        """Bitmask of the days in the set; bit *i* is set iff ``DAYS_IN_ORDER[i]`` is in the set.
+        
+        :type: int
+        """
+        return self._mask
+    
+    def __reduce__(self):
+        return (DaysOfWeekSet, (self._days,))
+    
+    def __contains__(self, day):
+        return bool(self._mask & self._DAY2BIT.get(day, 0))
     
     def __iter__(self):
         """Yields day names in conventional order. A week is considered to start on Sunday."""
-        for day in self.DAYS_IN_ORDER:
-            if day in self:
-                yield day
+        return iter(self._days)
+    
+    def __len__(self):
+        return len(self._days)
+    
+    def __hash__(self):
+        return self._hash
+    
+    def __eq__(self, other):
+        if isinstance(other, DaysOfWeekSet):
+            return self is other
+        return _Set.__eq__(self, other)
+    
+    def __ne__(self, other):
+        return not self == other
+    
+    def __le__(self, other):
+        if isinstance(other, DaysOfWeekSet):
+            return not (self._mask & ~other._mask)
+        return _Set.__le__(self, other)
+    
+    def __ge__(self, other):
+        if isinstance(other, DaysOfWeekSet):
+            return not (other._mask & ~self._mask)
+        return _Set.__ge__(self, other)
+    
+    def __lt__(self, other):
+        if isinstance(other, DaysOfWeekSet):
+            return self is not other and self <= other
+        return _Set.__lt__(self, other)
+    
+    def __gt__(self, other):
+        if isinstance(other, DaysOfWeekSet):
+            return self is not other and self >= other
+        return _Set.__gt__(self, other)
+    
+    def __and__(self, other):
+        if isinstance(other, DaysOfWeekSet):
+            return self._MASK2SET[self._mask & other._mask]
+        return _Set.__and__(self, other)
+    
+    def __or__(self, other):
+        if isinstance(other, DaysOfWeekSet):
+            return self._MASK2SET[self._mask | other._mask]
+        return _Set.__or__(self, other)
+    
+    def __sub__(self, other):
+        if isinstance(other, DaysOfWeekSet):
+            return self._MASK2SET[self._mask & ~other._mask]
+        return _Set.__sub__(self, other)
+    
+    def __xor__(self, other):
+        if isinstance(other, DaysOfWeekSet):
+            return self._MASK2SET[self._mask ^ other._mask]
+        return _Set.__xor__(self, other)
+    
+    __rand__ = __and__
+    __ror__ = __or__
+    __rxor__ = __xor__
+    
+    def isdisjoint(self, other):
+        if isinstance(other, DaysOfWeekSet):
+            return not (self._mask & other._mask)
+        return _Set.isdisjoint(self, other)
+    
+    def overlaps(self, other):
+        """Do this set and the DaysOfWeekSet *other* have any days in common?
+        
+        :rtype: bool
+        """
+        return bool(self._mask & other._mask)
     
     def __repr__(self):
         return "{%s}" % (", ".join(self))
+
+def _init_days_of_week_tables():
+    for mask in xrange(DaysOfWeekSet._NUM_MASKS):
+        indices = [index for index in xrange(len(DaysOfWeekSet.DAYS_IN_ORDER)) if mask & (1 << index)]
+        days_set = object.__new__(DaysOfWeekSet)
+        days_set._mask = mask
+        days_set._days = tuple(DaysOfWeekSet.DAYS_IN_ORDER[index] for index in indices)
+        days_set._hash = hash(frozenset(days_set._days))
+        DaysOfWeekSet._MASK2SET.append(days_set)
+        ucsd_abbreviated = "".join(DaysOfWeekSet.UCSD_DAY_ABBEVIATIONS[index] for index in indices)
+        DaysOfWeekSet._UCSD_ABBREVS2MASK[ucsd_abbreviated] = mask
+_init_days_of_week_tables()
+del _init_days_of_week_tables
     
 _NORMAL_MEETING_TYPES = "lecture discussion lab tutorial seminar studio midterm problem_session review_session make_up_session film".split()
 def _meeting_type_name2code(type_name):
     return getattr(_config, type_name.upper()+"_CODE")
+_NORMAL_MEETING_TYPE_CODES = frozenset(_meeting_type_name2code(type_name) for type_name in _NORMAL_MEETING_TYPES)
 def add_meeting_list_properties(klass):
     for type_name in _NORMAL_MEETING_TYPES:
         property_name = type_name+"s"
-        extractor = lambda self, type_code=_meeting_type_name2code(type_name): self._code2meeting_list[type_code]
+        # Meeting lists are created lazily, so store an empty one on first access; that way appending to it isn't lost
+        extractor = lambda self, type_code=_meeting_type_name2code(type_name): self._code2meeting_list.setdefault(type_code, [])
         setattr(klass, property_name, property(extractor))
     return klass
 @add_meeting_list_properties
-class CourseInstance(object):
+class CourseInstance(_SlotPickling):
     """An instance of a course. Two instances of the same course typically have different instructors and/or lecture times."""
+    # A full term holds tens of thousands of these, so no per-instance __dict__,
+    # and meeting lists only exist for the meeting types the course actually has (or that have been asked for).
+    __slots__ = ('subject_code', 'course_number', 'name', 'restrictions', 'units', 'prerequisites_url', '_code2meeting_list', 'final', 'instructor')
     
     _FORMAT = '{0.code} "{0.name}" ({0.units} units) with {0.instructor}\n\tPrerequisites: {0.prerequisites_url}'
     def __init__(self, subject_code, course_number, name, units, restriction_codes=None, prerequisites_url=None):
@@ -119,7 +258,7 @@ class CourseInstance(object):
         #:
         #: :type: string or None
         self.prerequisites_url = prerequisites_url
-        self._code2meeting_list = dict( (_meeting_type_name2code(type_name), []) for type_name in _NORMAL_MEETING_TYPES)
+        self._code2meeting_list = {}
         #: Final exam
         #:
         #: :type: :class:`OneShotEvent`
@@ -173,28 +312,54 @@ class CourseInstance(object):
         :param meeting:
         :type meeting: 
         """
+        if meeting_type_code not in _NORMAL_MEETING_TYPE_CODES:
+            raise ValueError, "Unrecognized meeting type code: %s" % repr(meeting_type_code)
         try:
             self._code2meeting_list[meeting_type_code].append(meeting)
         except KeyError:
-            raise ValueError, "Unrecognized meeting type code: %s" % repr(mtg_type)
-        else:
-            if self.instructor is None and hasattr(meeting, 'instructor') and meeting.instructor is not None and not isinstance(meeting.instructor, InstructorTBA):
-                self.instructor = meeting.instructor
+            self._code2meeting_list[meeting_type_code] = [meeting]
+        if self.instructor is None and hasattr(meeting, 'instructor') and meeting.instructor is not None and not isinstance(meeting.instructor, InstructorTBA):
+            self.instructor = meeting.instructor
     
     def __bool__(self):
-        return any(meeting_list for meeting_list in self._code2meeting_list.values())
+        return any(meeting_list for meeting_list in self._code2meeting_list.itervalues())
 del add_meeting_list_properties
 
 
 _STAFF = "Staff"
-class Instructor(object):
+class Instructor(_SlotPickling):
     """A known course instructor."""
+    __slots__ = ('first_name', 'last_name', 'email')
     __FORMAT = "{0.first_name} {0.last_name} <{0.email}>"
+    _NAME2OBJ = {}
+
+    @classmethod
+    def for_name(cls, last, first, email=None):
+        """Gives the canonical :class:`Instructor` object with the given name, creating it if necessary.
+        There is only one canonical object per (last name, first name) pair, shared by every meeting they teach.
+        If the canonical object doesn't yet know the instructor's email address and *email* is given, it gets filled in.
+        
+        :param last: the instructor's surname
+        :type last: string
+        :param first: the instructor's given name
+        :type first: string
+        :param email: the instructor's email address
+        :type email: string or None
+        :rtype: :class:`Instructor`
+        """
+        key = (last, first)
+        try:
+            instructor = cls._NAME2OBJ[key]
+        except KeyError:
+            instructor = cls._NAME2OBJ.setdefault(key, cls(last, first, email))
+        if email is not None and instructor.email is None:
+            instructor.email = email
+        return instructor
 
     @classmethod
     def from_full_name(cls, full_name, email=None):
         """Alternate constructor. Parses out the instructor's first and last names from their full name.
-        May return an :class:`InstructorTBA` if they are TBA.
+        May return an :class:`InstructorTBA` if they are TBA. Returns canonical objects (see :meth:`for_name`).
         
         :param full_name: the instructor's full name (e.g. "Doe, John")
         :type full_name: string
@@ -207,7 +372,7 @@ class Instructor(object):
             index = full_name.rindex(",")
             full_name = full_name[:index]+full_name[index+1:]
         last, first = full_name.split(", ")
-        return cls(last, first, email)
+        return cls.for_name(last, first, email)
 
     def __init__(self, last, first, email=None):
         #: Instructor's given name
@@ -233,14 +398,24 @@ class Instructor(object):
     
     def __eq__(self, other):
         """Instructors with the same first and last name are equal to each other"""
-        return not isinstance(other, InstructorTBA) and self.__key == other.__key
+        return isinstance(other, Instructor) and self.__key == other.__key
     
     def __ne__(self, other):
         return not self == other
+    
+    def __hash__(self):
+        return hash(self.__key)
 
 
-class InstructorTBA(object):
-    """An as-yet-unknown instructor."""
+class InstructorTBA(_SlotPickling):
+    """An as-yet-unknown instructor. There is only ever one instance of this class."""
+    __slots__ = ()
+    _INSTANCE = None
+    def __new__(cls):
+        if cls._INSTANCE is None:
+            cls._INSTANCE = object.__new__(cls)
+        return cls._INSTANCE
+    
     def __init__(self):
         pass
     
@@ -253,3 +428,6 @@ class InstructorTBA(object):
     
     def __ne__(self, other):
         return not self == other
+    
+    def __hash__(self):
+        return hash(InstructorTBA)
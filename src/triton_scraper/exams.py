@@ -0,0 +1,173 @@
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module indexes a term's exams (finals and midterms) by date, time slot, and room,
+for finding exam conflicts between courses and rooms booked for two exams at once.
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+from collections import namedtuple as _namedtuple
+
+from triton_scraper import config as _config
+from triton_scraper.locations import Location as _Location
+from triton_scraper.conflicts import meetings_overlap as _meetings_overlap
+
+#: An exam of a course instance.
+#:
+#: course_instance
+#:     The course instance the exam is for
+#: meeting
+#:     When and where the exam is; a :class:`OneShotMeeting`
+#: type_code
+#:     TritonLink meeting type code; the final's or the midterm's
+Exam = _namedtuple('Exam', "course_instance meeting type_code")
+
+#: Two exams in the same room at overlapping times
+DoubleBooking = _namedtuple('DoubleBooking', "room exam other_exam")
+
+def _append_to(mapping, key, value):
+    try:
+        mapping[key].append(value)
+    except KeyError:
+        mapping[key] = [value]
+
+class ExamIndex(object):
+    """Exams of many course instances (typically an entire term), indexed by date, by time slot, and by room.
+    Room double-bookings are detected as exams are added. Exams whose date is TBA aren't indexed."""
+    def __init__(self, course_instances=()):
+        """
+        :param course_instances: course instances whose finals and midterms to index
+        :type course_instances: iterable of :class:`CourseInstance`-s
+        """
+        self._date2exams = {}
+        self._slot2exams = {} # (date, start time, end time) -> exams
+        self._room_date2exams = {} # (room, date) -> exams
+        self._course2exams = {}
+        self._double_bookings = []
+        for course_inst in course_instances:
+            self.add_course_instance(course_inst)
+
+    def add_course_instance(self, course_inst):
+        """Indexes the final and midterms of *course_inst*.
+
+        :type course_inst: :class:`CourseInstance`
+        """
+        if course_inst in self._course2exams:
+            return
+        exams = self._course2exams[course_inst] = []
+        if course_inst.final is not None:
+            exams.append(Exam(course_inst, course_inst.final, _config.FINAL_CODE))
+        exams.extend(Exam(course_inst, midterm, _config.MIDTERM_CODE) for midterm in course_inst.midterms)
+        for exam in exams:
+            self._add(exam)
+
+    def _add(self, exam):
+        meeting = exam.meeting
+        date = getattr(meeting, 'date', None)
+        if date is None:
+            return
+        _append_to(self._date2exams, date, exam)
+        start_time = getattr(meeting, 'start_time', None)
+        if start_time is not None:
+            _append_to(self._slot2exams, (date, start_time, meeting.end_time), exam)
+        room = getattr(meeting, 'location', None)
+        if isinstance(room, _Location):
+            key = (room, date)
+            for other in self._room_date2exams.get(key, ()):
+                if other.course_instance is not exam.course_instance and _meetings_overlap(meeting, other.meeting):
+                    self._double_bookings.append(DoubleBooking(room, other, exam))
+            _append_to(self._room_date2exams, key, exam)
+
+    ### Queries
+    def exams_on(self, date):
+        """Exams held on the given date.
+
+        :type date: :class:`datetime.date`
+        :rtype: list of :class:`Exam`-s
+        """
+        return list(self._date2exams.get(date, ()))
+
+    def exams_in_slot(self, date, start_time, end_time):
+        """Exams held exactly from *start_time* to *end_time* on *date* (e.g. one of finals week's exam slots).
+
+        :type date: :class:`datetime.date`
+        :type start_time: :class:`datetime.time`
+        :type end_time: :class:`datetime.time`
+        :rtype: list of :class:`Exam`-s
+        """
+        return list(self._slot2exams.get((date, start_time, end_time), ()))
+
+    @property
+    def slots(self):
+        """Distinct (date, start time, end time) exam slots, in chronological order.
+
+        :type: list of tuples
+        """
+        return sorted(self._slot2exams)
+
+    def exams_in_room(self, room, date):
+        """Exams held in *room* on *date*.
+
+        :type room: :class:`Location`
+        :type date: :class:`datetime.date`
+        :rtype: list of :class:`Exam`-s
+        """
+        return list(self._room_date2exams.get((room, date), ()))
+
+    def exams_of(self, course_inst):
+        """Indexed exams of *course_inst*.
+
+        :type course_inst: :class:`CourseInstance`
+        :rtype: list of :class:`Exam`-s
+        """
+        return list(self._course2exams.get(course_inst, ()))
+
+    def conflicts_among(self, course_instances):
+        """Pairs of exams of different course instances among *course_instances* which take place at overlapping times.
+        Only exams on the same date are compared.
+
+        :param course_instances: e.g. the courses someone plans to take
+        :type course_instances: iterable of :class:`CourseInstance`-s
+        :rtype: list of (:class:`Exam`, :class:`Exam`) pairs
+        """
+        date2exams = {}
+        for course_inst in course_instances:
+            for exam in self._course2exams.get(course_inst, ()):
+                date = getattr(exam.meeting, 'date', None)
+                if date is not None:
+                    _append_to(date2exams, date, exam)
+        conflicts = []
+        for exams in date2exams.itervalues():
+            for index, exam in enumerate(exams):
+                for other in exams[index + 1:]:
+                    if exam.course_instance is not other.course_instance and _meetings_overlap(exam.meeting, other.meeting):
+                        conflicts.append((exam, other))
+        return conflicts
+
+    @property
+    def double_bookings(self):
+        """Rooms booked for exams of two different course instances at overlapping times.
+
+        :type: list of :class:`DoubleBooking`-s
+        """
+        return list(self._double_bookings)
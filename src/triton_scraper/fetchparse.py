@@ -28,7 +28,9 @@ This module handles fetching webpages from the internet and parsing them into :c
 from contextlib import closing
 import errno
 from socket import error as SocketError
-from time import sleep
+from time import sleep, time
+from threading import Thread, Lock, Event
+from Queue import Queue, Empty
 from cStringIO import StringIO
 import re
 from cookielib import CookieJar
@@ -67,7 +69,7 @@ def make_tree4url():
     :rtype: function
     """
     opener = build_opener(HTTPCookieProcessor(CookieJar()))
-    def tree4url(url, post_args=None, hack_around_broken_html=False):
+    def tree4url(url, post_args=None, hack_around_broken_html=False, max_tries=None):
         """Fetches and parses the webpage at the given URL.
         Cookies are accepted and presented to the server when necessary. Cookies are persistent across calls to the same tree4url.
         Identifies itself using the User-agent string specified in the TritonScraper configuration file.
@@ -78,6 +80,8 @@ def make_tree4url():
         :type post_args: dict of strings to (possibly lists of) strings
         :param hack_around_broken_html: do we need to use our hack to fix TritonLink's broken HTML so that :mod:`lxml` can parse it?
         :type hack_around_broken_html: bool
+        :param max_tries: how many times to try before giving up and reraising the last error; None to keep retrying forever
+        :type max_tries: int or None
         :returns: HTML element tree of the webpage and actual URL browsed to (after redirects etc.)
         :rtype: tuple of :class:`lxml.etree.ElementTree` and string
         """
@@ -86,7 +90,9 @@ def make_tree4url():
         req.add_header('User-agent', config.USER_AGENT)
         data = urlencode(post_args, doseq=True) if post_args is not None else None
         LOGGER.debug("Browsing URL %s with POST data %s", url, post_args)
+        tries = 0
         while True:
+            tries += 1
             try:
                 with closing(opener.open(req, data, config.SOCKET_TIMEOUT)) as f:
                     tree = _parse_html(f, hack_around_broken_html)
@@ -101,11 +107,105 @@ def make_tree4url():
                     description = "%s: %s" % (type(ioe.reason), list(ioe.reason))
                 except (AttributeError, TypeError):
                     description = str(ioe)
+                if max_tries is not None and tries >= max_tries:
+                    LOGGER.error("Encountered I/O-related error (%s: %s) when trying to open URL %s with POST data %s; giving up after %d tries", type(ioe), description, repr(url), data, tries)
+                    raise
                 LOGGER.error("Encountered I/O-related error (%s: %s) when trying to open URL %s with POST data %s; waiting & retrying...", type(ioe), description, repr(url), data)
                 sleep(config.RETRY_DELAY)
                 continue
             except BadStatusLine:
+                if max_tries is not None and tries >= max_tries:
+                    LOGGER.error("Encountered bad HTTP status line when trying to open URL %s with POST data %s; giving up after %d tries", repr(url), data, tries)
+                    raise
                 LOGGER.error("Encountered bad HTTP status line when trying to open URL %s with POST data %s; waiting & retrying...", repr(url), data)
                 sleep(config.RETRY_DELAY)
                 continue
     return tree4url
+
+### Fetching many pages at once
+class RateLimiter(object):
+    """Spaces out events (e.g. HTTP requests) made from any number of threads so that they happen at most at a given rate."""
+    def __init__(self, max_per_second):
+        """
+        :param max_per_second: maximum number of events per second; None or 0 for no limit
+        :type max_per_second: float or None
+        """
+        self._interval = 1.0 / max_per_second if max_per_second else 0.0
+        self._lock = Lock()
+        self._next_slot = 0.0
+    
+    def wait(self):
+        """Blocks until the calling thread may proceed with its next event."""
+        with self._lock:
+            now = time()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._interval
+        if slot > now:
+            sleep(slot - now)
+
+def _drain(queue):
+    try:
+        while True:
+            queue.get_nowait()
+    except Empty:
+        pass
+
+def fetch_trees(urls, num_workers=config.FETCH_WORKERS, max_requests_per_second=config.MAX_REQUESTS_PER_SECOND, hack_around_broken_html=False, rate_limiter=None):
+    """Fetches and parses many webpages concurrently, using a pool of worker threads which each have their own :func:`tree4url`.
+    Results are produced as pages finish downloading; at most a few pages are held waiting for the caller to consume them.
+    
+    :param urls: URLs to fetch
+    :type urls: iterable of strings
+    :param num_workers: number of worker threads
+    :type num_workers: int
+    :param max_requests_per_second: overall request rate limit; None or 0 for no limit
+    :type max_requests_per_second: float or None
+    :param hack_around_broken_html: as for :func:`tree4url`
+    :type hack_around_broken_html: bool
+    :param rate_limiter: limiter to share with other fetches (e.g. other concurrent :func:`fetch_trees` calls); overrides *max_requests_per_second*
+    :type rate_limiter: :class:`RateLimiter`
+    :returns: URL and HTML element tree of each webpage, in completion order
+    :rtype: generator of (string, :class:`lxml.etree.ElementTree`) tuples
+    """
+    urls = list(urls)
+    if not urls:
+        return
+    pending = Queue()
+    for url in urls:
+        pending.put(url)
+    done = Queue(maxsize=2 * num_workers)
+    stop = Event()
+    limiter = rate_limiter if rate_limiter is not None else RateLimiter(max_requests_per_second)
+    def work():
+        tree4url = make_tree4url()
+        while not stop.is_set():
+            try:
+                url = pending.get_nowait()
+            except Empty:
+                return
+            limiter.wait()
+            if stop.is_set():
+                return
+            try:
+                tree, _real_url = tree4url(url, hack_around_broken_html=hack_around_broken_html)
+            except Exception as exc:
+                done.put((url, None, exc))
+            else:
+                done.put((url, tree, None))
+    for i in xrange(min(num_workers, len(urls))):
+        worker = Thread(target=work, name="fetch_trees worker %d" % i)
+        worker.daemon = True
+        worker.start()
+    try:
+        for i in xrange(len(urls)):
+            url, tree, exc = done.get()
+            if exc is not None:
+                raise exc
+            yield url, tree
+    finally:
+        # The caller stopped early (or a fetch failed): cancel what hasn't started, then make room in *done*.
+        # With *pending* empty each worker puts at most one more result, which the emptied *done* always has room for,
+        # so no worker stays blocked on it.
+        stop.set()
+        _drain(pending)
+        _drain(done)
@@ -0,0 +1,181 @@
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module exports course instances as `JSON Lines <http://jsonlines.org/>`_: one JSON object per :class:`CourseInstance`, one per line.
+
+Course instances are written one at a time as they're produced (e.g. by :meth:`TritonBrowser.all_classes_during`),
+and records are read back one at a time, so memory use doesn't grow with the size of the term.
+Files whose names end in ``.gz`` are gzip-compressed.
+
+Each record has the keys ``subject_code``, ``course_number``, ``name``, ``units`` (null if variable), ``prerequisites_url``,
+``restrictions`` (sorted list of descriptions), ``instructor``, ``meetings`` (list), and ``final`` (a meeting, or null).
+Each meeting has the keys ``type`` (TritonLink meeting type code), ``section_number``, ``start_time`` and ``end_time`` ("HH:MM", or null if TBA),
+``location``, and, depending on the kind of meeting, ``date`` ("YYYY-MM-DD"), ``days`` (list of :attr:`DaysOfWeekSet.DAYS_IN_ORDER` entries),
+``instructor``, ``section_id``, ``available_seats``, and ``total_seats`` (null for unlimited seating).
+Instructors are objects with ``first_name``, ``last_name``, and ``email`` keys, or "TBA";
+locations are objects with ``building`` (code) and ``room`` keys, or "TBA", or null if unknown.
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+try:
+    import simplejson as _json # much faster than the standard library's json on older Pythons
+except ImportError:
+    import json as _json
+from gzip import GzipFile as _GzipFile
+from io import BufferedReader as _BufferedReader
+
+from triton_scraper import config as _config
+from triton_scraper.util import INFINITY as _INFINITY
+from triton_scraper.datatypes import Instructor as _Instructor, InstructorTBA as _InstructorTBA
+from triton_scraper.locations import Location as _Location, LocationTBA as _LocationTBA
+from triton_scraper.meetings import SeatedMeeting as _SeatedMeeting
+
+#: Filename extension which makes :func:`dump` and :func:`load` use gzip compression
+GZIP_EXTENSION = ".gz"
+_TBA = "TBA"
+_TIME_FORMAT = "%H:%M"
+
+_encode = _json.JSONEncoder(separators=(',', ':'), allow_nan=False).encode
+_decode = _json.JSONDecoder().decode
+
+def _instructor_record(instructor):
+    if isinstance(instructor, _Instructor):
+        return {'first_name': instructor.first_name, 'last_name': instructor.last_name, 'email': instructor.email}
+    if isinstance(instructor, _InstructorTBA):
+        return _TBA
+    return None
+
+def _location_record(location):
+    if isinstance(location, _Location):
+        return {'building': location.building.code, 'room': location.room_number}
+    if isinstance(location, _LocationTBA):
+        return _TBA
+    return None
+
+def _seats_record(seats):
+    return None if seats == _INFINITY else seats
+
+def meeting_record(type_code, meeting):
+    """JSON-compatible representation of *meeting*.
+
+    :param type_code: TritonLink meeting type code of the meeting; e.g. "LE"
+    :type type_code: string
+    :rtype: dict
+    """
+    start_time = getattr(meeting, 'start_time', None)
+    record = {
+        'type': type_code,
+        'section_number': meeting.section_number,
+        'start_time': start_time.strftime(_TIME_FORMAT) if start_time is not None else None,
+        'end_time': meeting.end_time.strftime(_TIME_FORMAT) if start_time is not None else None,
+        'location': _location_record(getattr(meeting, 'location', None)),
+    }
+    date = getattr(meeting, 'date', None)
+    if date is not None:
+        record['date'] = date.isoformat()
+    days = getattr(meeting, 'days', None)
+    if days is not None:
+        record['days'] = list(days)
+    if hasattr(meeting, 'instructor'):
+        record['instructor'] = _instructor_record(meeting.instructor)
+    if isinstance(meeting, _SeatedMeeting):
+        record['section_id'] = meeting.section_id
+        record['available_seats'] = _seats_record(meeting.available_seats)
+        record['total_seats'] = _seats_record(meeting.total_seats)
+    return record
+
+def course_instance_record(course_inst):
+    """JSON-compatible representation of *course_inst*.
+
+    :type course_inst: :class:`CourseInstance`
+    :rtype: dict
+    """
+    units = course_inst.units
+    return {
+        'subject_code': course_inst.subject_code,
+        'course_number': course_inst.course_number,
+        'name': course_inst.name,
+        'units': units if units == units else None, # NaN != NaN
+        'prerequisites_url': course_inst.prerequisites_url,
+        'restrictions': sorted(course_inst.restrictions),
+        'instructor': _instructor_record(course_inst.instructor),
+        'meetings': [meeting_record(type_code, meeting) for type_code, meeting_list in sorted(course_inst._code2meeting_list.iteritems()) for meeting in meeting_list],
+        'final': meeting_record(_config.FINAL_CODE, course_inst.final) if course_inst.final is not None else None,
+    }
+
+def write(course_instances, out_file):
+    """Writes one line of JSON per course instance to *out_file*, as the course instances are produced.
+
+    :param course_instances: course instances to write; e.g. from :meth:`TritonBrowser.all_classes_during`
+    :type course_instances: iterable of :class:`CourseInstance`-s
+    :param out_file: file to write to
+    :type out_file: file-like object
+    :returns: number of course instances written
+    :rtype: int
+    """
+    count = 0
+    for course_inst in course_instances:
+        out_file.write(_encode(course_instance_record(course_inst)))
+        out_file.write("\n")
+        count += 1
+    return count
+
+def read(in_file):
+    """Lazily reads JSON Lines records written by :func:`write` from *in_file*. Blank lines are skipped.
+
+    :param in_file: file to read from
+    :type in_file: file-like object
+    :rtype: generator of dicts
+    """
+    for line in in_file:
+        if line.strip():
+            yield _decode(line)
+
+def dump(course_instances, filepath):
+    """Writes course instances to the file *filepath* as JSON Lines, gzip-compressed if *filepath* ends with :const:`GZIP_EXTENSION`.
+
+    :type course_instances: iterable of :class:`CourseInstance`-s
+    :type filepath: string
+    :returns: number of course instances written
+    :rtype: int
+    """
+    if filepath.endswith(GZIP_EXTENSION):
+        out_file = _GzipFile(filepath, 'wb')
+    else:
+        out_file = open(filepath, 'wb')
+    with out_file:
+        return write(course_instances, out_file)
+
+def load(filepath):
+    """Lazily reads JSON Lines records from the file *filepath*, which is gzip-compressed if it ends with :const:`GZIP_EXTENSION`.
+
+    :type filepath: string
+    :rtype: generator of dicts
+    """
+    if filepath.endswith(GZIP_EXTENSION):
+        in_file = _BufferedReader(_GzipFile(filepath, 'rb')) # GzipFile's own line iteration is slow
+    else:
+        in_file = open(filepath, 'rb')
+    with in_file:
+        for record in read(in_file):
+            yield record
@@ -20,6 +20,7 @@
 
 """
 This module defines datatypes for UCSD campus locations and also fetches and holds data about known campus locations.
+The building code table is loaded lazily and cached on disk; see :mod:`triton_scraper.reference_tables`.
 
 :copyright: (c) 2010 by Christopher Rebert.
 :license: MIT, see :file:`LICENSE.txt` for more details.
@@ -27,12 +28,13 @@ This module defines datatypes for UCSD campus locations and also fetches and hol
 
 from triton_scraper.config import BUILDING_CODE_URL
 from triton_scraper.util import *
-from triton_scraper.fetchparse import make_tree4url
+from triton_scraper.reference_tables import ReferenceTable as _ReferenceTable
 
 _TO_BE_ANNOUNCED = "TBA"
 
-class Location(object):
+class Location(SlotPickling):
     """A known campus location."""
+    __slots__ = ('building', 'room_number')
     @classmethod
     def new(cls, bldg, room):
         if not bldg and not room:
@@ -64,18 +66,22 @@ class Location(object):
     
     @property
     def __key(self):
-        return (self.building_code, self.room_number)
+        return (self.building, self.room_number)
     
     def __eq__(self, other):
         """Locations with the same building code and room number are equal to each other"""
         return isinstance(other, Location) and self.__key == other.__key
     
+    def __hash__(self):
+        return hash(self.__key)
+    
     def __ne__(self, other):
         return not self == other
 
 
-class UnknownLocation(object):
+class UnknownLocation(SlotPickling):
     """An unknown campus location."""
+    __slots__ = ()
     def __init__(self):
         pass
     
@@ -87,10 +93,14 @@ class UnknownLocation(object):
     
     def __ne__(self, other):
         return not self == other
+    
+    def __hash__(self):
+        return hash(UnknownLocation)
 
 
-class LocationTBA(object):
+class LocationTBA(SlotPickling):
     """A campus location which has yet To Be Announced."""
+    __slots__ = ()
     def __init__(self):
         pass
     
@@ -102,22 +112,37 @@ class LocationTBA(object):
     
     def __ne__(self, other):
         return not self == other
+    
+    def __hash__(self):
+        return hash(LocationTBA)
 
 
 building_info_table_texts = XPath(RELATIVE_PREFIX+"/tr[not(@bgColor)]/td/text()")
-class Building(object):
-    _CODE2OBJ = {}
+class Building(SlotPickling):
+    __slots__ = ('code', 'name', 'area')
+    
+    @classmethod
+    def _code2obj(cls):
+        """Mapping from UCSD building codes to :class:`Building`-s, loaded on first use (see :mod:`triton_scraper.reference_tables`)."""
+        return _BUILDINGS.get()
     
     @classmethod
-    def for_code(cls, building_code):
+    def for_code(cls, building_code, known_buildings=None):
         """Gives the :class:`Building` object corresponding to the given UCSD building code.
         
         :param building_code: UCSD campus building code (e.g. CSB)
         :type building_code: string
+        :param known_buildings: buildings to look among first (e.g. those of a loaded snapshot), so that the building code table
+            only has to be loaded for codes which aren't among them
+        :type known_buildings: iterable of :class:`Building`-s or None
         :rtype: :class:`Building`
         """
+        if known_buildings is not None:
+            for building in known_buildings:
+                if building.code == building_code:
+                    return building
         try:
-            return cls._CODE2OBJ[building_code]
+            return cls._code2obj()[building_code]
         except KeyError:
             raise KeyError, "No such building known by code %s" % repr(building_code)
     
@@ -135,25 +160,58 @@ class Building(object):
     __FORMAT = "{0.name} ({0.code}) in {0.area}"
     def __str__(self):
         return self.__FORMAT.format(self)
+    
+    def __eq__(self, other):
+        """Buildings with the same building code are equal to each other, even if they're different objects (e.g. one was loaded from a snapshot)"""
+        return isinstance(other, Building) and self.code == other.code
+    
+    def __ne__(self, other):
+        return not self == other
+    
+    def __hash__(self):
+        return hash(self.code)
+
+def buildings_from(tree):
+    """Parses the UCSD building code explanation webpage.
+    
+    :param tree: HTML element tree of the webpage at :const:`BUILDING_CODE_URL`
+    :type tree: :class:`lxml.etree.ElementTree`
+    :returns: mapping from building codes to the corresponding buildings
+    :rtype: dict of strings to :class:`Building`-s
+    """
+    code2building = {}
+    for quadruple in grouper(4, building_info_table_texts(tree)):
+        code, name, area, _map_num = (s.strip() for s in quadruple)
+        code2building[code] = Building(code, name, area)
+    return code2building
+
+def _building_rows_from(tree):
+    return sorted([code, building.name, building.area] for code, building in buildings_from(tree).iteritems())
+
+def _add_hacks(code2building):
+    # Begin total HACKS
+    code2building["LEDDN"] = code2building["LEDDN AUD"] # Dammit TritonLink, "AUD" isn't a room!
+    code2building["CPMC"] = Building("CPMC", "Conrad Prebys Music Center", "Sixth") # TritonLink is outdated. Sixth is a guess.
+    code2building["OTRSN"] = Building("OTRSN", "Otterson Hall (i.e. Rady School)", "Roosevelt") # TritonLink is outdated
+    code2building["TM102"] = Building("TM102", "TM102", "TM102") # Mystery building not in building code index
+    code2building["MYR-A"] = Building("MYR-A", '"MYR-A"', "MYR-A") # Mystery building not in building code index
+    code2building["SPIES"] = Building("SPIES", "SPIES", "SIO") # Mystery building not in building code index. SIO is a guess.
+    #       Less confusing
+    code2building["CSB"].code = "CogSci (a.k.a. CSB)" # CSB != CompSci Bldg
+    #       Reflect situation on the ground :-)
+    cse = code2building["EBU3B"]
+    cse.code = "CSE (a.k.a. %s)" % cse.code
+    cse.name = "Computer Science & Engineering Building (a.k.a. %s)" % cse.name
+
+def _code2building_from(rows):
+    code2building = dict((code, Building(code, name, area)) for code, name, area in rows)
+    _add_hacks(code2building)
+    return code2building
+
+def _merge_new_buildings(code2building, rows):
+    # Existing Building objects are kept, since Locations refer to them
+    for code, name, area in rows:
+        if code not in code2building:
+            code2building[code] = Building(code, name, area)
 
-# Initialize Building._CODE2OBJ
-tree = make_tree4url()(BUILDING_CODE_URL)[0]
-for quadruple in grouper(4, building_info_table_texts(tree)):
-    code, name, area, _map_num = (s.strip() for s in quadruple)
-    Building._CODE2OBJ[code] = Building(code, name, area)
-del quadruple, tree, code, name, area, _map_num
-
-# Begin total HACKS
-Building._CODE2OBJ["LEDDN"] = Building._CODE2OBJ["LEDDN AUD"] # Dammit TritonLink, "AUD" isn't a room!
-Building._CODE2OBJ["CPMC"] = Building("CPMC", "Conrad Prebys Music Center", "Sixth") # TritonLink is outdated. Sixth is a guess.
-Building._CODE2OBJ["OTRSN"] = Building("OTRSN", "Otterson Hall (i.e. Rady School)", "Roosevelt") # TritonLink is outdated
-Building._CODE2OBJ["TM102"] = Building("TM102", "TM102", "TM102") # Mystery building not in building code index
-Building._CODE2OBJ["MYR-A"] = Building("MYR-A", '"MYR-A"', "MYR-A") # Mystery building not in building code index
-Building._CODE2OBJ["SPIES"] = Building("SPIES", "SPIES", "SIO") # Mystery building not in building code index. SIO is a guess.
-#       Less confusing
-Building._CODE2OBJ["CSB"].code = "CogSci (a.k.a. CSB)" # CSB != CompSci Bldg
-#       Reflect situation on the ground :-)
-cse = Building._CODE2OBJ["EBU3B"]
-cse.code = "CSE (a.k.a. %s)" % cse.code
-cse.name = "Computer Science & Engineering Building (a.k.a. %s)" % cse.name
-del cse
+_BUILDINGS = _ReferenceTable("building_codes", BUILDING_CODE_URL, _building_rows_from, _code2building_from, _merge_new_buildings)
@@ -25,11 +25,22 @@ This module defines datatypes to represent UCSD course meetings.
 :license: MIT, see :file:`LICENSE.txt` for more details.
 """
 
-from triton_scraper.util import INFINITY as _INFINITY
+from __future__ import division
+
+from triton_scraper.util import INFINITY as _INFINITY, SlotPickling as _SlotPickling
 from triton_scraper.bookstore import books_on as _books_on
+from triton_scraper.locations import UnknownLocation as _UnknownLocation
+
+class _MeetingSlots(_SlotPickling):
+    """Storage shared by all meeting classes.
+    The meeting classes add no slots of their own (besides :attr:`OneShotMeeting.date`), which is what allows
+    :class:`RecurringSeatedMeeting` to inherit from both :class:`RecurringMeeting` and :class:`SeatedMeeting`.
+    Slots a given kind of meeting doesn't use are simply left unset."""
+    __slots__ = ('start_time', 'end_time', 'location', 'section_number', 'days', 'instructor', 'section_id', 'available_seats', 'total_seats', '_bookstore_url', '_booklist')
 
-class Meeting(object):
+class Meeting(_MeetingSlots):
     """A meeting with known start and end times."""
+    __slots__ = ()
     def __init__(self, start_time, end_time, location=None, section_number=None):
         #: Time of day when the meeting starts.
         #:
@@ -71,6 +82,7 @@ class Meeting(object):
 
 class OneShotMeeting(Meeting):
     """An meeting which is not recurring (i.e. happens only once)."""
+    __slots__ = ('date',)
     def __init__(self, date, start_time, end_time, location=None):
         Meeting.__init__(self, start_time=start_time, end_time=end_time, location=location, section_number=None)
         #: The date when the meeting takes place.
@@ -94,6 +106,7 @@ class OneShotMeeting(Meeting):
 
 class RecurringMeeting(Meeting):
     """A recurring meeting."""
+    __slots__ = ()
     def __init__(self, section_number, instructor, start_time, end_time, days, location=None):
         Meeting.__init__(self, start_time=start_time, end_time=end_time, section_number=section_number, location=location)
         #: Days of the week which the meeting is held on.
@@ -113,8 +126,9 @@ class RecurringMeeting(Meeting):
     def __repr__(self):
         return self._num_days_times_loc
 
-class SeatedMeeting(object): #TBA
+class SeatedMeeting(_MeetingSlots): #TBA
     """A meeting with limited seating."""
+    __slots__ = ()
     def __init__(self, section_id, section_number, instructor, available_seats, total_seats, bookstore_url):
         #: The globally-unique identifying number for this meeting; e.g. 698362
         #:
@@ -175,7 +189,7 @@ class SeatedMeeting(object): #TBA
         elif self.available_seats < 0:
             return (abs(self.available_seats) + self.total_seats) / self.total_seats
         else:
-            return self.available_seats / self.total_seats
+            return (self.total_seats - self.available_seats) / self.total_seats
     
     @property
     def _seats_str(self):
@@ -187,13 +201,19 @@ class SeatedMeeting(object): #TBA
     @property
     def booklist(self):
         """Textbooks for the meeting. None if the UCSD Bookstore hasn't received a booklist for the course.
+        Booklists attached by :func:`bookstore.prefetch_booklists` are used as-is; otherwise they're fetched on demand,
+        cached and shared between sections with the same Bookstore page (see :data:`bookstore.BOOKLIST_CACHE`).
 
         :type: :class:`BookList`
         """
+        booklist = getattr(self, '_booklist', None)
+        if booklist is not None:
+            return booklist
         return _books_on(self._bookstore_url)
 
 class RecurringSeatedMeeting(RecurringMeeting, SeatedMeeting):
     """A recurring meeting with limited seating."""
+    __slots__ = ()
     def __init__(self, section_id, section_number, instructor, start_time, end_time, days, available_seats, total_seats, bookstore_url, location=None):
         RecurringMeeting.__init__(self, section_number=section_number, instructor=instructor, start_time=start_time, end_time=end_time, days=days, location=location)
         SeatedMeeting.__init__(self, section_id=section_id, section_number=section_number, instructor=instructor, available_seats=available_seats, total_seats=total_seats, bookstore_url=bookstore_url)
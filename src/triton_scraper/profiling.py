@@ -0,0 +1,213 @@
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module provides opt-in instrumentation of :mod:`triton_scraper.course_results_parsing`.
+
+While profiling is enabled, the parser's phase functions and XPath queries are swapped out for timed wrappers
+which record call counts and cumulative wall-clock time. When profiling is disabled, the original functions are put back,
+so the parser runs exactly as fast as if this module had never been imported.
+
+Times are cumulative in the :mod:`cProfile` sense: a phase's time includes the time of the phases it calls.
+
+Example::
+
+    from triton_scraper import profiling
+    profile = profiling.enable()
+    for course in browser.classes_for("FA10", "CSE"):
+        pass
+    profiling.disable()
+    print profile
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+from contextlib import contextmanager as _contextmanager
+from timeit import default_timer as _timer
+
+from triton_scraper import course_results_parsing as _parsing
+from triton_scraper.util import XPath as _XPath
+
+#: Names of the parse phase functions in :mod:`triton_scraper.course_results_parsing` which get timed
+PHASES = ("next_result_page_url", "remove_field_header_rows_in", "parse_course_header", "extract_units", "extract_JavaScript_link", "parse_start_end_times", "parse_unseated_meeting", "parse_seated_meeting", "parse_TBA_seminar_or_sect", "parse_one_shot", "parse_seating", "parse_instructor", "parse_ucsd_date", "new_location")
+#: Prefix of the names under which XPath query timings are recorded
+XPATH_PREFIX = "xpath:"
+#: Prefix of the names under which per-meeting-type row timings are recorded
+MEETING_TYPE_PREFIX = "meeting_type:"
+_FREE_FORM = "free-form"
+
+class PhaseStats(object):
+    """Call count and cumulative time for a single parse phase."""
+    def __init__(self):
+        #: Number of calls made
+        #:
+        #: :type: int
+        self.calls = 0
+        #: Total time spent in calls, in seconds
+        #:
+        #: :type: float
+        self.seconds = 0.0
+
+    @property
+    def seconds_per_call(self):
+        """Average time per call, in seconds.
+
+        :type: float
+        """
+        return self.seconds / self.calls if self.calls else 0.0
+
+    __FORMAT = "{0.calls} calls, {0.seconds:.6f}s"
+    def __repr__(self):
+        return self.__FORMAT.format(self)
+
+class ParseProfile(object):
+    """Statistics gathered while profiling was enabled."""
+    def __init__(self):
+        self._name2stats = {}
+
+    def record(self, name, seconds):
+        """Records a single call to the phase *name* which took *seconds* seconds."""
+        try:
+            stats = self._name2stats[name]
+        except KeyError:
+            stats = self._name2stats[name] = PhaseStats()
+        stats.calls += 1
+        stats.seconds += seconds
+
+    @property
+    def stats(self):
+        """Statistics for each phase that was called at least once.
+        Parse phase functions are keyed by their name; XPath queries are keyed by :const:`XPATH_PREFIX` plus their name;
+        meeting table rows are keyed by :const:`MEETING_TYPE_PREFIX` plus their TritonLink meeting type code (e.g. "LE").
+
+        :type: dict of strings to :class:`PhaseStats`
+        """
+        return dict(self._name2stats)
+
+    def _stats_with_prefix(self, prefix):
+        return dict((name[len(prefix):], stats) for name, stats in self._name2stats.iteritems() if name.startswith(prefix))
+
+    @property
+    def meeting_types(self):
+        """Statistics for each meeting type encountered, keyed by TritonLink meeting type code.
+
+        :type: dict of strings to :class:`PhaseStats`
+        """
+        return self._stats_with_prefix(MEETING_TYPE_PREFIX)
+
+    @property
+    def xpaths(self):
+        """Statistics for each XPath query, keyed by the query's name in :mod:`triton_scraper.course_results_parsing`.
+
+        :type: dict of strings to :class:`PhaseStats`
+        """
+        return self._stats_with_prefix(XPATH_PREFIX)
+
+    def reset(self):
+        """Discards all statistics gathered so far."""
+        self._name2stats.clear()
+
+    def __repr__(self):
+        by_time = sorted(self._name2stats.iteritems(), key=lambda pair: pair[1].seconds, reverse=True)
+        return "\n".join("%s: %s" % pair for pair in by_time)
+
+def _timed(name, func, profile):
+    def timed(*args, **kwargs):
+        start = _timer()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.record(name, _timer() - start)
+    return timed
+
+def _meeting_type_of(row):
+    text = row[1].text if len(row) > 1 else None
+    return (text.strip() or _FREE_FORM) if text is not None else _FREE_FORM
+
+def _timed_by_meeting_type(func, profile):
+    def timed(row, course_inst):
+        start = _timer()
+        try:
+            return func(row, course_inst)
+        finally:
+            profile.record(MEETING_TYPE_PREFIX + _meeting_type_of(row), _timer() - start)
+    return timed
+
+#: Originals of the functions currently replaced by timed wrappers; empty when profiling is disabled
+_name2original = {}
+_profile = None
+
+def enable(profile=None):
+    """Enables profiling of the course results parser.
+    Calling this while profiling is already enabled just returns the active profile.
+
+    :param profile: profile to add statistics to; a new one is created if not given
+    :type profile: :class:`ParseProfile` or None
+    :returns: the profile statistics will be recorded into
+    :rtype: :class:`ParseProfile`
+    """
+    global _profile
+    if _profile is not None:
+        return _profile
+    _profile = profile if profile is not None else ParseProfile()
+    namespace = vars(_parsing)
+    for name in PHASES:
+        _name2original[name] = namespace[name]
+    for name, value in namespace.items():
+        if isinstance(value, _XPath):
+            _name2original[name] = value
+    for name, original in _name2original.iteritems():
+        label = (XPATH_PREFIX + name) if isinstance(original, _XPath) else name
+        namespace[name] = _timed(label, original, _profile)
+    _name2original["parse_meeting_row"] = _parsing.parse_meeting_row
+    _parsing.parse_meeting_row = _timed_by_meeting_type(_parsing.parse_meeting_row, _profile)
+    return _profile
+
+def disable():
+    """Disables profiling of the course results parser, restoring the uninstrumented parser.
+
+    :returns: the profile that statistics were being recorded into, or None if profiling wasn't enabled
+    :rtype: :class:`ParseProfile` or None
+    """
+    global _profile
+    vars(_parsing).update(_name2original)
+    _name2original.clear()
+    profile, _profile = _profile, None
+    return profile
+
+def active_profile():
+    """The profile statistics are currently being recorded into, or None if profiling is disabled.
+
+    :rtype: :class:`ParseProfile` or None
+    """
+    return _profile
+
+@_contextmanager
+def profiling(profile=None):
+    """Context manager which enables profiling for the duration of a ``with`` block and yields the :class:`ParseProfile`.
+    If profiling was already enabled, the active profile is yielded instead and profiling stays enabled after the block."""
+    already_enabled = _profile is not None
+    profile = enable(profile)
+    try:
+        yield profile
+    finally:
+        if not already_enabled:
+            disable()
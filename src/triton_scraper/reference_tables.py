@@ -0,0 +1,175 @@
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module loads reference tables scraped from UCSD webpages (e.g. building codes) lazily, and caches them on disk.
+
+A table is only loaded the first time it's needed. It's read from its cache file in :const:`config.CACHE_DIR` if there is one,
+and otherwise fetched from the web and then written to the cache; if that fails :const:`config.REFERENCE_TABLE_FETCH_TRIES` times
+in a row, an :exc:`IOError` is raised. A table can also be loaded from a saved copy of its webpage with :meth:`ReferenceTable.load_from`.
+If the cached copy is older than
+:const:`config.REFERENCE_TABLE_MAX_AGE`, it's used anyway and a fresh copy is fetched in a background thread.
+
+Cache files are JSON objects holding the cache format version, the source URL, the time of fetching, and the table data.
+Files of a different version or from a different URL are ignored.
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+import json as _json
+import os as _os
+from os.path import join as _pathjoin
+from threading import Lock as _Lock, Thread as _Thread
+from time import time as _time
+
+from triton_scraper import config as _config
+from triton_scraper.util import LOGGER as _LOGGER
+from triton_scraper.fetchparse import make_tree4url as _make_tree4url
+
+#: Version of the format of reference table cache files
+CACHE_FORMAT_VERSION = 1
+_CACHE_EXTENSION = ".json"
+
+def _with_strs(obj):
+    """Converts the ASCII unicode strings in JSON data to strs, which is what lxml gives for ASCII text."""
+    if isinstance(obj, unicode):
+        try:
+            return str(obj)
+        except UnicodeEncodeError:
+            return obj
+    if isinstance(obj, list):
+        return [_with_strs(item) for item in obj]
+    if isinstance(obj, dict):
+        return dict((_with_strs(key), _with_strs(value)) for key, value in obj.iteritems())
+    return obj
+
+class ReferenceTable(object):
+    """A table of reference data scraped from a webpage, loaded on first use and cached on disk."""
+    def __init__(self, name, url, parse, build=None, merge=None):
+        """
+        :param name: name of the table; also names its cache file
+        :type name: string
+        :param url: URL of the webpage the table comes from
+        :type url: string
+        :param parse: parses the webpage's element tree into JSON-compatible table data
+        :type parse: function
+        :param build: turns table data into the object :meth:`get` returns; defaults to returning the data as-is
+        :type build: function
+        :param merge: incorporates refreshed table data into the object :meth:`get` returned, in place; by default, refreshed data is only cached
+        :type merge: function taking the built object and the new table data
+        """
+        self.name = name
+        self.url = url
+        self._parse = parse
+        self._build = build if build is not None else (lambda data: data)
+        self._merge = merge
+        self._lock = _Lock()
+        self._table = None
+
+    @property
+    def cache_path(self):
+        """Path of the table's cache file.
+
+        :type: string
+        """
+        return _pathjoin(_config.CACHE_DIR, self.name + _CACHE_EXTENSION)
+
+    def get(self):
+        """The table, loading it if this is the first time it's needed."""
+        table = self._table
+        if table is None:
+            with self._lock:
+                if self._table is None:
+                    self._table = self._build(self._load())
+                table = self._table
+        return table
+
+    def load_from(self, tree):
+        """Loads the table from an already-fetched copy of its webpage (e.g. a saved one), instead of from the cache or the web.
+        Replaces the table if it was already loaded; the cache file is left alone.
+
+        :param tree: HTML element tree of the table's webpage
+        :type tree: :class:`lxml.etree.ElementTree`
+        """
+        table = self._build(self._parse(tree))
+        with self._lock:
+            self._table = table
+
+    def _load(self):
+        cached = self._read_cache()
+        if cached is None:
+            _LOGGER.info("No usable cached copy of the %s table; fetching it from %s", self.name, self.url)
+            try:
+                data = self._fetch(_config.REFERENCE_TABLE_FETCH_TRIES)
+            except Exception as exc:
+                raise IOError, "There's no cached copy of the %s table in %s, and fetching it from %s failed: %s" % (self.name, self.cache_path, self.url, exc)
+            self._write_cache(data)
+            return data
+        fetched, data = cached
+        if _time() - fetched > _config.REFERENCE_TABLE_MAX_AGE:
+            self._refresh_in_background()
+        return data
+
+    def _fetch(self, max_tries=None):
+        tree, _url = _make_tree4url()(self.url, max_tries=max_tries)
+        return self._parse(tree)
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path, 'rb') as cache_file:
+                cached = _json.load(cache_file)
+        except (IOError, ValueError):
+            return None
+        if not isinstance(cached, dict) or cached.get('version') != CACHE_FORMAT_VERSION or cached.get('url') != self.url:
+            return None
+        try:
+            return float(cached['fetched']), _with_strs(cached['data'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def _write_cache(self, data):
+        path = self.cache_path
+        temp_path = "%s.%d.tmp" % (path, _os.getpid())
+        try:
+            if not _os.path.isdir(_config.CACHE_DIR):
+                _os.makedirs(_config.CACHE_DIR)
+            with open(temp_path, 'wb') as cache_file:
+                _json.dump({'version': CACHE_FORMAT_VERSION, 'url': self.url, 'fetched': _time(), 'data': data}, cache_file)
+            _os.rename(temp_path, path) # atomic, so readers never see a partial file
+        except (IOError, OSError) as err:
+            _LOGGER.warning("Couldn't cache the %s table in %s: %s", self.name, path, err)
+
+    def _refresh(self):
+        try:
+            data = self._fetch(_config.REFERENCE_TABLE_FETCH_TRIES)
+        except Exception as exc:
+            _LOGGER.warning("Couldn't refresh the %s table from %s: %s", self.name, self.url, exc)
+            return
+        self._write_cache(data)
+        if self._merge is not None:
+            with self._lock:
+                self._merge(self._table, data)
+
+    def _refresh_in_background(self):
+        _LOGGER.info("Cached %s table is stale; refreshing it in the background", self.name)
+        refresher = _Thread(target=self._refresh, name="%s table refresher" % self.name)
+        refresher.daemon = True
+        refresher.start()
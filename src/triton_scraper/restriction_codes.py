@@ -20,6 +20,7 @@
 
 """
 This module fetches and holds data on TritonLink course restriction codes.
+The code table is loaded lazily and cached on disk; see :mod:`triton_scraper.reference_tables`.
 
 :copyright: (c) 2010 by Christopher Rebert.
 :license: MIT, see :file:`LICENSE.txt` for more details.
@@ -27,18 +28,28 @@ This module fetches and holds data on TritonLink course restriction codes.
 
 from triton_scraper.util import *
 from triton_scraper.config import RESTRICTION_CODE_URL as _RESTRICTION_CODE_URL
-from triton_scraper.fetchparse import make_tree4url
+from triton_scraper.reference_tables import ReferenceTable as _ReferenceTable
 
-restriction_codes_and_descriptions = XPath(RELATIVE_PREFIX+"/tr[not(@bgcolor)]/td/text()")
+# Plain strings rather than lxml "smart" ones, which keep their whole page alive (and can't be pickled)
+restriction_codes_and_descriptions = XPath(RELATIVE_PREFIX+"/tr[not(@bgcolor)]/td/text()", smart_strings=False)
 
-tree, _url = make_tree4url()(_RESTRICTION_CODE_URL)
-# if .strip() needed to ignore blank row
-_CODE2DESCRIPTION = dict((code, desc) for code, desc in grouper(2, restriction_codes_and_descriptions(tree)) if code.strip())
-del tree, _url
+def code2description_from(tree):
+    """Parses the TritonLink course restriction code explanation webpage.
+    
+    :param tree: HTML element tree of the webpage at :const:`triton_scraper.config.RESTRICTION_CODE_URL`
+    :type tree: :class:`lxml.etree.ElementTree`
+    :returns: mapping from restriction codes to their descriptions
+    :rtype: dict of strings to strings
+    """
+    # if .strip() needed to ignore blank row
+    return dict((code, desc) for code, desc in grouper(2, restriction_codes_and_descriptions(tree)) if code.strip())
+
+# Loaded on first use; refreshed descriptions replace stale ones
+_CODE2DESCRIPTION = _ReferenceTable("restriction_codes", _RESTRICTION_CODE_URL, code2description_from, merge=dict.update)
 
 def restriction_code2description(code):
     try:
-        return _CODE2DESCRIPTION[code]
+        return _CODE2DESCRIPTION.get()[code]
     except KeyError:
         # The webpage listing the codes is outdated/non-exhaustive
         return '"%s"' % code
@@ -0,0 +1,199 @@
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module tracks when campus rooms are occupied by course meetings.
+
+Each room's occupancy is kept as one bitmap (a Python int) per day of the week, with one bit per time slot
+(10 minutes by default), plus one bitmap per date for one-shot meetings such as exams.
+Asking whether a room is free, or how much it's used, then comes down to a few bitwise operations.
+As in :mod:`conflicts`, dated queries only consider one-shot meetings on that date: recurring meetings only happen during their term,
+whose dates the data model doesn't know (and finals are held after classes end).
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+from __future__ import division
+from datetime import time as _time
+
+from triton_scraper.util import minutes_since_midnight as _minutes_since_midnight, MINUTES_PER_DAY as _MINUTES_PER_DAY
+from triton_scraper.locations import Location as _Location, Building as _Building
+from triton_scraper.datatypes import DaysOfWeekSet as _DaysOfWeekSet
+from triton_scraper.conflicts import time_span as _time_span
+
+#: Default width of a time slot, in minutes
+DEFAULT_RESOLUTION = 10
+#: Days over which :meth:`RoomOccupancy.utilization` is computed by default
+WEEKDAYS = _DaysOfWeekSet("Mon Tue Wed Thu Fri".split())
+_NUM_DAYS = len(_DaysOfWeekSet.DAYS_IN_ORDER)
+
+def _popcount(bits):
+    return bin(bits).count("1")
+
+class _RoomBitmaps(object):
+    __slots__ = ('by_day', 'by_date')
+    def __init__(self):
+        self.by_day = [0] * _NUM_DAYS # recurring meetings
+        self.by_date = {} # one-shot meetings
+
+class RoomOccupancy(object):
+    """Occupancy of every room used by a collection of course meetings (typically an entire term).
+
+    Rooms are identified by :class:`Location`-s. Meetings at unknown or TBA locations, or at TBA times, are ignored."""
+    def __init__(self, course_instances=(), resolution=DEFAULT_RESOLUTION):
+        """
+        :param course_instances: course instances whose meetings (including finals) occupy rooms
+        :type course_instances: iterable of :class:`CourseInstance`-s
+        :param resolution: width of a time slot, in minutes; meeting times are rounded outward to whole slots
+        :type resolution: int
+        """
+        if not 0 < resolution <= _MINUTES_PER_DAY:
+            raise ValueError, "Invalid time slot width: %s minutes" % repr(resolution)
+        #: Width of a time slot, in minutes
+        #:
+        #: :type: int
+        self.resolution = resolution
+        self._room2bitmaps = {}
+        self._building2rooms = {}
+        for course_inst in course_instances:
+            self.add_course_instance(course_inst)
+
+    def _slots(self, start_time, end_time):
+        """Bitmap of the time slots overlapping [*start_time*, *end_time*)."""
+        first = _minutes_since_midnight(start_time) // self.resolution
+        last = -(-_minutes_since_midnight(end_time) // self.resolution) # ceiling division
+        if last <= first:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+
+    def add_meeting(self, meeting):
+        """Marks the location of *meeting* as occupied during it.
+
+        :type meeting: :class:`RecurringMeeting` or :class:`OneShotMeeting`
+        """
+        location = getattr(meeting, 'location', None)
+        span = _time_span(meeting)
+        if not isinstance(location, _Location) or span is None:
+            return
+        try:
+            bitmaps = self._room2bitmaps[location]
+        except KeyError:
+            bitmaps = self._room2bitmaps[location] = _RoomBitmaps()
+            self._building2rooms.setdefault(location.building, []).append(location)
+        slots = self._slots(meeting.start_time, meeting.end_time)
+        date = getattr(meeting, 'date', None)
+        if date is not None:
+            bitmaps.by_date[date] = bitmaps.by_date.get(date, 0) | slots
+        else:
+            mask = meeting.days.mask
+            for day_index in xrange(_NUM_DAYS):
+                if mask & (1 << day_index):
+                    bitmaps.by_day[day_index] |= slots
+
+    def add_course_instance(self, course_inst):
+        """Adds all the meetings of *course_inst*, including its final.
+
+        :type course_inst: :class:`CourseInstance`
+        """
+        for meeting_list in course_inst._code2meeting_list.itervalues():
+            for meeting in meeting_list:
+                self.add_meeting(meeting)
+        if course_inst.final is not None:
+            self.add_meeting(course_inst.final)
+
+    @property
+    def rooms(self):
+        """All rooms used by at least one meeting.
+
+        :type: list of :class:`Location`-s
+        """
+        return list(self._room2bitmaps)
+
+    def rooms_in(self, building):
+        """Rooms of *building* used by at least one meeting.
+
+        :param building: the building, or its UCSD building code
+        :type building: :class:`Building` or string
+        :rtype: list of :class:`Location`-s
+        """
+        if isinstance(building, basestring):
+            building = _Building.for_code(building, self._building2rooms)
+        return list(self._building2rooms.get(building, ()))
+
+    def _is_free(self, bitmaps, slots, days, date):
+        if date is not None:
+            return not (bitmaps.by_date.get(date, 0) & slots)
+        mask = days.mask
+        for day_index in xrange(_NUM_DAYS):
+            if mask & (1 << day_index) and bitmaps.by_day[day_index] & slots:
+                return False
+        return True
+
+    def is_free(self, room, start_time, end_time, days=None, date=None):
+        """Is *room* free from *start_time* to *end_time* on all of *days* (for recurring use), or on *date* (for one-time use)?
+        Exactly one of *days* and *date* must be given. Rooms no meeting uses are always free.
+        On a *date*, only one-shot meetings (e.g. exams) on that date make a room busy; recurring meetings don't, since their term's dates are unknown.
+
+        :type room: :class:`Location`
+        :type start_time: :class:`datetime.time`
+        :type end_time: :class:`datetime.time`
+        :type days: :class:`DaysOfWeekSet`
+        :type date: :class:`datetime.date`
+        :rtype: bool
+        """
+        if (days is None) == (date is None):
+            raise ValueError, "Exactly one of days and date must be given"
+        bitmaps = self._room2bitmaps.get(room)
+        return bitmaps is None or self._is_free(bitmaps, self._slots(start_time, end_time), days, date)
+
+    def free_rooms(self, building, start_time, end_time, days=None, date=None):
+        """Known rooms of *building* which are free from *start_time* to *end_time*, as in :meth:`is_free`.
+        Only rooms used by at least one meeting are known.
+
+        :param building: the building, or its UCSD building code
+        :type building: :class:`Building` or string
+        :rtype: list of :class:`Location`-s
+        """
+        if (days is None) == (date is None):
+            raise ValueError, "Exactly one of days and date must be given"
+        slots = self._slots(start_time, end_time)
+        return [room for room in self.rooms_in(building) if self._is_free(self._room2bitmaps[room], slots, days, date)]
+
+    def utilization(self, building=None, days=WEEKDAYS, day_start=_time(8, 0), day_end=_time(22, 0)):
+        """Fraction of the time slots between *day_start* and *day_end* on *days* during which each room is occupied by a recurring meeting.
+
+        :param building: only rooms in this building, or in all buildings if None
+        :type building: :class:`Building` or string or None
+        :type days: :class:`DaysOfWeekSet`
+        :type day_start: :class:`datetime.time`
+        :type day_end: :class:`datetime.time`
+        :rtype: dict of :class:`Location`-s to floats
+        """
+        window = self._slots(day_start, day_end)
+        day_indices = [day_index for day_index in xrange(_NUM_DAYS) if days.mask & (1 << day_index)]
+        possible = _popcount(window) * len(day_indices)
+        rooms = self.rooms if building is None else self.rooms_in(building)
+        room2fraction = {}
+        for room in rooms:
+            by_day = self._room2bitmaps[room].by_day
+            used = sum(_popcount(by_day[day_index] & window) for day_index in day_indices)
+            room2fraction[room] = used / possible if possible else 0.0
+        return room2fraction
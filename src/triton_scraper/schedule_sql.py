@@ -0,0 +1,290 @@
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module stores Schedule of Classes data (course instances, their meetings and seating, instructors, locations, and finals)
+in `SQLite <http://www.sqlite.org/>`_ databases, so that it can be queried later without re-crawling TritonLink.
+
+Tables are normalized: one row per instructor in :const:`INSTRUCTOR_TABLE_NAME`, one per course instance in :const:`COURSE_TABLE_NAME`,
+one per restriction of a course instance in :const:`RESTRICTION_TABLE_NAME`, and one per meeting (finals included) in :const:`MEETING_TABLE_NAME`.
+Meeting times are stored in minutes since midnight and days of the week as a :attr:`DaysOfWeekSet.mask`.
+Unlimited seating, TBA instructors, and unknown locations are NULL; TBA locations have the building code "TBA".
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+from sqlite3 import connect as _sqlite_connect
+from contextlib import closing as _closing
+
+from triton_scraper import config as _config
+from triton_scraper.util import INFINITY as _INFINITY, minutes_since_midnight as _minutes_since_midnight
+from triton_scraper.datatypes import Instructor as _Instructor
+from triton_scraper.locations import Location as _Location, LocationTBA as _LocationTBA
+from triton_scraper.meetings import SeatedMeeting as _SeatedMeeting
+from triton_scraper.browser import TritonBrowser as _TritonBrowser
+from triton_scraper.sql import INT as _INT, STR as _STR, PRIMARY_KEY as _PRIMARY_KEY, SECTION_ID_COL, foreign_key as _foreign_key, configure as _configure, BatchWriter as _BatchWriter
+from triton_scraper.sql import create_statement_for as _create_statement_for, insert_statement_for as _insert_statement_for, has_table as _has_table
+
+#: SQLite type name for floating-point numbers
+_REAL = "REAL"
+_TBA = "TBA"
+# Term code the course instances of a term are stored under while they're being loaded by load_term_into_db()
+_STAGING_TERM_CODE_FORMAT = "%s (loading)"
+
+#: Name of instructors SQLite table
+INSTRUCTOR_TABLE_NAME = "Instructor"
+#: List of (column name, SQLite type name) tuples for the instructors SQLite table
+INSTRUCTOR_TABLE_COLUMNS = [
+    ("instructor_id", _INT+" "+_PRIMARY_KEY),
+    ("last_name", _STR),
+    ("first_name", _STR),
+    ("email", _STR)]
+
+#: Name of course instances SQLite table
+COURSE_TABLE_NAME = "CourseInstance"
+#: List of (column name, SQLite type name) tuples for the course instances SQLite table
+COURSE_TABLE_COLUMNS = [
+    ("course_id", _INT+" "+_PRIMARY_KEY),
+    ("term_code", _STR),
+    ("subject_code", _STR),
+    ("course_number", _STR),
+    ("name", _STR),
+    ("units", _REAL), # NULL if variable
+    ("prerequisites_url", _STR),
+    ("instructor_id", _foreign_key(_INT, INSTRUCTOR_TABLE_NAME, "instructor_id"))]
+
+#: Name of course instance restrictions SQLite table
+RESTRICTION_TABLE_NAME = "Restriction"
+#: List of (column name, SQLite type name) tuples for the course instance restrictions SQLite table
+RESTRICTION_TABLE_COLUMNS = [
+    ("course_id", _foreign_key(_INT, COURSE_TABLE_NAME, "course_id")),
+    ("description", _STR)]
+
+#: Name of meetings SQLite table
+MEETING_TABLE_NAME = "Meeting"
+#: List of (column name, SQLite type name) tuples for the meetings SQLite table
+MEETING_TABLE_COLUMNS = [
+    ("meeting_id", _INT+" "+_PRIMARY_KEY),
+    ("course_id", _foreign_key(_INT, COURSE_TABLE_NAME, "course_id")),
+    ("type_code", _STR),
+    ("section_number", _STR),
+    (SECTION_ID_COL, _INT), # NULL for unseated meetings
+    ("instructor_id", _foreign_key(_INT, INSTRUCTOR_TABLE_NAME, "instructor_id")),
+    ("start_time", _INT), # minutes since midnight; NULL if TBA
+    ("end_time", _INT),
+    ("days", _INT), # DaysOfWeekSet.mask; NULL for one-shot meetings
+    ("date", _STR), # YYYY-MM-DD; NULL for recurring meetings
+    ("building_code", _STR),
+    ("room_number", _STR),
+    ("available_seats", _INT), # negative if waitlisted; NULL for unlimited seating
+    ("total_seats", _INT),
+    ("bookstore_url", _STR)]
+
+_TABLES = [
+    (INSTRUCTOR_TABLE_NAME, INSTRUCTOR_TABLE_COLUMNS),
+    (COURSE_TABLE_NAME, COURSE_TABLE_COLUMNS),
+    (RESTRICTION_TABLE_NAME, RESTRICTION_TABLE_COLUMNS),
+    (MEETING_TABLE_NAME, MEETING_TABLE_COLUMNS)]
+
+#: SQLite CREATE TABLE statements for the schedule tables, referenced tables first
+CREATE_SCHEDULE_TABLE_STMTS = [_create_statement_for(name, columns) for name, columns in _TABLES]
+
+#: SQLite CREATE INDEX statements for the schedule tables
+CREATE_SCHEDULE_INDEX_STMTS = [
+    "CREATE UNIQUE INDEX InstructorName ON %s(last_name, first_name)" % INSTRUCTOR_TABLE_NAME,
+    "CREATE INDEX CourseTermCode ON %s(term_code, subject_code, course_number)" % COURSE_TABLE_NAME,
+    "CREATE INDEX CourseCode ON %s(subject_code, course_number)" % COURSE_TABLE_NAME,
+    "CREATE INDEX CourseInstructor ON %s(instructor_id)" % COURSE_TABLE_NAME,
+    "CREATE INDEX RestrictionCourse ON %s(course_id)" % RESTRICTION_TABLE_NAME,
+    "CREATE INDEX MeetingSectionId ON %s(%s)" % (MEETING_TABLE_NAME, SECTION_ID_COL),
+    "CREATE INDEX MeetingCourse ON %s(course_id)" % MEETING_TABLE_NAME,
+    "CREATE INDEX MeetingInstructor ON %s(instructor_id)" % MEETING_TABLE_NAME,
+    "CREATE INDEX MeetingRoom ON %s(building_code, room_number)" % MEETING_TABLE_NAME]
+
+INSERT_INSTRUCTOR_STMT = _insert_statement_for(INSTRUCTOR_TABLE_NAME, INSTRUCTOR_TABLE_COLUMNS)
+INSERT_COURSE_STMT = _insert_statement_for(COURSE_TABLE_NAME, COURSE_TABLE_COLUMNS)
+INSERT_RESTRICTION_STMT = _insert_statement_for(RESTRICTION_TABLE_NAME, RESTRICTION_TABLE_COLUMNS)
+INSERT_MEETING_STMT = _insert_statement_for(MEETING_TABLE_NAME, MEETING_TABLE_COLUMNS)
+
+def create_schedule_tables(sqlite_conn):
+    """Create SQL tables and their indexes in the *sqlite_conn* database to store Schedule of Classes data.
+    
+    :param sqlite_conn: database to create tables in
+    :type sqlite_conn: :class:`sqlite3.Connection` or :class:`sqlite3.Cursor`
+    """
+    for stmt in CREATE_SCHEDULE_TABLE_STMTS + CREATE_SCHEDULE_INDEX_STMTS:
+        sqlite_conn.execute(stmt)
+
+def _delete_term_rows(sqlite_conn, term_code):
+    courses_of_term = "course_id IN (SELECT course_id FROM %s WHERE term_code = ?)" % COURSE_TABLE_NAME
+    sqlite_conn.execute("DELETE FROM %s WHERE %s" % (MEETING_TABLE_NAME, courses_of_term), (term_code,))
+    sqlite_conn.execute("DELETE FROM %s WHERE %s" % (RESTRICTION_TABLE_NAME, courses_of_term), (term_code,))
+    sqlite_conn.execute("DELETE FROM %s WHERE term_code = ?" % COURSE_TABLE_NAME, (term_code,))
+
+def delete_term(sqlite_conn, term_code):
+    """Deletes the course instances of the given term, and their restrictions and meetings, from the database *sqlite_conn*.
+    Instructors are kept.
+    
+    :param term_code: e.g. "FA10"
+    :type term_code: string
+    """
+    with sqlite_conn:
+        _delete_term_rows(sqlite_conn, term_code)
+
+def _seats(seats):
+    return None if seats == _INFINITY else seats
+
+def _location_columns(location):
+    if isinstance(location, _Location):
+        return location.building.code, location.room_number
+    if isinstance(location, _LocationTBA):
+        return _TBA, None
+    return None, None
+
+class ScheduleWriter(_BatchWriter):
+    """Batched writer of one term's :class:`CourseInstance`-s into tables created by :func:`create_schedule_tables`.
+    Course instance IDs are assigned by the writer, and each instructor is only inserted the first time they're seen."""
+    
+    def __init__(self, sqlite_conn, term_code, batch_size=_config.SQLITE_BATCH_SIZE):
+        """
+        :param sqlite_conn: the database to write to
+        :type sqlite_conn: :class:`sqlite3.Connection`
+        :param term_code: term the course instances are from; e.g. "FA10"
+        :type term_code: string
+        :param batch_size: number of course instances per transaction
+        :type batch_size: int
+        """
+        _BatchWriter.__init__(self, sqlite_conn, (INSERT_INSTRUCTOR_STMT, INSERT_COURSE_STMT, INSERT_RESTRICTION_STMT, INSERT_MEETING_STMT), self._course_rows, batch_size)
+        self.term_code = term_code
+        self._name2instructor_id = dict(((last, first), instructor_id) for instructor_id, last, first in sqlite_conn.execute("SELECT instructor_id, last_name, first_name FROM %s" % INSTRUCTOR_TABLE_NAME))
+        self._next_instructor_id = (sqlite_conn.execute("SELECT MAX(instructor_id) FROM %s" % INSTRUCTOR_TABLE_NAME).fetchone()[0] or 0) + 1
+        self._next_course_id = (sqlite_conn.execute("SELECT MAX(course_id) FROM %s" % COURSE_TABLE_NAME).fetchone()[0] or 0) + 1
+    
+    def flush(self):
+        try:
+            _BatchWriter.flush(self)
+        except Exception:
+            # Instructors of the discarded batch were never stored
+            self._name2instructor_id = dict(((last, first), instructor_id) for instructor_id, last, first in self._conn.execute("SELECT instructor_id, last_name, first_name FROM %s" % INSTRUCTOR_TABLE_NAME))
+            raise
+    
+    def _instructor_id(self, instructor, new_rows):
+        if not isinstance(instructor, _Instructor):
+            return None
+        key = (instructor.last_name, instructor.first_name)
+        try:
+            return self._name2instructor_id[key]
+        except KeyError:
+            instructor_id = self._name2instructor_id[key] = self._next_instructor_id
+            self._next_instructor_id += 1
+            new_rows.append((INSERT_INSTRUCTOR_STMT, (instructor_id, instructor.last_name, instructor.first_name, instructor.email)))
+            return instructor_id
+    
+    def _meeting_row(self, course_id, type_code, meeting, new_rows):
+        start_time = getattr(meeting, 'start_time', None)
+        days = getattr(meeting, 'days', None)
+        date = getattr(meeting, 'date', None)
+        building_code, room_number = _location_columns(getattr(meeting, 'location', None))
+        seated = isinstance(meeting, _SeatedMeeting)
+        return (None, course_id, type_code, meeting.section_number,
+            meeting.section_id if seated else None,
+            self._instructor_id(getattr(meeting, 'instructor', None), new_rows),
+            _minutes_since_midnight(start_time) if start_time is not None else None,
+            _minutes_since_midnight(meeting.end_time) if start_time is not None else None,
+            days.mask if days is not None else None,
+            date.isoformat() if date is not None else None,
+            building_code, room_number,
+            _seats(meeting.available_seats) if seated else None,
+            _seats(meeting.total_seats) if seated else None,
+            meeting._bookstore_url if seated else None)
+    
+    def _course_rows(self, course_inst):
+        rows = []
+        course_id = self._next_course_id
+        self._next_course_id += 1
+        units = course_inst.units
+        course_row = (course_id, self.term_code, course_inst.subject_code, course_inst.course_number, course_inst.name,
+            units if units == units else None, # NaN != NaN
+            course_inst.prerequisites_url, self._instructor_id(course_inst.instructor, rows))
+        rows.append((INSERT_COURSE_STMT, course_row))
+        for description in sorted(course_inst.restrictions):
+            rows.append((INSERT_RESTRICTION_STMT, (course_id, description)))
+        for type_code, meeting_list in sorted(course_inst._code2meeting_list.iteritems()):
+            for meeting in meeting_list:
+                rows.append((INSERT_MEETING_STMT, self._meeting_row(course_id, type_code, meeting, rows)))
+        if course_inst.final is not None:
+            rows.append((INSERT_MEETING_STMT, self._meeting_row(course_id, _config.FINAL_CODE, course_inst.final, rows)))
+        return rows
+
+def load_term_into_db(sqlite_conn, term_code, course_instances, batch_size=_config.SQLITE_BATCH_SIZE):
+    """Stores a term's course instances in the database *sqlite_conn* as they're produced, replacing whatever was stored for the term before.
+    The schedule tables are created if needed.
+    Course instances are written in batches under a staging term code, and only replace the term's old ones, in a single transaction,
+    once *course_instances* has been exhausted. So if the crawl or a write fails, the term is left as it was.
+    
+    :param sqlite_conn: the database to write to
+    :type sqlite_conn: :class:`sqlite3.Connection`
+    :param term_code: e.g. "FA10"
+    :type term_code: string
+    :param course_instances: the term's course instances; e.g. from :meth:`TritonBrowser.all_classes_during`
+    :type course_instances: iterable of :class:`CourseInstance`-s
+    :param batch_size: number of course instances per transaction
+    :type batch_size: int
+    :returns: number of course instances stored
+    :rtype: int
+    """
+    staging_term_code = _STAGING_TERM_CODE_FORMAT % term_code
+    if not _has_table(sqlite_conn, COURSE_TABLE_NAME):
+        with sqlite_conn:
+            create_schedule_tables(sqlite_conn)
+    else:
+        delete_term(sqlite_conn, staging_term_code) # left over from an interrupted load
+    try:
+        count = ScheduleWriter(sqlite_conn, staging_term_code, batch_size).write_all(course_instances)
+        with sqlite_conn:
+            _delete_term_rows(sqlite_conn, term_code)
+            sqlite_conn.execute("UPDATE %s SET term_code = ? WHERE term_code = ?" % COURSE_TABLE_NAME, (term_code, staging_term_code))
+    except Exception:
+        delete_term(sqlite_conn, staging_term_code)
+        raise
+    return count
+
+def load_term_into_file(filepath, term_code, browser=None, batch_size=_config.SQLITE_BATCH_SIZE, journal_mode=None, synchronous=None):
+    """Crawls a term's Schedule of Classes into the `SQLite <http://www.sqlite.org/>`_ database in the file *filepath* (see :func:`load_term_into_db`).
+    
+    :param filepath: path to the SQLite database file, which is created if it doesn't exist
+    :type filepath: string
+    :param term_code: e.g. "FA10"
+    :type term_code: string
+    :param browser: browser to crawl with; a new one if None
+    :type browser: :class:`TritonBrowser` or None
+    :param journal_mode: see :func:`sql.configure`
+    :type journal_mode: string or None
+    :param synchronous: see :func:`sql.configure`
+    :type synchronous: string or None
+    :returns: number of course instances stored
+    :rtype: int
+    """
+    if browser is None:
+        browser = _TritonBrowser()
+    with _closing(_sqlite_connect(filepath)) as conn:
+        _configure(conn, journal_mode, synchronous)
+        return load_term_into_db(conn, term_code, browser.all_classes_during(term_code), batch_size)
@@ -0,0 +1,274 @@
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module generates conflict-free class schedules from a set of desired courses.
+
+For each desired course, a schedule includes one of its :class:`CourseInstance`-s, all of that instance's unseated meetings
+(e.g. lectures, midterms, and the final), and exactly one seated meeting of each meeting type the instance has seated meetings of
+(e.g. one discussion section and one lab section).
+
+Schedules are found by backtracking search: sections that violate the :class:`ScheduleConstraints` are pruned up front,
+and a partial schedule is abandoned as soon as it contains a conflict (see :func:`conflicts.meetings_overlap`).
+:func:`schedules` produces schedules lazily, as they're found; :func:`best_schedules` searches to completion
+and returns the top-scoring ones.
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+from collections import namedtuple as _namedtuple
+from heapq import nlargest as _nlargest, heappush as _heappush, heapreplace as _heapreplace
+
+from triton_scraper.util import minutes_since_midnight as _minutes_since_midnight, MINUTES_PER_DAY as _MINUTES_PER_DAY
+from triton_scraper.datatypes import CourseInstance as _CourseInstance
+from triton_scraper.meetings import SeatedMeeting as _SeatedMeeting
+from triton_scraper.conflicts import meetings_overlap as _meetings_overlap, time_span as _time_span
+
+class ScheduleConstraints(object):
+    """Restrictions on which sections may appear in a generated schedule.
+    The time of day and day of the week restrictions apply to recurring meetings only, not to exams and other one-shot meetings."""
+    def __init__(self, earliest_start=None, latest_end=None, days_off=None, open_seats_only=False):
+        """
+        :param earliest_start: no classes starting before this time of day
+        :type earliest_start: :class:`datetime.time` or None
+        :param latest_end: no classes ending after this time of day
+        :type latest_end: :class:`datetime.time` or None
+        :param days_off: no classes on these days
+        :type days_off: :class:`DaysOfWeekSet` or None
+        :param open_seats_only: exclude seated meetings which are full
+        :type open_seats_only: bool
+        """
+        self.earliest_start = earliest_start
+        self.latest_end = latest_end
+        self.days_off = days_off
+        self.open_seats_only = open_seats_only
+
+    def allows(self, meeting):
+        """Can *meeting* be part of a schedule?
+
+        :rtype: bool
+        """
+        if self.open_seats_only and isinstance(meeting, _SeatedMeeting) and meeting.full:
+            return False
+        days = getattr(meeting, 'days', None)
+        if days is None or getattr(meeting, 'start_time', None) is None: # one-shot, or TBA
+            return True
+        if self.days_off is not None and days.overlaps(self.days_off):
+            return False
+        if self.earliest_start is not None and meeting.start_time < self.earliest_start:
+            return False
+        if self.latest_end is not None and meeting.end_time > self.latest_end:
+            return False
+        return True
+
+_UNCONSTRAINED = ScheduleConstraints()
+
+class Schedule(_namedtuple('_Schedule', "course_instances meetings")):
+    """A conflict-free combination of sections.
+
+    course_instances
+        The chosen :class:`CourseInstance` for each desired course, in the order the courses were given.
+    meetings
+        Every meeting that is part of the schedule.
+    """
+    __slots__ = ()
+
+    @property
+    def section_ids(self):
+        """Section IDs of the seated meetings one would need to enroll in.
+
+        :type: list of ints
+        """
+        return [meeting.section_id for meeting in self.meetings if isinstance(meeting, _SeatedMeeting)]
+
+_CourseOption = _namedtuple('_CourseOption', "course_inst fixed_meetings section_groups")
+
+def _options_for(course_instances, constraints):
+    """Possible ways of taking a course, with sections violating *constraints* pruned."""
+    for course_inst in course_instances:
+        fixed = []
+        groups = []
+        for meeting_list in course_inst._code2meeting_list.itervalues():
+            seated = []
+            for meeting in meeting_list:
+                (seated if isinstance(meeting, _SeatedMeeting) else fixed).append(meeting)
+            if seated:
+                groups.append([meeting for meeting in seated if constraints.allows(meeting)])
+        if course_inst.final is not None:
+            fixed.append(course_inst.final)
+        if all(groups) and all(constraints.allows(meeting) for meeting in fixed):
+            groups.sort(key=len) # most constrained first
+            yield _CourseOption(course_inst, fixed, groups)
+
+def schedules(desired_courses, constraints=None):
+    """Generates all conflict-free schedules for the given courses, lazily.
+    Meetings of the same course are checked against each other too, so e.g. a discussion section overlapping its own course's lecture is never chosen.
+
+    :param desired_courses: for each desired course, the :class:`CourseInstance`-s of it to choose from (or a single :class:`CourseInstance`)
+    :type desired_courses: sequence of iterables of :class:`CourseInstance`-s
+    :param constraints: restrictions on which sections may be chosen
+    :type constraints: :class:`ScheduleConstraints` or None
+    :rtype: generator of :class:`Schedule`-s
+    """
+    return _search(desired_courses, constraints, None)
+
+def _search(desired_courses, constraints, should_prune):
+    """Backtracking search behind :func:`schedules`.
+    *should_prune*, if given, is called with the partial :class:`Schedule` (unchosen courses being None) after each course is chosen,
+    and the partial schedule is abandoned if it returns True."""
+    if constraints is None:
+        constraints = _UNCONSTRAINED
+    options = []
+    for instances in desired_courses:
+        if isinstance(instances, _CourseInstance):
+            instances = [instances]
+        options.append(list(_options_for(instances, constraints)))
+    if not all(options):
+        return
+    num_courses = len(options)
+    search_order = sorted(xrange(num_courses), key=lambda position: len(options[position])) # fail fast
+    chosen_courses = [None] * num_courses
+    chosen = [] # meetings
+
+    def fits(meeting):
+        for other in chosen:
+            if _meetings_overlap(meeting, other):
+                return False
+        return True
+
+    def add_all(meetings):
+        """Adds *meetings* to the schedule if none of them conflict with it or each other."""
+        mark = len(chosen)
+        for meeting in meetings:
+            if not fits(meeting):
+                del chosen[mark:]
+                return False
+            chosen.append(meeting)
+        return True
+
+    def choose_course(depth):
+        if depth == num_courses:
+            yield Schedule(tuple(chosen_courses), tuple(chosen))
+            return
+        if depth and should_prune is not None and should_prune(Schedule(tuple(chosen_courses), tuple(chosen))):
+            return
+        position = search_order[depth]
+        for option in options[position]:
+            mark = len(chosen)
+            if not add_all(option.fixed_meetings):
+                continue
+            chosen_courses[position] = option.course_inst
+            for schedule in choose_sections(depth, option.section_groups, 0):
+                yield schedule
+            del chosen[mark:]
+        chosen_courses[position] = None
+
+    def choose_sections(depth, groups, group_index):
+        if group_index == len(groups):
+            for schedule in choose_course(depth + 1):
+                yield schedule
+            return
+        for meeting in groups[group_index]:
+            if fits(meeting):
+                chosen.append(meeting)
+                for schedule in choose_sections(depth, groups, group_index + 1):
+                    yield schedule
+                chosen.pop()
+
+    for schedule in choose_course(0):
+        yield schedule
+
+def best_schedules(desired_courses, score, count=10, constraints=None, upper_bound=None):
+    """The *count* highest-scoring conflict-free schedules for the given courses, best first (ties in the order :func:`schedules` finds them).
+    Schedules are scored as they're generated, so only *count* of them are held in memory at once.
+    The result is a list rather than a stream, since the best schedules aren't known until the whole search is done;
+    to consume schedules lazily as they're found, iterate over :func:`schedules` instead.
+
+    Without an *upper_bound*, every schedule gets generated and scored.
+    With one, the search is branch-and-bound: once *count* schedules have been found, a partial schedule is abandoned
+    if *upper_bound* says none of its completions can beat the worst of them.
+
+    :param desired_courses: as for :func:`schedules`
+    :param score: scoring function; higher is better. See e.g. :func:`fewest_days`.
+    :type score: function taking a :class:`Schedule` and returning a number
+    :param count: number of schedules to return
+    :type count: int
+    :param constraints: as for :func:`schedules`
+    :param upper_bound: gives, for a partial schedule (whose unchosen courses are None), a score no completion of it can exceed;
+        e.g. :func:`fewest_days` for itself, or :func:`latest_start_upper_bound` for :func:`latest_start`
+    :type upper_bound: function taking a :class:`Schedule` and returning a number, or None
+    :rtype: list of :class:`Schedule`-s
+    """
+    if upper_bound is None:
+        return _nlargest(count, schedules(desired_courses, constraints), key=score)
+    best = [] # min-heap of (score, -discovery index, schedule)
+    def should_prune(partial):
+        return len(best) == count and upper_bound(partial) <= best[0][0]
+    for index, schedule in enumerate(_search(desired_courses, constraints, should_prune)):
+        entry = (score(schedule), -index, schedule)
+        if len(best) < count:
+            _heappush(best, entry)
+        elif entry[0] > best[0][0]:
+            _heapreplace(best, entry)
+    best.sort(reverse=True)
+    return [schedule for _score, _index, schedule in best]
+
+### Scoring functions
+def _recurring_spans_by_day(schedule):
+    day2spans = {}
+    for meeting in schedule.meetings:
+        days = getattr(meeting, 'days', None)
+        span = _time_span(meeting)
+        if days is None or span is None:
+            continue
+        for day in days:
+            day2spans.setdefault(day, []).append(span)
+    return day2spans
+
+def fewest_days(schedule):
+    """Scores schedules with classes on fewer days of the week higher.
+    Adding meetings never raises the score, so this is also its own upper bound for :func:`best_schedules`."""
+    return -len(_recurring_spans_by_day(schedule))
+
+def _recurring_starts(schedule):
+    return [_minutes_since_midnight(meeting.start_time) for meeting in schedule.meetings if getattr(meeting, 'days', None) is not None and getattr(meeting, 'start_time', None) is not None]
+
+def latest_start(schedule):
+    """Scores schedules by how late in the day their earliest class starts, in minutes since midnight."""
+    starts = _recurring_starts(schedule)
+    return min(starts) if starts else 0
+
+def latest_start_upper_bound(partial_schedule):
+    """Upper bound on the :func:`latest_start` score of any completion of *partial_schedule*, for :func:`best_schedules`."""
+    starts = _recurring_starts(partial_schedule)
+    return min(starts) if starts else _MINUTES_PER_DAY
+
+def least_idle_time(schedule):
+    """Scores schedules with less time between classes on the same day higher (the score is minus the total minutes idle)."""
+    idle = 0
+    for spans in _recurring_spans_by_day(schedule).itervalues():
+        spans.sort()
+        latest_end = spans[0][1]
+        for start, end in spans[1:]:
+            if start > latest_end:
+                idle += start - latest_end
+            latest_end = max(latest_end, end)
+    return -idle
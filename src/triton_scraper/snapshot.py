@@ -0,0 +1,322 @@
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module saves and loads crawled course instances in a compact, versioned binary snapshot format,
+so that a term can be restored without re-crawling TritonLink.
+
+A snapshot is a fixed header (:const:`MAGIC`, format version, flags) followed by a body, which is optionally zlib-compressed.
+The body holds, in order: a table of every distinct string, tables of buildings and instructors, and then fixed-width course,
+restriction, and meeting records which refer to the tables by index. Records are packed with :mod:`struct`, little-endian.
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+from struct import Struct as _Struct
+from array import array as _array
+from datetime import time as _time, date as _date
+from zlib import compress as _compress, decompress as _decompress
+import sys as _sys
+
+from triton_scraper import config as _config
+from triton_scraper.util import minutes_since_midnight as _minutes_since_midnight, INFINITY as _INFINITY, NaN as _NaN
+from triton_scraper.datatypes import CourseInstance as _CourseInstance, Instructor as _Instructor, InstructorTBA as _InstructorTBA, DaysOfWeekSet as _DaysOfWeekSet
+from triton_scraper.locations import Location as _Location, UnknownLocation as _UnknownLocation, LocationTBA as _LocationTBA, Building as _Building
+from triton_scraper.meetings import OneShotMeeting as _OneShotMeeting, RecurringMeeting as _RecurringMeeting, SeatedMeeting as _SeatedMeeting, RecurringSeatedMeeting as _RecurringSeatedMeeting
+
+#: First bytes of every snapshot
+MAGIC = "TSNP"
+#: Version of the snapshot format written by :func:`dumps`
+FORMAT_VERSION = 1
+#: Header flag: the body is zlib-compressed
+FLAG_ZLIB = 0x1
+
+_HEADER = _Struct("<4sHH") # magic, version, flags
+_COUNTS = _Struct("<IIIIII") # strings, buildings, instructors, courses, restrictions, meetings
+_BUILDING = _Struct("<III") # code, name, area
+_INSTRUCTOR = _Struct("<III") # last name, first name, email
+_COURSE = _Struct("<IIIdIIHH") # subject code, course number, name, units, prerequisites URL, instructor, number of restrictions, number of meetings
+_RESTRICTION = _Struct("<I")
+# kind, meeting type code, start, end, days mask, date ordinal, building, room number, section number, instructor, section ID, available seats, total seats, bookstore URL
+_MEETING = _Struct("<BIhhBiHIIIiddI")
+
+# Index values with special meanings
+_NONE = 0xFFFFFFFF # string or instructor is None
+_TBA = 0xFFFFFFFE # instructor is InstructorTBA
+_NO_LOCATION = 0xFFFF # building of a meeting without a location
+_UNKNOWN_LOCATION = 0xFFFE
+_LOCATION_TBA = 0xFFFD
+_NO_TIME = -1
+
+# Meeting kinds
+_ONE_SHOT, _RECURRING, _SEATED, _RECURRING_SEATED = range(4)
+_KIND2CLASS = [_OneShotMeeting, _RecurringMeeting, _SeatedMeeting, _RecurringSeatedMeeting]
+
+class _Interner(object):
+    """Assigns consecutive indices to distinct values."""
+    def __init__(self):
+        self.values = []
+        self._value2index = {}
+
+    def __call__(self, value):
+        try:
+            return self._value2index[value]
+        except KeyError:
+            index = self._value2index[value] = len(self.values)
+            self.values.append(value)
+            return index
+
+def _kind_of(meeting):
+    if isinstance(meeting, _RecurringSeatedMeeting):
+        return _RECURRING_SEATED
+    if isinstance(meeting, _SeatedMeeting):
+        return _SEATED
+    if isinstance(meeting, _OneShotMeeting):
+        return _ONE_SHOT
+    return _RECURRING
+
+def _seats(value):
+    return int(value) if value != _INFINITY else value
+
+def _to_bytes(string):
+    return string.encode('utf-8') if isinstance(string, unicode) else string
+
+def _from_bytes(encoded):
+    string = encoded.decode('utf-8')
+    try:
+        return str(string) # ASCII text comes out of lxml as str, so mimic that
+    except UnicodeEncodeError:
+        return string
+
+def dumps(course_instances, compress=True):
+    """Serializes course instances into a snapshot.
+
+    :param course_instances: course instances to save; e.g. from :meth:`TritonBrowser.all_classes_during`
+    :type course_instances: iterable of :class:`CourseInstance`-s
+    :param compress: compress the snapshot with zlib?
+    :type compress: bool
+    :rtype: string
+    """
+    strings = _Interner()
+    def string(value):
+        return _NONE if value is None else strings(value)
+    buildings = _Interner()
+    instructors = _Interner()
+    def instructor(value):
+        if value is None:
+            return _NONE
+        if isinstance(value, _InstructorTBA):
+            return _TBA
+        return instructors(value)
+    course_records = []
+    restriction_records = []
+    meeting_records = []
+    for course_inst in course_instances:
+        meetings = [(type_code, meeting) for type_code, meeting_list in course_inst._code2meeting_list.iteritems() for meeting in meeting_list]
+        if course_inst.final is not None:
+            meetings.append((_config.FINAL_CODE, course_inst.final))
+        restrictions = sorted(course_inst.restrictions)
+        course_records.append(_COURSE.pack(strings(course_inst.subject_code), strings(course_inst.course_number), string(course_inst.name), course_inst.units, string(course_inst.prerequisites_url), instructor(course_inst.instructor), len(restrictions), len(meetings)))
+        restriction_records.extend(_RESTRICTION.pack(strings(restriction)) for restriction in restrictions)
+        for type_code, meeting in meetings:
+            kind = _kind_of(meeting)
+            start_time = getattr(meeting, 'start_time', None)
+            start, end = (_NO_TIME, _NO_TIME) if start_time is None else (_minutes_since_midnight(start_time), _minutes_since_midnight(meeting.end_time))
+            days = meeting.days.mask if kind in (_RECURRING, _RECURRING_SEATED) else 0
+            date = meeting.date.toordinal() if kind == _ONE_SHOT else 0
+            location = getattr(meeting, 'location', None)
+            room = _NONE
+            if isinstance(location, _Location):
+                building = buildings(location.building)
+                room = strings(location.room_number)
+            elif isinstance(location, _UnknownLocation):
+                building = _UNKNOWN_LOCATION
+            elif isinstance(location, _LocationTBA):
+                building = _LOCATION_TBA
+            else:
+                building = _NO_LOCATION
+            if kind in (_SEATED, _RECURRING_SEATED):
+                seated = (meeting.section_id, meeting.available_seats, meeting.total_seats, string(meeting._bookstore_url))
+            else:
+                seated = (0, 0.0, 0.0, _NONE)
+            meeting_records.append(_MEETING.pack(kind, strings(type_code), start, end, days, date, building, room, string(meeting.section_number), instructor(getattr(meeting, 'instructor', None)), *seated))
+    building_records = [_BUILDING.pack(strings(building.code), string(building.name), string(building.area)) for building in buildings.values]
+    instructor_records = [_INSTRUCTOR.pack(strings(instr.last_name), strings(instr.first_name), string(instr.email)) for instr in instructors.values]
+
+    encoded = [_to_bytes(value) for value in strings.values]
+    lengths = _array('I', [len(value) for value in encoded])
+    if _sys.byteorder != 'little':
+        lengths.byteswap()
+    parts = [_COUNTS.pack(len(encoded), len(building_records), len(instructor_records), len(course_records), len(restriction_records), len(meeting_records)), lengths.tostring()]
+    parts.extend(encoded)
+    for records in (building_records, instructor_records, course_records, restriction_records, meeting_records):
+        parts.extend(records)
+    body = "".join(parts)
+    flags = 0
+    if compress:
+        body = _compress(body)
+        flags |= FLAG_ZLIB
+    return _HEADER.pack(MAGIC, FORMAT_VERSION, flags) + body
+
+def _unpack_all(record_struct, body, offset, count):
+    unpack_from = record_struct.unpack_from
+    size = record_struct.size
+    records = [unpack_from(body, offset + i * size) for i in xrange(count)]
+    return records, offset + count * size
+
+def loads(snapshot):
+    """Restores course instances from a snapshot made by :func:`dumps`.
+
+    Buildings are restored from the snapshot itself, one :class:`Building` per building in it, without consulting or changing
+    the building code registry (see :meth:`Building.for_code`), so loading works offline. Since buildings are equal by building code,
+    restored locations are equal to the live ones they were saved from.
+    Variable units are restored as :data:`util.NaN`, like the parser gives them.
+    Instructors are restored as the canonical objects (see :meth:`Instructor.for_name`).
+
+    :param snapshot: the snapshot
+    :type snapshot: string
+    :rtype: list of :class:`CourseInstance`-s
+    :raises: :exc:`ValueError` if *snapshot* isn't a snapshot or is of an unsupported format version
+    """
+    if len(snapshot) < _HEADER.size:
+        raise ValueError, "Truncated snapshot"
+    magic, version, flags = _HEADER.unpack_from(snapshot)
+    if magic != MAGIC:
+        raise ValueError, "Not a TritonScraper snapshot"
+    if version != FORMAT_VERSION:
+        raise ValueError, "Unsupported snapshot format version: %s" % version
+    body = buffer(snapshot, _HEADER.size)
+    if flags & FLAG_ZLIB:
+        body = _decompress(body)
+    num_strings, num_buildings, num_instructors, num_courses, num_restrictions, num_meetings = _COUNTS.unpack_from(body)
+    offset = _COUNTS.size
+
+    lengths = _array('I')
+    lengths.fromstring(body[offset:offset + num_strings * lengths.itemsize])
+    if _sys.byteorder != 'little':
+        lengths.byteswap()
+    offset += num_strings * lengths.itemsize
+    strings = []
+    for length in lengths:
+        strings.append(_from_bytes(body[offset:offset + length]))
+        offset += length
+    def string(index):
+        return None if index == _NONE else strings[index]
+
+    building_records, offset = _unpack_all(_BUILDING, body, offset, num_buildings)
+    buildings = [_Building(strings[code], string(name), string(area)) for code, name, area in building_records]
+    instructor_records, offset = _unpack_all(_INSTRUCTOR, body, offset, num_instructors)
+    instructors = [_Instructor.for_name(strings[last], strings[first], string(email)) for last, first, email in instructor_records]
+    tba = _InstructorTBA()
+    def instructor(index):
+        if index == _NONE:
+            return None
+        if index == _TBA:
+            return tba
+        return instructors[index]
+
+    course_records, offset = _unpack_all(_COURSE, body, offset, num_courses)
+    restriction_records, offset = _unpack_all(_RESTRICTION, body, offset, num_restrictions)
+    meeting_records, offset = _unpack_all(_MEETING, body, offset, num_meetings)
+
+    minutes2time = {}
+    def time_of_day(minutes):
+        try:
+            return minutes2time[minutes]
+        except KeyError:
+            time = minutes2time[minutes] = _time(*divmod(minutes, 60))
+            return time
+    ordinal2date = {}
+    locations = {}
+    unknown_location = _UnknownLocation()
+    location_tba = _LocationTBA()
+    final_code = _config.FINAL_CODE
+
+    course_instances = []
+    next_restriction = 0
+    next_meeting = 0
+    for subject, number, name, units, prereqs_url, course_instructor, restriction_count, meeting_count in course_records:
+        if units != units: # NaN
+            units = _NaN
+        course_inst = _CourseInstance(strings[subject], strings[number], string(name), units, prerequisites_url=string(prereqs_url))
+        course_inst.restrictions = set(strings[index] for (index,) in restriction_records[next_restriction:next_restriction + restriction_count])
+        next_restriction += restriction_count
+        for kind, type_code, start, end, days, date, building, room, section_number, meeting_instructor, section_id, available, total, bookstore_url in meeting_records[next_meeting:next_meeting + meeting_count]:
+            if building == _NO_LOCATION:
+                location = None
+            elif building == _UNKNOWN_LOCATION:
+                location = unknown_location
+            elif building == _LOCATION_TBA:
+                location = location_tba
+            else:
+                try:
+                    location = locations[building, room]
+                except KeyError:
+                    location = locations[building, room] = object.__new__(_Location)
+                    location.building = buildings[building]
+                    location.room_number = strings[room]
+            meeting = object.__new__(_KIND2CLASS[kind])
+            if start != _NO_TIME:
+                meeting.start_time = time_of_day(start)
+                meeting.end_time = time_of_day(end)
+            if location is not None:
+                meeting.location = location
+            meeting.section_number = string(section_number)
+            if kind == _ONE_SHOT:
+                try:
+                    meeting.date = ordinal2date[date]
+                except KeyError:
+                    meeting.date = ordinal2date[date] = _date.fromordinal(date)
+            else:
+                meeting.instructor = instructor(meeting_instructor)
+                if kind != _SEATED:
+                    meeting.days = _DaysOfWeekSet.from_mask(days)
+                if kind != _RECURRING:
+                    meeting.section_id = section_id
+                    meeting.available_seats = _seats(available)
+                    meeting.total_seats = _seats(total)
+                    meeting._bookstore_url = string(bookstore_url)
+            type_code = strings[type_code]
+            if type_code == final_code:
+                course_inst.final = meeting
+            else:
+                course_inst._code2meeting_list.setdefault(type_code, []).append(meeting)
+        next_meeting += meeting_count
+        course_inst.instructor = instructor(course_instructor)
+        course_instances.append(course_inst)
+    return course_instances
+
+def save(course_instances, filepath, compress=True):
+    """Saves course instances to the file *filepath* as a snapshot. See :func:`dumps`.
+
+    :type filepath: string
+    """
+    with open(filepath, 'wb') as f:
+        f.write(dumps(course_instances, compress))
+
+def load(filepath):
+    """Loads course instances from the snapshot file *filepath*. See :func:`loads`.
+
+    :type filepath: string
+    :rtype: list of :class:`CourseInstance`-s
+    """
+    with open(filepath, 'rb') as f:
+        return loads(f.read())
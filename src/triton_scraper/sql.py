@@ -19,7 +19,8 @@
 # THE SOFTWARE.
 
 """
-This module dumps :class:`CourseAndProfessorEvaluation` data into `SQLite <http://www.sqlite.org/>`_ databases using :mod:`sqlite3`.
+This module dumps :class:`CourseAndProfessorEvaluation` data into `SQLite <http://www.sqlite.org/>`_ databases using :mod:`sqlite3`,
+and incrementally syncs such databases with CAPE's website.
 
 :copyright: (c) 2010 by Christopher Rebert.
 :license: MIT, see :file:`LICENSE.txt` for more details.
@@ -28,18 +29,20 @@ This module dumps :class:`CourseAndProfessorEvaluation` data into `SQLite <http:
 from sqlite3 import connect as _sqlite_connect
 from contextlib import closing as _closing
 
+from triton_scraper import config as _config
 import triton_scraper.cape as _cape
+from triton_scraper.util import LOGGER as _LOGGER
 
 #: SQLite type name for integers
-_INT = "INTEGER"
+INT = "INTEGER"
 #: SQLite type for strings
-_STR = "TEXT"
+STR = "TEXT"
 #: SQLite declaration part for a primary key
-_PRIMARY_KEY = "PRIMARY KEY"
+PRIMARY_KEY = "PRIMARY KEY"
 #: Name of Section ID columns in SQLite database tables
 SECTION_ID_COL = "section_id"
 
-def _create_statement_for(table_name, columns):
+def create_statement_for(table_name, columns):
     """
     :param table_name: name of table to create; does not get escaped, so don't use untrusted user input
     :type table_name: string
@@ -58,30 +61,30 @@ def foreign_key(datatype, foreign_table, foreign_column):
 CAPE_TABLE_NAME = "Cape"
 #: List of (column name, SQLite type name) tuples for main CAPE SQLite table
 CAPE_TABLE_COLUMNS = [
-    (SECTION_ID_COL, _INT+" "+_PRIMARY_KEY),#FIXME: add this
-    ("department_code", _STR),
-    ("term_code", _STR),
-    ("subject_code", _STR),#FIXME: split course_code
-    ("course_number", _STR),
-    ("instructor", _STR),
-    ("enrollment", _INT),
-    ("respondents", _INT)] + [
-    (level_name, _INT) for level_name in _cape.ClassLevels._fields] + [
-    (reason_name, _INT) for reason_name in _cape.ReasonsForTaking._fields] + [
-    (grade, _INT) for grade in _cape.ExpectedGrades._fields] + [
-    (hours, _INT) for hours in _cape.StudyHours._fields] + [
-    (attendance_category, _INT) for attendance_category in _cape.Attendance._fields] + [
-    ("%s_%s" % (recommendee, recommendation), _INT) for recommendation in ("no", "yes") for recommendee in ("course", "instructor")]
+    (SECTION_ID_COL, INT+" "+PRIMARY_KEY),#FIXME: add this
+    ("department_code", STR),
+    ("term_code", STR),
+    ("subject_code", STR),#FIXME: split course_code
+    ("course_number", STR),
+    ("instructor", STR),
+    ("enrollment", INT),
+    ("respondents", INT)] + [
+    (level_name, INT) for level_name in _cape.ClassLevels._fields] + [
+    (reason_name, INT) for reason_name in _cape.ReasonsForTaking._fields] + [
+    (grade, INT) for grade in _cape.ExpectedGrades._fields] + [
+    (hours, INT) for hours in _cape.StudyHours._fields] + [
+    (attendance_category, INT) for attendance_category in _cape.Attendance._fields] + [
+    ("%s_%s" % (recommendee, recommendation), INT) for recommendation in ("no", "yes") for recommendee in ("course", "instructor")]
 
 #: SQLite CREATE TABLE statement for main CAPE SQLite table
-CREATE_CAPE_TABLE_STMT = _create_statement_for(CAPE_TABLE_NAME, CAPE_TABLE_COLUMNS)
+CREATE_CAPE_TABLE_STMT = create_statement_for(CAPE_TABLE_NAME, CAPE_TABLE_COLUMNS)
 
 #: Name of subsidiary level-of-agreement question answers SQLite table
 AGREEMENT_TABLE_NAME = "Agreement"
 #: List of (column name, SQLite type name) tuples for the level-of-agreement question answers SQLite table
-AGREEMENT_TABLE_COLUMNS = [(SECTION_ID_COL, foreign_key(_INT, CAPE_TABLE_NAME, SECTION_ID_COL)), ("question", _STR)] + [(level_name, _INT) for level_name in _cape.AgreementLevels._fields]
+AGREEMENT_TABLE_COLUMNS = [(SECTION_ID_COL, foreign_key(INT, CAPE_TABLE_NAME, SECTION_ID_COL)), ("question", STR)] + [(level_name, INT) for level_name in _cape.AgreementLevels._fields]
 #: SQLite CREATE TABLE statement for level-of-agreement question answers SQLite table
-CREATE_AGREEMENT_TABLE_STMT = _create_statement_for(AGREEMENT_TABLE_NAME, AGREEMENT_TABLE_COLUMNS)
+CREATE_AGREEMENT_TABLE_STMT = create_statement_for(AGREEMENT_TABLE_NAME, AGREEMENT_TABLE_COLUMNS)
 
 def create_cape_tables(sqlite_conn):
     """Create SQL tables in the *sqlite_conn* database to store CAPE data. The tables will be named :const:`AGREEMENT_TABLE_NAME` and :const:`CAPE_TABLE_NAME`.
@@ -92,69 +95,283 @@ def create_cape_tables(sqlite_conn):
     sqlite_conn.execute(CREATE_CAPE_TABLE_STMT)
     sqlite_conn.execute(CREATE_AGREEMENT_TABLE_STMT)
 
-def _positional_insert(sqlite_conn, table_name, values):
-    """Insert *values* into the table *table_name* of the database *sqlite_conn*.
-    
-    :param sqlite_conn: database whose table is to be written to
-    :type sqlite_conn: :class:`sqlite3.Connection` or :class:`sqlite3.Cursor`
-    :param table_name: name of the table to insert values into; does not get escaped, so don't use untrusted user input
+def insert_statement_for(table_name, columns):
+    """
+    :param table_name: name of table to insert into; does not get escaped, so don't use untrusted user input
     :type table_name: string
-    :param values: row of values to insert into the given table
-    :type values: sequence
+    :param columns: (column name, SQLite type) pairs of the table
+    :type columns: list of 2-tuples of strings
+    :rtype: string
+    :returns: SQLite INSERT statement with one positional parameter per column
     """
-    insert_stmt = "INSERT INTO %s VALUES (%s)" % (table_name, ",".join("?" for i in range(len(values))))
-    sqlite_conn.execute(insert_stmt, values)
+    return "INSERT INTO %s VALUES (%s)" % (table_name, ",".join("?" for column in columns))
+
+#: SQLite INSERT statement for the main CAPE SQLite table
+INSERT_CAPE_STMT = insert_statement_for(CAPE_TABLE_NAME, CAPE_TABLE_COLUMNS)
+#: SQLite INSERT statement for the level-of-agreement question answers SQLite table
+INSERT_AGREEMENT_STMT = insert_statement_for(AGREEMENT_TABLE_NAME, AGREEMENT_TABLE_COLUMNS)
 
-def _dump_just_cape_itself(cape, sqlite_conn):
-    """Inserts the data from the *cape* into database *sqlite_conn*.
-    Does not add the data from :attr:`CourseAndProfessorEvaluation.agreement_questions`.
+def _cape_row(cape):
+    """Row of the main CAPE table for *cape*. Does not include the data from :attr:`CourseAndProfessorEvaluation.agreement_questions`.
     
-    :param cape: the CAPE whose data is to be inserted
     :type cape: :class:`CourseAndProfessorEvaluation`
-    :param sqlite_conn: the database to write to
-    :type sqlite_conn: :class:`sqlite3.Connection` or :class:`sqlite3.Cursor`
+    :rtype: list
     """
-    plain = list(cape[:8])
-    flattened = sum(map(list, cape[8:-1]), [])
-    cape_values = plain + flattened
-    _positional_insert(sqlite_conn, CAPE_TABLE_NAME, cape_values)
-
-def _dump_agreement_levels(section_id, question, agreement_levels, sqlite_conn):
-    """Inserts agreement level response data *agreement_levels* for the question *question* regarding the Course Instance with Section ID *section_id* into the database *sqlite_conn*.
-    
-    :param section_id: Section ID of the Course Instance 
-    :type section_id: int
-    :param question: CAPE level-of-agreement survey question that the response data *agreement_levels* is for
-    :type question: string
-    :param agreement_levels: agreement level response data to insert
-    :type agreement_levels: :class:`AgreementLevels`
-    :param sqlite_conn: the database to write to
-    :type sqlite_conn: :class:`sqlite3.Connection` or :class:`sqlite3.Cursor`
+    row = list(cape[:8])
+    for counts in cape[8:-1]:
+        row.extend(counts)
+    return row
+
+def _agreement_rows(cape):
+    """Rows of the level-of-agreement question answers table for *cape*, one per question.
+    
+    :type cape: :class:`CourseAndProfessorEvaluation`
+    :rtype: generator of lists
     """
-    _positional_insert(sqlite_conn, AGREEMENT_TABLE_NAME, [section_id, question] + list(agreement_levels))
+    for question, agreement_levels in cape.agreement_questions:
+        yield [cape.section_id, question] + list(agreement_levels)
 
 def dump_into_db(cape, sqlite_conn):
-    """Write the data in *cape* to the database *sqlite_conn*.
+    """Write the data in *cape* to the database *sqlite_conn*, in its own transaction.
+    To write many CAPEs, use a :class:`CapeWriter` instead.
     
     :param cape: the CAPE whose data is to be written
     :type cape: :class:`CourseAndProfessorEvaluation`
     :param sqlite_conn: the database to write to
-    :type sqlite_conn: :class:`sqlite3.Connection` or :class:`sqlite3.Cursor`
+    :type sqlite_conn: :class:`sqlite3.Connection`
     """
     with sqlite_conn:
-        _dump_just_cape_itself(cape, sqlite_conn)
-        for question, agree_levels in cape.agreement_questions:
-            _dump_agreement_levels(cape.section_id, question, agree_levels, sqlite_conn)
+        sqlite_conn.execute(INSERT_CAPE_STMT, _cape_row(cape))
+        sqlite_conn.executemany(INSERT_AGREEMENT_STMT, _agreement_rows(cape))
+
+#: Valid values of the *journal_mode* argument of :func:`configure`
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+#: Valid values of the *synchronous* argument of :func:`configure`
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+def _pragma_value(value, valid_values, pragma):
+    upper = value.upper()
+    if upper not in valid_values:
+        raise ValueError, "Invalid SQLite %s %s; expected one of %s" % (pragma, repr(value), ", ".join(valid_values))
+    return upper
+
+def configure(sqlite_conn, journal_mode=None, synchronous=None):
+    """Sets pragmas of the database *sqlite_conn* which trade durability for write speed.
+    'WAL' journaling (SQLite 3.7+) lets readers keep reading during a bulk load, and 'NORMAL' or 'OFF' synchronous levels skip some or all fsync()-s.
+    
+    :param journal_mode: one of :const:`JOURNAL_MODES`; None leaves it as-is
+    :type journal_mode: string or None
+    :param synchronous: one of :const:`SYNCHRONOUS_LEVELS`; None leaves it as-is
+    :type synchronous: string or None
+    :raises: :exc:`ValueError` for an invalid pragma value
+    """
+    if journal_mode is not None:
+        journal_mode = _pragma_value(journal_mode, JOURNAL_MODES, "journal mode")
+        sqlite_conn.execute("PRAGMA journal_mode = %s" % journal_mode).fetchall()
+    if synchronous is not None:
+        synchronous = _pragma_value(synchronous, SYNCHRONOUS_LEVELS, "synchronous level")
+        sqlite_conn.execute("PRAGMA synchronous = %s" % synchronous)
+
+class BatchWriter(object):
+    """Writes records into an SQLite database in batches, using one :meth:`sqlite3.Connection.executemany` call per table and one transaction per batch.
+    Which INSERT statements records need, and the rows of each record, are given by the writer's creator.
+    Rows are buffered until :attr:`batch_size` records have been written, or until :meth:`flush`; closing the writer (e.g. at the end of a ``with`` block) flushes it.
+    Statements are built once, so :mod:`sqlite3`'s statement cache only has to prepare each one once per connection."""
+    def __init__(self, sqlite_conn, statements, rows_for, batch_size=_config.SQLITE_BATCH_SIZE):
+        """
+        :param sqlite_conn: the database to write to
+        :type sqlite_conn: :class:`sqlite3.Connection`
+        :param statements: INSERT statements rows are written with, in the order their rows are flushed (referenced tables first)
+        :type statements: sequence of strings
+        :param rows_for: gives the (INSERT statement, row) pairs which store a record; each statement must be one of *statements*
+        :type rows_for: callable taking a record and returning an iterable of (string, sequence) pairs
+        :param batch_size: number of records per transaction
+        :type batch_size: int
+        """
+        self._conn = sqlite_conn
+        self._statements = tuple(statements)
+        self._rows_for = rows_for
+        #: Number of records per transaction
+        #:
+        #: :type: int
+        self.batch_size = batch_size
+        #: Number of records written and committed so far
+        #:
+        #: :type: int
+        self.written = 0
+        self._pending = 0
+        self._stmt2rows = dict((stmt, []) for stmt in self._statements)
+    
+    @property
+    def pending(self):
+        """Number of records buffered but not yet committed.
+        
+        :type: int
+        """
+        return self._pending
+    
+    def write(self, record):
+        """Buffers *record*, writing out the current batch if it's full."""
+        for stmt, row in self._rows_for(record):
+            self._stmt2rows[stmt].append(row)
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
+    
+    def write_all(self, records):
+        """Writes records as they're produced, then flushes.
+        
+        :type records: iterable
+        :returns: number of records written
+        :rtype: int
+        """
+        count = 0
+        for record in records:
+            self.write(record)
+            count += 1
+        self.flush()
+        return count
+    
+    def flush(self):
+        """Writes and commits all buffered records in one transaction.
+        If that fails, the transaction is rolled back, the buffered records are discarded (which gets logged), and the error is reraised."""
+        if not self._pending:
+            return
+        try:
+            with self._conn:
+                for stmt in self._statements:
+                    rows = self._stmt2rows[stmt]
+                    if rows:
+                        self._conn.executemany(stmt, rows)
+        except Exception as exc:
+            _LOGGER.error("Discarding batch of %d records which couldn't be written: %s", self._pending, exc)
+            raise
+        finally:
+            for rows in self._stmt2rows.itervalues():
+                del rows[:]
+            pending, self._pending = self._pending, 0
+        self.written += pending
+    
+    def close(self):
+        """Flushes the writer. Does not close its database connection."""
+        self.flush()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        # Still keep the records written before the error, but don't let a failure to do so hide the error itself
+        try:
+            self.close()
+        except Exception:
+            _LOGGER.exception("Couldn't flush batch writer after error: %s", exc_value)
+
+def _cape_rows(cape):
+    """(INSERT statement, row) pairs which store *cape*."""
+    yield INSERT_CAPE_STMT, _cape_row(cape)
+    for row in _agreement_rows(cape):
+        yield INSERT_AGREEMENT_STMT, row
+
+class CapeWriter(BatchWriter):
+    """Batched writer of :class:`CourseAndProfessorEvaluation`-s into tables created by :func:`create_cape_tables`."""
+    def __init__(self, sqlite_conn, batch_size=_config.SQLITE_BATCH_SIZE):
+        """
+        :param sqlite_conn: the database to write to
+        :type sqlite_conn: :class:`sqlite3.Connection`
+        :param batch_size: number of CAPEs per transaction
+        :type batch_size: int
+        """
+        BatchWriter.__init__(self, sqlite_conn, (INSERT_CAPE_STMT, INSERT_AGREEMENT_STMT), _cape_rows, batch_size)
 
-def dump_into_file(capes, filepath):
+def dump_into_file(capes, filepath, batch_size=_config.SQLITE_BATCH_SIZE, journal_mode=None, synchronous=None):
     """Serialize *capes* into the file *filepath* as an `SQLite <http://www.sqlite.org/>`_ database (see :mod:`sqlite3`).
+    CAPEs are written in batches as they're produced (see :class:`CapeWriter`), so *capes* can be a generator such as :func:`cape.crawl_capes`.
+    CAPEs with the Section ID of one already written (e.g. because several departments list it) are skipped.
     
-    :param capes: the CAPE to serialize
-    :type capes: list of :class:`CourseAndProfessorEvaluation`
+    :param capes: the CAPEs to serialize
+    :type capes: iterable of :class:`CourseAndProfessorEvaluation`-s
     :param filepath: path to file to write SQLite data to
     :type filepath: string
+    :param batch_size: number of CAPEs per transaction
+    :type batch_size: int
+    :param journal_mode: see :func:`configure`
+    :type journal_mode: string or None
+    :param synchronous: see :func:`configure`
+    :type synchronous: string or None
+    :returns: number of CAPEs written
+    :rtype: int
     """
     with _closing(_sqlite_connect(filepath)) as conn:
+        configure(conn, journal_mode, synchronous)
         create_cape_tables(conn)
-        for cape in capes:
-            dump_into_db(cape, conn)
+        written_section_ids = set()
+        with CapeWriter(conn, batch_size) as writer:
+            for cape in capes:
+                if cape.section_id in written_section_ids:
+                    continue
+                writer.write(cape)
+                written_section_ids.add(cape.section_id)
+        return writer.written
+
+def has_table(sqlite_conn, table_name):
+    """Does the database *sqlite_conn* have a table named *table_name*?
+    
+    :type sqlite_conn: :class:`sqlite3.Connection` or :class:`sqlite3.Cursor`
+    :type table_name: string
+    :rtype: bool
+    """
+    return sqlite_conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)).fetchone() is not None
+
+def stored_section_ids(sqlite_conn):
+    """Section IDs (including stand-ins; see :func:`cape.cape_key`) of the CAPEs already in the database *sqlite_conn*.
+    
+    :param sqlite_conn: database to look in
+    :type sqlite_conn: :class:`sqlite3.Connection` or :class:`sqlite3.Cursor`
+    :returns: the Section IDs; empty if the database has no CAPE tables yet
+    :rtype: set of ints
+    """
+    if not has_table(sqlite_conn, CAPE_TABLE_NAME):
+        return set()
+    return set(row[0] for row in sqlite_conn.execute("SELECT %s FROM %s" % (SECTION_ID_COL, CAPE_TABLE_NAME)))
+
+def sync_capes_into_db(sqlite_conn, department_form_vals=None, num_workers=_config.FETCH_WORKERS, max_requests_per_second=_config.MAX_REQUESTS_PER_SECOND):
+    """Adds the CAPEs which aren't in the database *sqlite_conn* yet, creating its CAPE tables if needed.
+    CAPE results never change once published, so only detail pages whose Section ID isn't already in the :const:`CAPE_TABLE_NAME` table get fetched
+    (see :func:`cape.crawl_capes`). CAPEs whose detail page URL doesn't include a Section ID are stored under a stand-in one derived from
+    the URL (see :func:`cape.cape_key`), so they aren't fetched again either.
+    
+    :param sqlite_conn: the database to update
+    :type sqlite_conn: :class:`sqlite3.Connection`
+    :param department_form_vals: :attr:`Department.form_value`-s of the departments to sync; defaults to all of them
+    :type department_form_vals: iterable of strings
+    :param num_workers: number of concurrent fetches per pool
+    :type num_workers: int
+    :param max_requests_per_second: overall request rate limit; None or 0 for no limit
+    :type max_requests_per_second: float or None
+    :returns: number of CAPEs added
+    :rtype: int
+    """
+    if not has_table(sqlite_conn, CAPE_TABLE_NAME):
+        create_cape_tables(sqlite_conn)
+    known_section_ids = stored_section_ids(sqlite_conn)
+    with CapeWriter(sqlite_conn) as writer:
+        for cape in _cape.crawl_capes(department_form_vals, num_workers, max_requests_per_second, known_section_ids=known_section_ids):
+            if cape.section_id in known_section_ids: # listed by more than one department
+                continue
+            writer.write(cape)
+            known_section_ids.add(cape.section_id)
+    return writer.written
+
+def sync_capes_into_file(filepath, department_form_vals=None, num_workers=_config.FETCH_WORKERS, max_requests_per_second=_config.MAX_REQUESTS_PER_SECOND):
+    """Like :func:`sync_capes_into_db`, but for the `SQLite <http://www.sqlite.org/>`_ database in the file *filepath*, which is created if it doesn't exist.
+    
+    :param filepath: path to the SQLite database file
+    :type filepath: string
+    :returns: number of CAPEs added
+    :rtype: int
+    """
+    with _closing(_sqlite_connect(filepath)) as conn:
+        return sync_capes_into_db(conn, department_form_vals, num_workers, max_requests_per_second)
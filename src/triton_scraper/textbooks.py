@@ -0,0 +1,231 @@
+# Copyright (c) 2010 Christopher Rebert <code@rebertia.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module indexes a term's textbooks by ISBN, across the :class:`BookList`-s of all its sections.
+
+:copyright: (c) 2010 by Christopher Rebert.
+:license: MIT, see :file:`LICENSE.txt` for more details.
+"""
+
+from collections import namedtuple as _namedtuple
+from copy import copy as _copy
+from decimal import Decimal as _Decimal
+
+from triton_scraper.meetings import SeatedMeeting as _SeatedMeeting
+from triton_scraper.bookstore import normalize_bookstore_url as _normalize_bookstore_url
+
+#: Cost of a course's required books (see :meth:`IsbnIndex.required_cost`).
+#:
+#: cheapest
+#:     Total, buying each book used if possible and new otherwise
+#: new
+#:     Total, buying each book new; books only available used are priced used
+#: unpriced
+#:     Number of required books available neither new nor used, which are left out of the totals
+CourseCost = _namedtuple('CourseCost', "cheapest new unpriced")
+
+_ZERO = _Decimal(0)
+_NO_COST = CourseCost(_ZERO, _ZERO, 0)
+_SectionBooks = _namedtuple('_SectionBooks', "meeting course_instance required optional")
+
+def _price(price):
+    return None if price.is_nan() else price
+
+def cheapest_copy(book):
+    """The lower of a book's used and new prices, ignoring unavailable kinds of copies.
+
+    :type book: :class:`Book`
+    :rtype: :class:`decimal.Decimal` or None if neither kind of copy is available
+    """
+    prices = [price for price in (_price(book.used_price), _price(book.new_price)) if price is not None]
+    return min(prices) if prices else None
+
+def _count(counts, key, delta):
+    count = counts.get(key, 0) + delta
+    if count:
+        counts[key] = count
+    else:
+        del counts[key]
+
+class IsbnIndex(object):
+    """ISBN-keyed index of the books on a term's booklists.
+
+    Each ISBN has a single canonical :class:`Book`, which gets the latest prices seen for it.
+    Canonical books are the index's own copies, so the :class:`BookList`-s (which may be cached and shared) are never modified.
+    Sections are tracked by section ID, so re-adding a section with a refreshed booklist replaces its old one,
+    and totals of affected courses are updated."""
+    def __init__(self):
+        self._isbn2book = {}
+        self._section_id2books = {}
+        self._isbn2section_ids = {}
+        self._isbn2course_counts = {} # ISBN -> {course instance -> number of its sections using the ISBN}
+        self._course2required_counts = {} # course instance -> {ISBN -> number of its sections requiring the ISBN}
+        self._course2cost = {}
+
+    def _canonical(self, book):
+        canonical = self._isbn2book.get(book.isbn)
+        if canonical is None:
+            canonical = self._isbn2book[book.isbn] = _copy(book)
+        else:
+            canonical.title = book.title or canonical.title
+            canonical.author = book.author or canonical.author
+            # via _price(), so that an unavailable (NaN) price counts as the same as another one
+            changed = (_price(canonical.new_price), _price(canonical.used_price)) != (_price(book.new_price), _price(book.used_price))
+            canonical.new_price = book.new_price
+            canonical.used_price = book.used_price
+            if changed:
+                for course_inst in self._isbn2course_counts.get(book.isbn, ()):
+                    self._recompute_cost(course_inst)
+        return canonical
+
+    def _recompute_cost(self, course_inst):
+        required = self._course2required_counts.get(course_inst)
+        if not required:
+            self._course2cost.pop(course_inst, None)
+            return
+        cheapest = new = _ZERO
+        unpriced = 0
+        for isbn in required:
+            book = self._isbn2book[isbn]
+            lowest = cheapest_copy(book)
+            if lowest is None:
+                unpriced += 1
+                continue
+            cheapest += lowest
+            new_price = _price(book.new_price)
+            new += new_price if new_price is not None else lowest
+        self._course2cost[course_inst] = CourseCost(cheapest, new, unpriced)
+
+    def _adjust(self, entry, delta):
+        course_inst = entry.course_instance
+        section_id = entry.meeting.section_id
+        for isbns, required in ((entry.required, True), (entry.optional, False)):
+            for isbn in isbns:
+                section_ids = self._isbn2section_ids.setdefault(isbn, set())
+                if delta > 0:
+                    section_ids.add(section_id)
+                else:
+                    section_ids.discard(section_id)
+                    if not section_ids:
+                        del self._isbn2section_ids[isbn]
+                _count(self._isbn2course_counts.setdefault(isbn, {}), course_inst, delta)
+                if not self._isbn2course_counts[isbn]:
+                    del self._isbn2course_counts[isbn]
+                if required:
+                    _count(self._course2required_counts.setdefault(course_inst, {}), isbn, delta)
+        if not self._course2required_counts.get(course_inst, True):
+            del self._course2required_counts[course_inst]
+        self._recompute_cost(course_inst)
+
+    def add_section(self, meeting, course_inst, booklist):
+        """Indexes the booklist of a section, replacing any booklist previously indexed for it.
+
+        :param meeting: the section
+        :type meeting: :class:`SeatedMeeting`
+        :param course_inst: the course instance the section belongs to
+        :type course_inst: :class:`CourseInstance`
+        :type booklist: :class:`BookList`
+        """
+        self.remove_section(meeting.section_id)
+        if booklist.unknown:
+            return
+        # A book listed as both required and optional counts as required
+        required = tuple(sorted(set(self._canonical(book).isbn for book in booklist.required)))
+        optional = tuple(sorted(set(self._canonical(book).isbn for book in booklist.optional) - set(required)))
+        entry = self._section_id2books[meeting.section_id] = _SectionBooks(meeting, course_inst, required, optional)
+        self._adjust(entry, 1)
+
+    def remove_section(self, section_id):
+        """Removes the booklist of the section with the given section ID from the index, if it's indexed.
+
+        :type section_id: int
+        """
+        entry = self._section_id2books.pop(section_id, None)
+        if entry is not None:
+            self._adjust(entry, -1)
+
+    def add_term(self, course_instances, url2booklist):
+        """Indexes the booklists of every seated meeting of the given course instances.
+
+        :type course_instances: iterable of :class:`CourseInstance`-s
+        :param url2booklist: booklist for each normalized Bookstore URL, as returned by :func:`bookstore.prefetch_booklists`; sections whose URL is missing are skipped
+        :type url2booklist: dict of strings to :class:`BookList`-s
+        """
+        for course_inst in course_instances:
+            for meeting_list in course_inst._code2meeting_list.itervalues():
+                for meeting in meeting_list:
+                    if not isinstance(meeting, _SeatedMeeting) or meeting._bookstore_url is None:
+                        continue
+                    booklist = url2booklist.get(_normalize_bookstore_url(meeting._bookstore_url))
+                    if booklist is not None:
+                        self.add_section(meeting, course_inst, booklist)
+
+    ### Queries
+    def __len__(self):
+        """Number of distinct ISBNs indexed."""
+        return len(self._isbn2section_ids)
+
+    @property
+    def isbns(self):
+        """ISBNs on at least one indexed booklist.
+
+        :type: list of strings
+        """
+        return list(self._isbn2section_ids)
+
+    def book(self, isbn):
+        """The canonical book with the given ISBN.
+
+        :rtype: :class:`Book`
+        :raises: :exc:`KeyError` if no indexed booklist has the ISBN
+        """
+        if isbn not in self._isbn2section_ids:
+            raise KeyError, "No indexed booklist has ISBN %s" % repr(isbn)
+        return self._isbn2book[isbn]
+
+    def sections_using(self, isbn):
+        """Sections whose booklists include the given ISBN.
+
+        :rtype: list of :class:`SeatedMeeting`-s
+        """
+        return [self._section_id2books[section_id].meeting for section_id in self._isbn2section_ids.get(isbn, ())]
+
+    def courses_using(self, isbn):
+        """Course instances with at least one section whose booklist includes the given ISBN.
+
+        :rtype: list of :class:`CourseInstance`-s
+        """
+        return list(self._isbn2course_counts.get(isbn, ()))
+
+    def required_cost(self, course_inst):
+        """Cost of the books required by any section of *course_inst*, each distinct ISBN counted once.
+
+        :type course_inst: :class:`CourseInstance`
+        :rtype: :class:`CourseCost`
+        """
+        return self._course2cost.get(course_inst, _NO_COST)
+
+    def most_expensive_courses(self, count=10):
+        """The *count* course instances with the highest :attr:`CourseCost.cheapest` cost, most expensive first.
+
+        :rtype: list of (:class:`CourseInstance`, :class:`CourseCost`) pairs
+        """
+        return sorted(self._course2cost.iteritems(), key=lambda pair: pair[1].cheapest, reverse=True)[:count]
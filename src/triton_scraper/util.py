@@ -44,6 +44,31 @@ RELATIVE_PREFIX = "descendant-or-self::node()"
 # TritonScraper's logger
 LOGGER = _getLogger(_LOGGER_NAME)
 
+#: Number of minutes in a day
+MINUTES_PER_DAY = 24 * 60
+
+def minutes_since_midnight(time_of_day):
+    """Converts a :class:`datetime.time` into the number of whole minutes since midnight; e.g. 1:30 AM -> 90"""
+    return time_of_day.hour * 60 + time_of_day.minute
+
+class SlotPickling(object):
+    """Mixin which lets instances of classes with :attr:`__slots__` (and no per-instance :attr:`__dict__`) be pickled
+    with any pickle protocol, including Python 2's default protocol 0. Slots which were never set stay unset."""
+    __slots__ = ()
+    
+    def __getstate__(self):
+        state = {}
+        for klass in type(self).__mro__:
+            slots = getattr(klass, '__slots__', ())
+            for name in ((slots,) if isinstance(slots, basestring) else slots):
+                if name not in state and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return state
+    
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+
 # From the itertools cookbook: http://docs.python.org/library/itertools.html#recipes
 def grouper(n, iterable, fillvalue=None):
     "grouper(3, 'ABCDEFG', 'x') --> ABC DEF Gxx"